@@ -0,0 +1,34 @@
+""" Time to build a string a piece at a time, by `s="$s$x"` and by `s+=$x`.
+
+    python bench/append.py [pieces]
+
+`s="$s$x"` copies everything so far on each step, so it grows with the square
+of the count; `s+=$x` keeps the pieces, and joins them once when `$s` is read.
+"""
+import io
+import sys
+import time
+
+from psh.parser import parse
+from psh.local import make_env
+
+SCRIPTS = (
+    ("s=\"$s$x\"", "s=; x=0123456789; for ((i = 0; i < {n}; i++)); do s=\"$s$x\"; done; echo \"$s\""),
+    ("s+=$x", "s=; x=0123456789; for ((i = 0; i < {n}; i++)); do s+=$x; done; echo \"$s\""),
+)
+
+
+def main():
+    for n in (int(sys.argv[1]),) if len(sys.argv) > 1 else (10000, 20000, 80000):
+        for name, script in SCRIPTS:
+            tree = parse(script.format(n=n))
+            start = time.perf_counter()
+            out = io.BytesIO()
+            tree.execute(make_env(), output=out)
+            t = time.perf_counter() - start
+            assert len(out.getvalue()) == n * 10 + 1
+            print("{:10} x {:7} {:8.3f}s {:8.3f}us per piece".format(name, n, t, t * 1e6 / n))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,69 @@
+""" Time for hot arithmetic: single expressions, and counting loops in the shell.
+
+    python bench/arith.py [iterations]
+
+"walk" evaluates the expression tree node by node with floats, as `$((...))`
+used to; "compiled" calls the expression, which runs its compiled function.
+"""
+import io
+import sys
+import time
+
+from psh.model import ArithNumber, ArithVariable
+from psh.parser import expr, parse
+from psh.local import make_env
+
+EXPRESSIONS = (
+    "i + 1",
+    "(i * 3 + j - i / 2) * 2",
+    "(1 + 2) * (3 + 4) * i - 60 / 3",
+)
+
+
+def walk(node, env):
+    if isinstance(node, ArithNumber):
+        return float(node.value)
+    if isinstance(node, ArithVariable):
+        return float(env.get(node.name))
+    left, right = walk(node.left, env), walk(node.right, env)
+    return {"+": left.__add__, "-": left.__sub__, "*": left.__mul__, "/": left.__truediv__}[node.op](right)
+
+
+def timed(fn, n):
+    start = time.perf_counter()
+    for _ in range(n):
+        fn()
+    return (time.perf_counter() - start) / n
+
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    env = make_env()
+    env.update({"i": "12345", "j": "7"})
+    print("{:36} {:>10} {:>10}".format("expression", "walk", "compiled"))
+    for text in EXPRESSIONS:
+        e = expr.parse(text)
+        print("{:36} {:8.3f}us {:8.3f}us".format(
+            text, timed(lambda: walk(e, env), n) * 1e6, timed(lambda: e(env), n) * 1e6))
+
+    loop = n // 10
+    script = parse("i=0\nfor j in {}; do i=$((i + j * 2)); done\necho $i".format(" ".join(["1"] * loop)))
+    env = make_env()
+    start = time.perf_counter()
+    script.execute(env, output=io.BytesIO())
+    t = time.perf_counter() - start
+    print("for loop, {} iterations of i=$((i + j * 2)): {:.3f}s, {:.2f}us each; i={}".format(
+        loop, t, t * 1e6 / loop, env["i"]))
+
+    loop = n * 10
+    script = parse("s=0; for ((i = 0; i < {}; i++)); do ((s += i)); done".format(loop))
+    env = make_env()
+    start = time.perf_counter()
+    script.execute(env, output=io.BytesIO())
+    t = time.perf_counter() - start
+    print("for ((;;)) loop, {} iterations of ((s += i)): {:.3f}s, {:.2f}us each; s={}".format(
+        loop, t, t * 1e6 / loop, env["s"]))
+
+
+if __name__ == '__main__':
+    main()
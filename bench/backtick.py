@@ -0,0 +1,49 @@
+""" Parse time for nested backquotes, as the nesting depth and the innermost command grow.
+
+    python bench/backtick.py [engine]
+
+Each level of nesting escapes the level inside it, so the source grows with
+depth even for a fixed command; the last column is the time per character of
+source, which should stay flat down both columns.
+"""
+import sys
+import time
+
+from psh.parser import parse
+from psh.cache import PARSE_CACHE
+
+
+def escape(text):
+    return text.replace("\\", "\\\\").replace("`", "\\`").replace("$", "\\$")
+
+
+def nested(words, depth):
+    text = "echo " + " ".join("w{}".format(i) for i in range(words))
+    for _ in range(depth):
+        text = "echo `" + escape(text) + "`"
+    return text
+
+
+def timed(text, engine, repeat=3):
+    best = None
+    for _ in range(repeat):
+        PARSE_CACHE.clear()
+        start = time.perf_counter()
+        parse(text, engine=engine)
+        t = time.perf_counter() - start
+        best = t if best is None else min(best, t)
+    return best
+
+
+def main():
+    engine = sys.argv[1] if len(sys.argv) > 1 else "fast"
+    print("{:>6} {:>6} {:>8} {:>10} {:>10}".format("depth", "words", "chars", "time", "us/char"))
+    for words in (100, 1000, 10000):
+        for depth in (1, 2, 4, 8, 12, 16):
+            text = nested(words, depth)
+            t = timed(text, engine)
+            print("{:6d} {:6d} {:8d} {:9.4f}s {:10.3f}".format(depth, words, len(text), t, t * 1e6 / len(text)))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,47 @@
+""" Time for `for` over a brace range, against the literal list of words it stands for.
+
+    python bench/braces.py [count]
+
+Times include parsing; memory is the peak while the script runs. "first"
+breaks out of the loop on its first iteration.
+"""
+import io
+import sys
+import time
+import tracemalloc
+
+from psh.parser import parse
+from psh.local import make_env
+
+
+def run(text):
+    parse(text).execute(make_env(), output=io.BytesIO())
+
+
+def timed(text):
+    start = time.perf_counter()
+    run(text)
+    t = time.perf_counter() - start
+    # Tracing slows everything down, so memory is measured on a second run.
+    tracemalloc.start()
+    run(text)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return t, peak
+
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    scripts = (
+        ("literal list", "for i in {}; do :; done".format(" ".join(str(i) for i in range(1, n + 1)))),
+        ("{1..N}", "for i in {{1..{}}}; do :; done".format(n)),
+        ("x{a..j}{1..N/10}", "for i in x{{a..j}}{{1..{}}}; do :; done".format(n // 10)),
+        ("first of {1..10^12}", "for i in {1..1000000000000}; do break; done"),
+    )
+    for name, text in scripts:
+        t, peak = timed(text)
+        print("{:20} {:8.3f}s {:10.1f}kB".format(name, t, peak / 1e3))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,40 @@
+""" Time for shell function calls, and how deep tail calls can go.
+
+    python bench/calls.py [calls]
+
+A function whose last command calls another function makes that call in its
+own frame, so "countdown" recurses in constant stack space; before, it ran
+out of Python stack at a few hundred levels.
+"""
+import io
+import sys
+import time
+
+from psh.parser import parse
+from psh.local import make_env
+
+SCRIPTS = (
+    ("call", "f() { :; }; for ((i = 0; i < {n}; i++)); do f a b; done"),
+    ("chain of three", "a() { b x; }; b() { c y; }; c() { :; }; for ((i = 0; i < {n}; i++)); do a; done"),
+    ("call with a local", "f() { local x=$1; :; }; for ((i = 0; i < {n}; i++)); do f a; done"),
+    ("countdown", "n={n}; f() { if ((n > 0)); then ((n--)); f $n; fi; }; f"),
+)
+
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    for name, script in SCRIPTS:
+        tree = parse(script.replace("{n}", str(n)))
+        env = make_env()
+        start = time.perf_counter()
+        try:
+            tree.execute(env, output=io.BytesIO())
+        except RecursionError:
+            print("{:20} RecursionError".format(name))
+            continue
+        t = time.perf_counter() - start
+        print("{:20} {:8.3f}us per call".format(name, t * 1e6 / n))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,72 @@
+""" Time and memory to capture a large command output, and to write it back out.
+
+    python bench/capture.py [megabytes]
+
+The script `x=$(cat file); echo "$x"` is run in a fresh process, once with
+everything kept in memory and once spilling to a file past SPILL_SIZE, as it
+does by default. Memory is the process's peak resident size.
+
+Then "old" is how `$(...)` used to turn its output into text: decoding all of
+it, then copying the text to strip the trailing newlines. "new" leaves them
+out of what it decodes.
+"""
+import io
+import subprocess
+import sys
+import tempfile
+import time
+
+from psh.text import Capture
+
+RUN = """
+import os, resource, sys, time
+import psh.text
+from psh.parser import parse
+from psh.local import make_env
+psh.text.SPILL_SIZE = int(sys.argv[2])
+script = parse('x=$(cat {}); echo "$x"'.format(sys.argv[1]))
+with open(os.devnull, "wb") as null:
+    start = time.perf_counter()
+    script.execute(make_env(), output=null)
+print(time.perf_counter() - start, resource.getrusage(resource.RUSAGE_SELF).ru_maxrss)
+"""
+
+
+def best(fn, repeat=5):
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+
+def captured(data):
+    capture = Capture(limit=len(data))
+    capture.write(data)
+    return capture.value()
+
+
+def main():
+    mb = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    line = "0123456789abcdef caf\xe9 €\n".encode("utf-8")
+    chunk = line * ((1 << 20) // len(line))
+
+    # The file is written, and the script run, before this process grows: a child starts out with its parent's
+    # peak memory.
+    with tempfile.NamedTemporaryFile() as f:
+        for _ in range(mb):
+            f.write(chunk)
+        f.flush()
+        for name, limit in (("in memory", 1 << 62), ("spilled", 1 << 24)):
+            t, rss = subprocess.check_output([sys.executable, "-c", RUN, f.name, str(limit)]).split()
+            print("x=$(cat) and echo of {}MB, {:10} {:7.3f}s {:8.1f}MB".format(mb, name, float(t), int(rss) / 1024))
+
+    data = chunk * mb
+    out = io.BytesIO(data)
+    print("decoding {}MB: old {:.1f}ms, new {:.1f}ms".format(
+        mb, best(lambda: out.getvalue().decode("utf-8").rstrip("\n"), 3) * 1e3, best(lambda: captured(data), 3) * 1e3))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,91 @@
+""" Time for loop-heavy scripts made of builtins, walking the tree against running its compiled closures.
+
+    python bench/compile.py [iterations]
+
+"walk" runs each node by looking at it afresh every time round, as `execute`
+used to: expanding every word, looking the command up and setting up the
+redirect context. "compiled" runs the closures the tree is compiled to.
+"""
+import io
+import sys
+import time
+
+from psh.glob import expand
+from psh.model import (Assignment, Break, CommandSequence, Command, While, If, For, ArithCommand, Redirect,
+                       compiled)
+from psh.parser import parse
+from psh.local import make_env
+
+SCRIPTS = (
+    ("for, constant builtin", "for i in {words}; do :; done"),
+    ("for, builtin with arguments", "for i in {words}; do echo a $i b; done"),
+    ("while, arithmetic", "i=0; while ((i < {n})); do ((i++)); done"),
+    ("for, if/else", "for i in {words}; do if ((i % 2)); then echo odd; else :; fi; done"),
+)
+
+
+def walk(node, env, output):
+    if isinstance(node, CommandSequence):
+        r = 0
+        for item in node:
+            r = walk(item, env, output)
+        return r
+    if isinstance(node, Command):
+        Assignment.run(env, node.assignments)
+        if len(node) == 0:
+            return None
+        args = [arg for word in node for arg in expand(env, word, '.')]
+        with Redirect.activate(env, node):
+            res = env.builtins[args[0]](*args[1:], env=env, stdin=None, stdout=output, stderr=None)
+        env['?'] = str(res)
+        return res
+    if isinstance(node, ArithCommand):
+        with Redirect.activate(env, node):
+            res = 0 if node.expr(env) else 1
+        env['?'] = str(res)
+        return res
+    if isinstance(node, While):
+        with Redirect.activate(env, node):
+            while walk(node.condition, env, output) == 0:
+                walk(node.body, env, output)
+        return 0
+    if isinstance(node, If):
+        with Redirect.activate(env, node):
+            for cond, body in node:
+                if cond is If.OTHERWISE or walk(cond, env, output) == 0:
+                    return walk(body, env, output)
+        return 0
+    if isinstance(node, For):
+        res = 0
+        with Redirect.activate(env, node):
+            var = node.var.evaluate(env)
+            for word in [word.evaluate(env) for word in node.words]:
+                env[var] = word
+                try:
+                    res = walk(node.body, env, output)
+                except Break:
+                    return 0
+        return res
+    raise TypeError(node)
+
+
+def timed(run, cmd):
+    env = make_env()
+    start = time.perf_counter()
+    run(cmd, env, io.BytesIO())
+    return time.perf_counter() - start
+
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    words = " ".join(str(i) for i in range(n))
+    print("{:30} {:>10} {:>10} {:>8}".format("script", "walk", "compiled", "speedup"))
+    for name, script in SCRIPTS:
+        cmd = parse(script.format(n=n, words=words))
+        w = timed(walk, cmd)
+        c = timed(lambda cmd, env, output: compiled(cmd)(env, None, output, None), cmd)
+        print("{:30} {:8.3f}us {:8.3f}us {:7.1f}x".format(name, w * 1e6 / n, c * 1e6 / n, w / c))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,43 @@
+""" Time to build the arguments of commands with ever more of them.
+
+    python bench/expand.py [counts...]
+
+"split" is one unquoted `$x` that splits into that many fields; "words" is
+that many separate words, each a variable. Both should cost the same per
+argument, however many there are. "sum" is the `sum(lists, [])` that the
+fields used to be joined up with, for comparison.
+"""
+import sys
+import time
+
+from psh.model import evaluate
+from psh.parser import command
+from psh.local import make_env
+
+
+def timed(fn):
+    start = time.perf_counter()
+    fn()
+    return time.perf_counter() - start
+
+
+def main():
+    counts = [int(n) for n in sys.argv[1:]] or [1000, 10000, 100000]
+    print("{:>8} {:>12} {:>12} {:>12}".format("args", "split", "words", "sum"))
+    for n in counts:
+        env = make_env()
+        env["x"] = " ".join(str(i) for i in range(n))
+        split = command.parse("args $x")
+        words = command.parse("args" + " $x" * n)
+        env_words = make_env()
+        env_words["x"] = "1"
+        lists = [[str(i)] for i in range(n)]
+        print("{:>8} {:10.3f}us {:10.3f}us {:10.3f}us".format(
+            n,
+            timed(lambda: evaluate(env, split)) * 1e6 / n,
+            timed(lambda: evaluate(env_words, words)) * 1e6 / n,
+            timed(lambda: sum(lists, [])) * 1e6 / n))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,61 @@
+""" Time to the first iteration of a `for` over a large glob or command substitution, and memory held.
+
+    python bench/forwords.py [directories]
+
+"list" expands all of the words before the loop starts, as `for` used to;
+"stream" is the loop as it runs now, taking each word as it's produced.
+"""
+import io
+import itertools
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+from psh.parser import parse
+from psh.local import make_env
+from psh.model import expansions
+
+
+def first(text, lazy):
+    loop = parse(text)[0]
+    env = make_env()
+    tracemalloc.start()
+    start = time.perf_counter()
+    words = expansions(env, loop.words)
+    if not lazy:
+        words = iter(list(words))
+    next(words)
+    t = time.perf_counter() - start
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    if lazy:
+        words.close()
+    return t, peak
+
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    with tempfile.TemporaryDirectory() as d:
+        for i, j in itertools.product(range(n), range(50)):
+            os.makedirs(os.path.join(d, "d{}".format(i), "e{}".format(j)))
+        os.chdir(d)
+        scripts = (
+            ("for f in **", "for f in **; do :; done"),
+            ("for x in $(...)", "for x in $(i=0; while ((i < {})); do echo $i; ((i++)); done); do :; done".format(
+                n * 50)),
+        )
+        print("{:20} {:>10} {:>10} {:>10} {:>10}".format("", "list", "", "stream", ""))
+        for name, text in scripts:
+            (t0, m0), (t1, m1) = first(text, False), first(text, True)
+            print("{:20} {:8.1f}ms {:8.1f}kB {:8.1f}ms {:8.1f}kB".format(
+                name, t0 * 1e3, m0 / 1e3, t1 * 1e3, m1 / 1e3))
+        loop = parse("for f in **; do echo $f; done")
+        start = time.perf_counter()
+        loop.execute(make_env(), output=io.BytesIO())
+        print("whole loop over {} paths: {:.3f}s".format(n * 51, time.perf_counter() - start))
+
+
+if __name__ == '__main__':
+    main()
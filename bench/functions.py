@@ -0,0 +1,63 @@
+""" Time to load a library of functions, against reading it, and against parsing every body up front.
+
+    python bench/functions.py [functions]
+"""
+import sys
+import tempfile
+import time
+
+from psh.parser import parse
+from psh.cache import PARSE_CACHE
+
+FUNCTION = """\
+f{n}() {{
+    local x="$1" y=${{2%%.sh}}
+    if test -f "$x"; then
+        cat "$x" | grep '}}' >/dev/null 2>&1
+    fi
+    for i in a b c d; do
+        echo {n} "$i-$x" $(basename $y)
+    done
+    cat <<EOF
+{{ $x }}
+EOF
+}}
+
+"""
+
+
+def timed(fn, repeat=3):
+    best = None
+    for _ in range(repeat):
+        PARSE_CACHE.clear()
+        start = time.perf_counter()
+        fn()
+        t = time.perf_counter() - start
+        best = t if best is None else min(best, t)
+    return best
+
+
+def eager(text, engine):
+    for f in parse(text, engine=engine):
+        f.body
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+    text = "".join(FUNCTION.format(n=n) for n in range(count))
+    with tempfile.NamedTemporaryFile("w") as f:
+        f.write(text)
+        f.flush()
+
+        def read():
+            with open(f.name) as g:
+                g.read()
+        print("{:>8} {:>10} {:>10}".format("engine", "", "time"))
+        print("{:>8} {:>10} {:9.4f}s".format("", "read", timed(read)))
+        for engine in ("fast", "parsy"):
+            print("{:>8} {:>10} {:9.4f}s".format(engine, "lazy", timed(lambda: parse(text, engine=engine))))
+            print("{:>8} {:>10} {:9.4f}s".format(engine, "eager", timed(lambda: eager(text, engine))))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,40 @@
+""" Parse time and peak memory for scripts carrying large heredocs.
+
+    python bench/heredoc.py [megabytes]
+"""
+import sys
+import time
+import tracemalloc
+
+from psh.parser import parse
+
+LINE = "MIIDdzCCAl+gAwIBAgIEAgAAuTANBgkqhkiG9w0BAQUFADBaMQswCQYDVQQGEwJJ\n"
+
+
+def script(size, quote):
+    body = LINE * max(1, size // len(LINE))
+    return "cat <<{q}EOF{q} >/tmp/cert.pem\n{body}EOF\n".format(q=quote, body=body)
+
+
+def measure(text, engine):
+    tracemalloc.start()
+    start = time.perf_counter()
+    parse(text, engine=engine)
+    t = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return t, peak
+
+
+def main():
+    size = int(float(sys.argv[1]) * (1 << 20)) if len(sys.argv) > 1 else 4 << 20
+    for quote, kind in (("'", "quoted"), ("", "unquoted")):
+        text = script(size, quote)
+        for engine in ("parsy", "fast"):
+            t, peak = measure(text, engine)
+            print("{:8} {:6} {:8.1f}MB source {:8.3f}s {:8.1f}MB peak".format(
+                kind, engine, len(text) / (1 << 20), t, peak / (1 << 20)))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,44 @@
+""" Time for arithmetic loops over ordinary variables and over ones declared with `declare -i`.
+
+    python bench/integers.py [iterations]
+
+An ordinary variable is text: each expression reads it as a number and each
+assignment writes it back as text. An integer variable holds its int.
+"""
+import io
+import sys
+import time
+
+from psh.parser import parse
+from psh.local import make_env
+
+LOOPS = (
+    ("count", "for ((i = 0; i < {n}; i++)); do :; done"),
+    ("sum", "s=0; for ((i = 0; i < {n}; i++)); do ((s += i * i)); done; echo $s"),
+    ("hash", "h=7; for ((i = 0; i < {n}; i++)); do ((h = (h * 31 + i) % 1000000007)); done; echo $h"),
+)
+
+
+def timed(script, repeat=5):
+    """ The best time of a few runs, and the output """
+    tree = parse(script)
+    times = []
+    for _ in range(repeat):
+        out = io.BytesIO()
+        start = time.perf_counter()
+        tree.execute(make_env(), output=out)
+        times.append(time.perf_counter() - start)
+    return min(times), out.getvalue()
+
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    for name, loop in LOOPS:
+        loop = loop.replace("{n}", str(n))
+        (t0, out0), (t1, out1) = timed(loop), timed("declare -i i s h; " + loop)
+        assert out0 == out1
+        print("{:10} text {:8.3f}us  declare -i {:8.3f}us per iteration".format(name, t0 * 1e6 / n, t1 * 1e6 / n))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,35 @@
+""" Time for loops that leave their bodies early: `continue`, `break` and `return` on every iteration.
+
+    python bench/loops.py [iterations]
+"""
+import io
+import sys
+import time
+
+from psh.parser import parse
+from psh.local import make_env
+
+SCRIPTS = (
+    ("for, continue", "for i in {words}; do continue; echo no; done"),
+    ("while, continue", "i=0; while ((i < {n})); do ((i++)); continue; echo no; done"),
+    ("for ((;;)), continue 2", "for i in {words}; do for ((j = 0; ; j++)); do continue 2; done; done"),
+    ("for, break inner loop", "for i in {words}; do while :; do break; done; done"),
+    ("for, return from function", "f() {{ for j in a b; do return 3; done; }}; for i in {words}; do f; done"),
+    ("for, no early exit", "for i in {words}; do :; done"),
+)
+
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    words = " ".join(str(i) for i in range(n))
+    for name, script in SCRIPTS:
+        cmd = parse(script.format(n=n, words=words))
+        env = make_env()
+        start = time.perf_counter()
+        cmd.execute(env, output=io.BytesIO())
+        t = time.perf_counter() - start
+        print("{:28} {:8.3f}us per iteration".format(name, t * 1e6 / n))
+
+
+if __name__ == '__main__':
+    main()
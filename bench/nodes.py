@@ -0,0 +1,49 @@
+""" Memory held by a large parsed script, and the cost of comparing and hashing its subtrees.
+
+    python bench/nodes.py [lines]
+
+The script is parsed from text that's discarded afterwards, so the figure
+is what the tree itself keeps alive.
+"""
+import sys
+import time
+import tracemalloc
+
+from psh.fastparse import parse
+
+from stream import STANZA
+
+
+def timed(fn, n=5):
+    start = time.perf_counter()
+    for _ in range(n):
+        fn()
+    return (time.perf_counter() - start) / n
+
+
+def main():
+    lines = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    count = max(1, lines // STANZA.count("\n"))
+    # Make each stanza's text distinct, so that nothing is shared through the source string.
+    texts = [STANZA.replace("hello", "hello{}".format(i)) for i in range(count)]
+
+    tracemalloc.start()
+    trees = [parse(text) for text in texts]
+    size, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print("{} lines: {:.1f}MB held by the trees, {:.0f} bytes per line".format(
+        lines, size / 1e6, size / lines))
+
+    copies = [parse(text) for text in texts]
+    print("compare: {:.2f}ms".format(timed(lambda: trees == copies) * 1e3))
+    try:
+        print("hash, first time: {:.2f}ms".format(timed(lambda: [hash(t) for t in trees], 1) * 1e3))
+        print("hash, cached: {:.2f}ms".format(timed(lambda: [hash(t) for t in trees]) * 1e3))
+        table = {t: i for i, t in enumerate(trees)}
+        print("look up every subtree: {:.2f}ms".format(timed(lambda: [table[t] for t in copies]) * 1e3))
+    except TypeError as e:
+        print("hash: {}".format(e))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,56 @@
+""" Compare the parser engines on a large generated script.
+
+    python bench/parse.py [lines] [repeat]
+
+Each engine's time is the best of `repeat` parses, so that a busy machine
+skews the comparison as little as it can.
+"""
+import os
+import sys
+import time
+
+# Run as a script, this directory is on the path in place of the repository's root.
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from psh.parser import parse  # noqa: E402
+
+STANZA = """\
+if test -f /etc/hosts; then
+    cat /etc/hosts | grep localhost >/dev/null 2>&1
+else
+    echo "no hosts file for $USER" >&2
+fi
+for i in a b c d; do
+    x=${i%%.c} y=$(basename $x) echo "$x-$y" '$literal'
+done
+while read line; do echo $line; done </etc/passwd
+case $1 in start) run --now ;; *) usage ;; esac
+"""
+
+
+def script(lines):
+    per = STANZA.count("\n")
+    return STANZA * max(1, lines // per)
+
+
+def timed(text, engine, repeat):
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        parse(text, engine=engine)
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+
+def main():
+    lines = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    repeat = int(sys.argv[2]) if len(sys.argv) > 2 else 5
+    text = script(lines)
+    times = {engine: timed(text, engine, repeat) for engine in ("parsy", "fast")}
+    for engine, t in times.items():
+        print("{:6} {:6d} lines {:8.3f}s {:10.0f} lines/s".format(engine, text.count("\n"), t, text.count("\n") / t))
+    print("speedup {:.1f}x".format(times["parsy"] / times["fast"]))
+
+
+if __name__ == '__main__':
+    main()
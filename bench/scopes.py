@@ -0,0 +1,71 @@
+""" Time to read a global and to set $?, at ever greater call depths.
+
+    python bench/scopes.py [depths...]
+
+"chain" is the old Env, which looked each name up through every frame out
+to the global one; "stacks" is the current Env, with a stack of bindings
+for each name.
+"""
+import sys
+import time
+
+from psh.builtin import Env
+
+
+class Chain:
+    def __init__(self, variables=None, parent=None):
+        self.variables = {} if variables is None else variables
+        self.parent = parent
+
+    def __getitem__(self, key):
+        if key in self.variables:
+            return self.variables[key]
+        return self.parent[key]
+
+    def __setitem__(self, key, value):
+        if self.parent is None or key in self.variables:
+            self.variables[key] = value
+        else:
+            self.parent[key] = value
+
+
+def chain(depth):
+    env = Chain({"x": "1", "?": "0"})
+    for i in range(depth):
+        env = Chain({"1": str(i), "#": "1"}, env)
+    return env
+
+
+def stacks(depth):
+    env = Env()
+    env["x"] = "1"
+    for i in range(depth):
+        env = Env(parent=env, positional=(str(i),))
+    return env
+
+
+def timed(fn, n=100000):
+    start = time.perf_counter()
+    for _ in range(n):
+        fn()
+    return (time.perf_counter() - start) / n
+
+
+def main():
+    depths = [int(n) for n in sys.argv[1:]] or [1, 10, 100, 500]
+    print("{:>6} {:>12} {:>12} {:>12} {:>12}".format("depth", "chain x", "stacks x", "chain $?=", "stacks $?="))
+    for depth in depths:
+        c, s = chain(depth), stacks(depth)
+
+        def set_chain():
+            c["?"] = "0"
+
+        def set_stacks():
+            s["?"] = "0"
+        print("{:>6} {:10.3f}us {:10.3f}us {:10.3f}us {:10.3f}us".format(
+            depth, timed(lambda: c["x"]) * 1e6, timed(lambda: s["x"]) * 1e6,
+            timed(set_chain) * 1e6, timed(set_stacks) * 1e6))
+
+
+if __name__ == '__main__':
+    main()
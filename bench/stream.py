@@ -0,0 +1,68 @@
+""" Time to the first command, and peak memory, when streaming ever larger scripts.
+
+    python bench/stream.py [lines...]
+"""
+import sys
+import tempfile
+import time
+import tracemalloc
+
+from psh.fastparse import parse
+from psh.stream import Source, statements
+
+STANZA = """\
+if test -f /etc/hosts; then
+    cat /etc/hosts | grep localhost >/dev/null 2>&1
+fi
+cat <<EOF
+hello $USER
+EOF
+for i in a b c d; do
+    x=${i%%.c} y=$(basename $x) echo "$x-$y" '$literal'
+done
+"""
+
+
+def measure(f):
+    """ Return the time to the first command, the total time and the peak memory, streaming `f` """
+    tracemalloc.start()
+    start = time.perf_counter()
+    cmds = statements(Source(f))
+    next(cmds)
+    first = time.perf_counter() - start
+    for _ in cmds:
+        pass
+    total = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return first, total, peak
+
+
+def measure_whole(text):
+    tracemalloc.start()
+    start = time.perf_counter()
+    parse(text)
+    total = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return total, peak
+
+
+def main():
+    sizes = [int(a) for a in sys.argv[1:]] or [1000, 10000, 100000]
+    per = STANZA.count("\n")
+    print("{:>8} {:>10} {:>10} {:>10} | {:>10} {:>10}".format(
+        "lines", "first", "stream", "peak", "whole", "peak"))
+    for lines in sizes:
+        text = STANZA * max(1, lines // per)
+        with tempfile.TemporaryFile() as f:
+            f.write(text.encode("utf-8"))
+            f.seek(0)
+            first, total, peak = measure(f)
+        whole, whole_peak = measure_whole(text)
+        print("{:8d} {:9.4f}s {:9.3f}s {:8.0f}kB | {:9.3f}s {:8.0f}kB".format(
+            text.count("\n"), first, total, peak / 1024, whole, whole_peak / 1024))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,49 @@
+""" Time to check the REPL buffer after a keystroke, with a large block pasted into it.
+
+    python bench/validate.py [lines]
+
+Compares parsing the whole buffer again with the incremental Checker, for a
+keystroke at the end of the buffer and for one in the middle of it.
+"""
+import sys
+import time
+
+from psh.fastparse import parse
+from psh.parser import ParseError
+from psh.validate import Checker
+
+from stream import STANZA
+
+
+def keystrokes(text, at, count=50):
+    """ The buffer's text after each of `count` keystrokes typed at `at` """
+    return [text[:at] + "echo x;"[:i % 7] + text[at:] for i in range(count)]
+
+
+def full(text):
+    try:
+        parse(text)
+    except ParseError:
+        pass
+
+
+def timed(check, texts):
+    """ The mean time `check` takes over `texts`, once it's seen the first of them """
+    check(texts[0])
+    start = time.perf_counter()
+    for text in texts:
+        check(text)
+    return (time.perf_counter() - start) / len(texts)
+
+
+def main():
+    lines = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+    text = STANZA * max(1, lines // STANZA.count("\n"))
+    print("{:>8} {:>12} {:>12}".format("at", "full", "incremental"))
+    for name, at in (("end", len(text)), ("middle", text.index("\nif", len(text) // 2) + 1)):
+        texts = keystrokes(text, at)
+        print("{:>8} {:10.2f}ms {:10.2f}ms".format(name, timed(full, texts) * 1e3, timed(Checker().check, texts) * 1e3))
+
+
+if __name__ == '__main__':
+    main()
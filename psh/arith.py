@@ -0,0 +1,178 @@
+""" Compilation of arithmetic expressions, from `$((...))`, `((...))` and `for ((...))`, to Python functions.
+
+An expression is translated once into the source of a single function of the
+environment, which fetches each variable it mentions once and then computes
+the result with Python's own operators; assignments update that local copy and
+write straight through to the environment. Sub-expressions that don't mention a
+variable are folded to constants first. Integers stay integers throughout, so
+counters never lose precision. Comparisons and logical operators give 1 or 0.
+"""
+import functools
+import math
+
+
+def parse_number(text):
+    """ The value of a number written in an expression """
+    return float(text) if "." in text else int(text)
+
+
+def number(value):
+    """ The numeric value of a shell variable: unset, empty or non-numeric variables count as 0 """
+    if type(value) is int:
+        # An integer variable
+        return value
+    if isinstance(value, str):
+        try:
+            return int(value)
+        except ValueError:
+            pass
+        try:
+            return float(value)
+        except ValueError:
+            return 0
+    if value is None:
+        return 0
+    if not isinstance(value, (int, float)):
+        # A Captured command output
+        return number(str(value))
+    return value
+
+
+def divide(a, b):
+    """ The quotient of integers is truncated toward zero, as in C; if either is a float, so is the quotient """
+    if isinstance(a, int) and isinstance(b, int):
+        q = abs(a) // abs(b)
+        return -q if (a < 0) != (b < 0) else q
+    return a / b
+
+
+def modulo(a, b):
+    """ The remainder takes the sign of the dividend, as in C """
+    if isinstance(a, int) and isinstance(b, int):
+        r = abs(a) % abs(b)
+        return -r if a < 0 else r
+    return math.fmod(a, b)
+
+
+def assign(env, name, value):
+    env.set_number(name, value)
+    return value
+
+
+class Compiler:
+    """ Builds the source of the function for an expression. The nodes call back into this to describe themselves.
+
+    Each method returns either a string of Python source or, for constants, the value itself.
+    """
+    # How each operator is written in the compiled source
+    OPS = {
+        "+": "({} + {})",
+        "-": "({} - {})",
+        "*": "({} * {})",
+        "/": "divide({}, {})",
+        "%": "modulo({}, {})",
+        "<": "(1 if {} < {} else 0)",
+        "<=": "(1 if {} <= {} else 0)",
+        ">": "(1 if {} > {} else 0)",
+        ">=": "(1 if {} >= {} else 0)",
+        "==": "(1 if {} == {} else 0)",
+        "!=": "(1 if {} != {} else 0)",
+        "&&": "(1 if {} and {} else 0)",
+        "||": "(1 if {} or {} else 0)",
+    }
+
+    # The values of operators, for folding constants
+    FOLD = {
+        "+": lambda a, b: a + b,
+        "-": lambda a, b: a - b,
+        "*": lambda a, b: a * b,
+        "/": divide,
+        "%": modulo,
+        "<": lambda a, b: int(a < b),
+        "<=": lambda a, b: int(a <= b),
+        ">": lambda a, b: int(a > b),
+        ">=": lambda a, b: int(a >= b),
+        "==": lambda a, b: int(a == b),
+        "!=": lambda a, b: int(a != b),
+        "&&": lambda a, b: int(bool(a and b)),
+        "||": lambda a, b: int(bool(a or b)),
+    }
+
+    UNARY = {
+        "!": ("(0 if {} else 1)", lambda a: int(not a)),
+        "-": ("(-{})", lambda a: -a),
+    }
+
+    def __init__(self):
+        self.names = {}
+
+    def variable(self, name):
+        try:
+            return self.names[name]
+        except KeyError:
+            local = self.names[name] = "v{}".format(len(self.names))
+            return local
+
+    def binary(self, op, left, right):
+        if not isinstance(left, str):
+            if op == "&&" and not left:
+                return 0
+            if op == "||" and left:
+                return 1
+            if not isinstance(right, str):
+                try:
+                    return self.constant(self.FOLD[op](left, right))
+                except ZeroDivisionError:
+                    # Leave that to fail if it's ever evaluated.
+                    pass
+        return self.OPS[op].format(self.code(left), self.code(right))
+
+    def unary(self, op, operand):
+        code, fold = self.UNARY[op]
+        if not isinstance(operand, str):
+            return self.constant(fold(operand))
+        return code.format(operand)
+
+    def assign(self, name, op, value):
+        """ Assign to a variable, or update it with `op` if that's not "=" """
+        local = self.variable(name)
+        if op != "=":
+            value = self.OPS[op[:-1]].format(local, self.code(value))
+        return "assign(env, {!r}, ({} := {}))".format(name, local, self.code(value))
+
+    def increment(self, name, op, prefix):
+        """ `++` or `--`, before or after a variable """
+        local = self.variable(name)
+        code = "assign(env, {!r}, ({} := {} {} 1))".format(name, local, local, op[0])
+        if prefix:
+            return code
+        return "({} {} 1)".format(code, "-" if op == "++" else "+")
+
+    def constant(self, value):
+        """ Fold to `value`, unless it can't be written as a literal """
+        if isinstance(value, float) and not math.isfinite(value):
+            return repr(value).join(("float('", "')"))
+        return value
+
+    @staticmethod
+    def code(value):
+        return value if isinstance(value, str) else repr(value)
+
+    def function(self, node):
+        result = self.code(node.source(self))
+        lines = ["def arith(env):"]
+        lines.extend("    {} = number(env.get({!r}))".format(local, name) for name, local in self.names.items())
+        lines.append("    return " + result)
+        return "\n".join(lines)
+
+
+@functools.lru_cache(maxsize=1024)
+def _compile(text):
+    scope = {"number": number, "divide": divide, "modulo": modulo, "assign": assign}
+    exec(compile(text, "<arith>", "exec"), scope)
+    return scope["arith"]
+
+
+def compile_arith(node):
+    """ Compile the expression tree `node` to a function from an environment to the expression's value """
+    return _compile(Compiler().function(node))
@@ -1,23 +1,134 @@
+import codecs
 import io
+import os
+import signal
+import traceback
+
+from .text import ENCODING, ERRORS, Capture
 
 
 class Comparable:
+    """ A node of the tree, compared and hashed by its public fields.
+
+    Nodes keep their fields in `__slots__` rather than a `__dict__`. Mixins
+    declare no slots of their own, so each concrete class lists the fields
+    that it and its mixins set. Slots with a leading underscore hold caches.
+    The hash is worked out once and kept, so a node mustn't change after it
+    has been hashed.
+    """
+    __slots__ = ("_hash", "_compiled")
+
+    # Slots that are rebuilt on demand rather than pickled
+    CACHES = ("_hash", "_code", "_compiled")
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        fields = []
+        for klass in reversed(cls.__mro__):
+            for name in klass.__dict__.get("__slots__", ()):
+                if not name.startswith("_") and name not in fields:
+                    fields.append(name)
+        cls._fields = tuple(fields)
+        # Any class along the way without slots gives its instances a __dict__ too.
+        cls._dynamic = any("__slots__" not in klass.__dict__ for klass in cls.__mro__[:-1])
+
+    def fields(self):
+        """ The names of this node's public fields """
+        if not self._dynamic:
+            return self._fields
+        return self._fields + tuple(k for k in self.__dict__ if not k.startswith("_"))
+
     def __eq__(self, other):
+        if self is other:
+            return True
+        if type(self) is type(other) and hasattr(self, "_hash") and hasattr(other, "_hash") and \
+                self._hash != other._hash:
+            return False
         return ((isinstance(other, type(self))
-                 and all(other.__dict__.get(k) == v
-                         for (k, v) in self.__dict__.items()
-                         if not k.startswith("_"))) or
+                 and all(getattr(other, k, None) == getattr(self, k, None) for k in self.fields())) or
                 (isinstance(self, type(other))
-                 and all(self.__dict__.get(k) == v
-                         for (k, v) in other.__dict__.items()
-                         if not k.startswith("_"))))
+                 and all(getattr(self, k, None) == getattr(other, k, None) for k in other.fields())))
+
+    def __hash__(self):
+        try:
+            return self._hash
+        except AttributeError:
+            h = self._hash = hash(tuple(hashable(getattr(self, k, None)) for k in self.fields()))
+            return h
+
+    def __getstate__(self):
+        # Caches are rebuilt when they're next needed, rather than pickled.
+        state = {}
+        for klass in type(self).__mro__:
+            for name in klass.__dict__.get("__slots__", ()):
+                if name not in self.CACHES and not name.startswith("__") and hasattr(self, name):
+                    state[name] = getattr(self, name)
+        if hasattr(self, "__dict__"):
+            state.update(self.__dict__)
+        return state
+
+    def __setstate__(self, state):
+        for k, v in state.items():
+            setattr(self, k, v)
+
+
+def hashable(value):
+    """ `value`, with any lists in it turned to tuples so that it can be hashed """
+    if isinstance(value, (list, tuple)):
+        return tuple(hashable(item) for item in value)
+    return value
 
 
 class Evaluable:
+    __slots__ = ()
+
     def evaluate(self, env, input=None, output=None, error=None):
-        out = io.BytesIO()
+        out = Capture()
         self.execute(env, input=input, output=out, error=error)
-        return out.getvalue().decode("utf-8").rstrip("\n")
+        # Like a subshell, this can't break out of loops or return from functions around it.
+        env.vars.unwind = None
+        return out.value()
+
+    def stream(self, env, input=None, error=None):
+        """ The output of `execute`, decoded, a piece at a time as it's written.
+
+        This runs in a child process, as a subshell would. The child is killed
+        if the caller stops reading before the end. If it fails, rather than
+        running to the end, that's raised here as a RuntimeError once its
+        output has been read.
+        """
+        rd, wr = os.pipe()
+        child = os.fork()
+        if child == 0:
+            os.close(rd)
+            failed = True
+            try:
+                with io.open(wr, "wb") as out:
+                    self.execute(env, input=input, output=out, error=error)
+                failed = False
+            except BaseException:
+                traceback.print_exc()
+            finally:
+                # The status of the commands isn't wanted here; only whether they could be run.
+                os._exit(1 if failed else 0)
+        os.close(wr)
+        decoder = codecs.getincrementaldecoder(ENCODING)(ERRORS)
+        finished = False
+        try:
+            while True:
+                data = os.read(rd, 65536)
+                if not data:
+                    break
+                yield decoder.decode(data)
+            yield decoder.decode(b"", final=True)
+            finished = True
+        finally:
+            os.close(rd)
+            if not finished:
+                os.kill(child, signal.SIGTERM)
+            _, status = os.waitpid(child, 0)
+        if status != 0:
+            raise RuntimeError("{!r} failed in a child process".format(self))
 
     def execute(self,  env, input=None, output=None, error=None):
         raise NotImplementedError()
@@ -1,31 +1,206 @@
+from parsy import ParseError
+
+from .parser import expr
+from .text import join
+
+
+class ShellError(Exception):
+    """ An error in a script, to be reported as a shell would: with a message, not a traceback """
+
+
+class Variables:
+    """ The variables of a shell, shared by all of its call frames.
+
+    Each name maps to a stack of its bindings, the innermost last, so a
+    variable is read or written in the same time however deep the calls go.
+    The status of the last command, `$?`, has a slot of its own.
+
+    `break`, `continue` and `return` don't raise exceptions. They note what
+    they want in `unwind`, with the number of loops to leave in `levels` (or,
+    for `return`, the status to return). Everything that runs commands in turn
+    stops when it sees `unwind` set; loops and function calls act on it.
+    `loops` and `calls` count the loops and function calls that are running.
+    A function's last command leaves a call to another function in `call`,
+    with `unwind` set to say so, for the function to make in its own frame.
+
+    A variable that's been appended to with `+=` holds a Builder until it's
+    next read. A variable declared with `declare -i` holds an int: whatever
+    it's set to is made an integer, and it's only turned into text when it's
+    expanded in a word.
+    """
+    def __init__(self):
+        self.bindings = {}
+        self.status = "0"
+        self.unwind = None
+        self.call = None
+        self.levels = 0
+        self.loops = 0
+        self.calls = 0
+
+
+class Builder:
+    """ The pieces of a value built up with `+=`, joined once when the value is read """
+    __slots__ = ("pieces",)
+
+    def __init__(self, *pieces):
+        self.pieces = list(pieces)
+
+
+def integer(env, value):
+    """ The value an integer variable takes when it's set to `value`. Text is evaluated as an arithmetic expression,
+    so `x=n+1` adds; a float is truncated. """
+    if type(value) is int:
+        return value
+    if isinstance(value, float):
+        return int(value)
+    if value is None:
+        return 0
+    text = str(value).strip()
+    try:
+        return int(text)
+    except ValueError:
+        pass
+    if not text:
+        return 0
+    try:
+        node = expr.parse(text)
+    except ParseError:
+        raise ShellError("{}: syntax error in expression".format(text)) from None
+    return integer(env, node(env))
+
+
 class Env:
-    def __init__(self, variables=None, parent=None, *args, **kwargs):
+    """ A call frame: the variables, positional parameters, builtins and functions that commands run with.
+
+    A frame made with a `parent` binds its `variables` over the parent's until
+    it's closed. Frames must be closed in the reverse order they were made in;
+    using each one as a context manager does that. The positional parameters are
+    kept as a tuple; `$1`, `$#` and so on are only made from it when they're read.
+    """
+    __slots__ = ("parent", "names", "vars", "positional", "permit_execution", "builtins", "functions")
+
+    def __init__(self, variables=None, parent=None, *args, positional=None, **kwargs):
         super().__init__(*args, **kwargs)
-        if variables is None:
-            variables = {}
-        self.variables = variables
         self.parent = parent
-        self.permit_execution = False if parent is None else parent.permit_execution
-        self.builtins = {} if parent is None else parent.builtins
-        self.functions = {} if parent is None else parent.functions
+        self.names = []
+        if parent is None:
+            self.vars = Variables()
+            self.positional = ()
+            self.permit_execution = False
+            self.builtins = {}
+            self.functions = {}
+        else:
+            self.vars = parent.vars
+            self.positional = parent.positional
+            self.permit_execution = parent.permit_execution
+            self.builtins = parent.builtins
+            self.functions = parent.functions
+        if positional is not None:
+            self.positional = tuple(positional)
+        if variables:
+            self.update(variables)
+
+    def child(self, positional):
+        """ A frame for a function called from this one """
+        return Env(parent=self, positional=positional)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        """ Drop the bindings this frame made """
+        bindings = self.vars.bindings
+        for name in self.names:
+            stack = bindings[name]
+            stack.pop()
+            if not stack:
+                del bindings[name]
+        self.names = []
+
+    def declare(self, key, value):
+        """ Bind `key` in this frame, hiding any binding it has further out """
+        if self.parent is None or key in self.names:
+            self[key] = value
+        else:
+            self.names.append(key)
+            self.vars.bindings.setdefault(key, []).append(value)
+
+    def special(self, key):
+        """ The value of a special parameter """
+        if key == "?":
+            return self.vars.status
+        if key == "#":
+            return str(len(self.positional))
+        if key.isdigit() and key != "0":
+            try:
+                return self.positional[int(key) - 1]
+            except IndexError:
+                pass
+        raise KeyError(key)
 
     def __getitem__(self, key):
-        if key in self.variables:
-            return self.variables[key]
-        return self.parent[key]
+        try:
+            stack = self.vars.bindings[key]
+        except KeyError:
+            return self.special(key)
+        value = stack[-1]
+        if type(value) is Builder:
+            value = stack[-1] = join(value.pieces)
+        return value
 
     def __setitem__(self, key, value):
-        if self.parent is None or key in self.variables:
-            self.variables[key] = value
+        if key == "?":
+            self.vars.status = value
+        elif key == "#":
+            raise KeyError("$# is the number of positional parameters, and can't be set")
+        elif key.isdigit() and key != "0":
+            n = int(key)
+            self.positional = (self.positional + ("",) * n)[:n - 1] + (value,) + self.positional[n:]
+        else:
+            try:
+                stack = self.vars.bindings[key]
+            except KeyError:
+                self.vars.bindings[key] = [value]
+            else:
+                stack[-1] = integer(self, value) if type(stack[-1]) is int else value
+
+    def set_number(self, key, value):
+        """ Set `key` to the result of an expression: an integer variable takes the number as it is """
+        try:
+            stack = self.vars.bindings[key]
+        except KeyError:
+            self[key] = str(value)
+        else:
+            stack[-1] = integer(self, value) if type(stack[-1]) is int else str(value)
+
+    def append(self, key, value):
+        """ `key+=value`: the pieces are kept until the value's read, so appending costs the same however long the
+        value grows """
+        try:
+            stack = self.vars.bindings[key]
+        except KeyError:
+            self[key] = value
+            return
+        current = stack[-1]
+        if type(current) is Builder:
+            current.pieces.append(value)
+        elif type(current) is int:
+            stack[-1] = current + integer(self, value)
+        elif current is None:
+            # Declared by `local` with no value
+            stack[-1] = value
         else:
-            self.parent[key] = value
+            stack[-1] = Builder(current, value)
 
     def update(self, d):
-        return self.variables.update(d)
+        for k, v in d.items():
+            self.declare(k, v)
 
     def get(self, key, default=None):
-        if self.parent is None or key in self.variables:
-            return self.variables.get(key, default)
-        elif self.parent is not None:
-            return self.parent.get(key, default)
-        return default
+        try:
+            return self[key]
+        except KeyError:
+            return default
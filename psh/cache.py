@@ -0,0 +1,61 @@
+import collections
+import threading
+
+
+class ParseCache:
+    """ A bounded LRU cache of parsed command sequences, keyed on their source text and the parser that read it.
+
+    The bound is on the total length of the cached source, which tracks the size
+    of the trees well enough. Texts longer than `max_entry` are parsed but not
+    kept: those are whole scripts, which are rarely parsed twice.
+
+    Cached trees are shared between every caller that parses the same text, so
+    nothing may mutate a tree once it has been parsed.
+    """
+    def __init__(self, max_size=1 << 20, max_entry=1 << 16):
+        self.max_size = max_size
+        self.max_entry = max_entry
+        self.entries = collections.OrderedDict()
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+
+    def get(self, text, parse):
+        """ Return the tree for `text`, calling `parse(text)` on a miss. Each parser's trees are kept apart. """
+        key = parse, text
+        with self.lock:
+            try:
+                tree = self.entries[key]
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return tree
+            except KeyError:
+                self.misses += 1
+
+        tree = parse(text)
+        if len(text) > self.max_entry:
+            return tree
+
+        with self.lock:
+            if key not in self.entries:
+                self.entries[key] = tree
+                self.size += len(text)
+                while self.size > self.max_size:
+                    (_, evicted), _ = self.entries.popitem(last=False)
+                    self.size -= len(evicted)
+        return tree
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.size = 0
+            self.hits = 0
+            self.misses = 0
+
+    def stats(self):
+        return {"hits": self.hits, "misses": self.misses, "entries": len(self.entries), "size": self.size}
+
+
+# The cache shared by every parser engine.
+PARSE_CACHE = ParseCache()
@@ -1,45 +1,117 @@
+import argparse
+import concurrent.futures
 import logging
 import os
 import sys
+import time
 import traceback
 from prompt_toolkit import PromptSession
 from prompt_toolkit.key_binding import KeyBindings
-from prompt_toolkit.filters import Condition
 
-from .parser import ParseError, command_sequence
+from .text import decode
+from .parser import ParseError, parse, parse_cached
 from .local import make_env
+from .builtin import ShellError
+from . import pshc, stream, validate
 
 LOG = logging.getLogger(__name__)
 
+# Scripts larger than this are streamed rather than parsed whole.
+STREAM_SIZE = 1 << 22
 
-def main():
-    logging.basicConfig(level=logging.DEBUG)
-    kb = KeyBindings()
 
-    @Condition
-    def f():
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="psh", description="A shell implementation in python")
+    parser.add_argument("--no-cache", action="store_true",
+                        help="neither read nor write the script's compiled " + pshc.CACHE_DIR + " file")
+    parser.add_argument("--stream", action="store_true",
+                        help="parse and run the script a command at a time, rather than parsing it all first;"
+                             " this is the default for scripts over {} bytes".format(STREAM_SIZE))
+    parser.add_argument("--check", action="store_true",
+                        help="syntax-check the script, and any further scripts (or directories of *.sh files)"
+                             " named after it, rather than running it")
+    parser.add_argument("--jobs", "-j", type=int, default=None,
+                        help="with --check, the number of processes to check files in (default: one per CPU)")
+    parser.add_argument("script", nargs="?", help="run this script rather than reading commands interactively")
+    parser.add_argument("args", nargs=argparse.REMAINDER, help="the script's positional parameters")
+    args = parser.parse_args(argv)
+
+    if args.check:
+        if args.script is None:
+            parser.error("--check needs at least one script or directory")
+        return check([args.script] + args.args, jobs=args.jobs)
+    if args.script is None:
+        return repl()
+    return run_script(args.script, args.args, cache=not args.no_cache, streaming=args.stream)
+
+
+def run_script(path, args, cache=True, streaming=False):
+    logging.basicConfig(level=logging.WARNING)
+    env = make_env()
+    env["0"] = path
+    env.positional = tuple(args)
+
+    with open(path, "rb") as f, os.fdopen(sys.stdout.fileno(), "wb", closefd=False) as stdout:
         try:
-            command_sequence.parse(session.default_buffer.text)
-            return True
-        except ParseError as e:
-            return False
+            if streaming or os.fstat(f.fileno()).st_size > STREAM_SIZE:
+                return stream.run(f, env, input=sys.stdin, output=stdout, error=sys.stderr)
+
+            if cache:
+                tree = pshc.load(path)
+            else:
+                tree = parse(decode(f.read()))
+            return tree.execute(env, input=sys.stdin, output=stdout, error=sys.stderr)
+        except ShellError as e:
+            print("psh: {}: {}".format(path, e), file=sys.stderr)
+            return 1
+
+
+def check(paths, jobs=None):
+    """ Syntax-check scripts across a pool of processes, printing each error and then a summary """
+    start = time.perf_counter()
+    files = list(validate.scripts(paths))
+    jobs = jobs or os.cpu_count() or 1
+    size = failed = 0
+    with concurrent.futures.ProcessPoolExecutor(jobs) as pool:
+        # Hand the files out in batches, but small enough ones to keep every process busy to the end.
+        chunk = max(1, min(64, len(files) // (4 * jobs)))
+        for length, message in pool.map(validate.lint, files, chunksize=chunk):
+            size += length
+            if message is not None:
+                failed += 1
+                print(message)
+    t = time.perf_counter() - start
+    print("{} files, {} with errors, {:.1f}MB in {:.2f}s ({:.0f} files/s, {:.1f}MB/s)".format(
+        len(files), failed, size / (1 << 20), t, len(files) / t, size / (1 << 20) / t), file=sys.stderr)
+    return 1 if failed else 0
+
+
+def repl():
+    logging.basicConfig(level=logging.DEBUG)
+    kb = KeyBindings()
+    # The buffer is checked in the background as it's edited, so enter only has to wait if the latest edit
+    # hasn't been checked yet; and even then, only the lines from the edit onwards are parsed again.
+    checker = validate.Background()
 
     @kb.add('escape', 'enter')
     def _(event):
         session.default_buffer.insert_text('\n')
 
-    @kb.add('enter', filter=f)
+    @kb.add('enter')
     def _(event):
-        session.default_buffer.validate_and_handle()
+        if checker.check(session.default_buffer.text) is None:
+            session.default_buffer.validate_and_handle()
+        else:
+            session.default_buffer.insert_text('\n')
 
     @kb.add('escape', ' ')
     def _(event):
-        try:
-            command_sequence.parse(session.default_buffer.text)
-        except ParseError as e:
+        e = checker.check(session.default_buffer.text)
+        if e is not None:
             session.default_buffer.cursor_position = e.index
 
     session = PromptSession(key_bindings=kb, multiline=True)
+    session.default_buffer.on_text_changed += lambda buffer: checker.update(buffer.text)
     env = make_env()
 
     with os.fdopen(sys.stdout.fileno(), "wb", closefd=False) as stdout:
@@ -47,7 +119,7 @@ def main():
             while True:
                 cmd = session.prompt("> ")
                 try:
-                    parsed = command_sequence.parse(cmd)
+                    parsed = parse_cached(cmd)
                 except ParseError as e:
                     traceback.print_exc(file=sys.stderr)
                     LOG.debug("command was %r", cmd)
@@ -57,11 +129,16 @@ def main():
                                                                input=sys.stdin,
                                                                output=stdout,
                                                                error=sys.stderr)))
+                except ShellError as e:
+                    print("psh: {}".format(e), file=sys.stderr)
+                    continue
                 except Exception as e:
                     traceback.print_exc(file=sys.stderr)
                     continue
         except (EOFError, KeyboardInterrupt) as e:
             pass
+        finally:
+            checker.cancel()
 
 
 def completer(*args, **kwargs):
@@ -70,4 +147,4 @@ def completer(*args, **kwargs):
 
 
 if __name__ == '__main__':
-    main()
+    sys.exit(main())
@@ -0,0 +1,1183 @@
+""" A hand-written scanner and recursive-descent parser for the shell grammar.
+
+This is a second engine alongside the parsy grammar in psh.parser. It builds
+exactly the same psh.model trees - including that grammar's quirks - but it
+dispatches on the next character or keyword rather than trying every
+alternative in turn, and it only backtracks where the grammar genuinely needs
+to.
+
+The parsy grammar remains the reference: if the two disagree, this one is wrong.
+The one known exception is heredoc bookkeeping. Notes that parsy_extn records
+inside an abandoned alternative can outlive the backtrack; here the pending
+heredocs are part of the state that backtracking restores.
+"""
+import bisect
+import re
+
+from parsy import ParseError
+
+from .model import (ConstantString, SourceString, Token, Id, VarRef, Word, Arith, Assignment,
+                    Command, CommandSequence, CommandPipe, While, If, Case, Function,
+                    RedirectFrom, RedirectTo, RedirectDup, RedirectHere,
+                    VarOp, For, ForArith, ArithCommand, ArithNumber, ArithVariable, ArithBinary, ArithUnary,
+                    ArithAssign, ArithIncrement)
+from .glob import STAR, STARSTAR, BraceList, BraceRange, BRACE_RANGE
+from .arith import parse_number
+
+
+WS = re.compile(r'(?:[ \t]|\\\n)+')
+BLANKS = re.compile(r'[ \t]+')
+# The characters that can start a match of WS; a set excludes the empty string
+BLANK_STARTS = frozenset(" \t\\")
+# What can follow a function's name, before its "()"
+FUNCTION_FOLLOWS = BLANK_STARTS | {"("}
+# Characters that end a word wherever they appear, and those that can start a redirect
+WORD_ENDS = frozenset(" \t\n;|&()}")
+REDIRECT_STARTS = frozenset("<>0123456789")
+BACKSLASHES = re.compile(r'\\+')
+VARIABLE_ID = re.compile(r'[a-zA-Z_][a-zA-Z0-9_]*')
+VARIABLE_NAME = re.compile(r'[1-9][0-9]*|[0?!#@*]|[a-zA-Z_][a-zA-Z0-9_]*')
+WORD_ID = re.compile(r'[^\s\'()$=";|<>&\\{}`*]+')
+# The same, among the alternatives of a brace expansion
+BRACE_ID = re.compile(r'[^\s\'()$=";|<>&\\{}`*,]+')
+DIGITS = re.compile(r'[0-9]+')
+NUMBER = re.compile(r'-?[0-9]+(\.[0-9]*)?')
+DOUBLE_TEXT = re.compile(r'[^"$\\]+')
+HEREDOC_TEXT = re.compile(r'[^$\\]+')
+GROUP_SPECIAL = re.compile(r'[{}()\'"`\\$<\n]')
+DOUBLE_SPECIAL = re.compile(r'["\\$]')
+HEREDOC_TAG = re.compile(r'<<([\'"]?)([^\s\'()$=";|<>&\\{}`*]+)\1')
+
+ASSIGN_OPS = ("+=", "-=", "*=", "/=", "%=", "=")
+RESERVED = ("while", "do", "done", "if", "then", "elif", "else", "fi", "case", "esac", "for")
+BLOCK_KEYWORDS = ("while", "if", "case", "for")
+KEYWORD_STARTS = frozenset(keyword[0] for keyword in BLOCK_KEYWORDS)
+DOUBLE_ESCAPES = {"\n": "", "n": "\n", "t": "\t", "b": "\b"}
+
+# End-of-sequence marker, as returned by `eos`
+EOF = object()
+
+
+def unescaped(k, c, depth):
+    """ How many of a run of `k` backslashes before `c` are left, `depth` levels of backquotes in.
+
+    Each level halves the run. An odd one out escapes a following `$` or
+    backquote, and goes with it; before any other character it stays.
+    """
+    if c == "`" or c == "$":
+        return k >> depth
+    return (k + (1 << depth) - 1) >> depth
+
+
+def unescape(text, start, stop, depth):
+    """ `text[start:stop]` as it reads `depth` levels of backquotes in """
+    pieces = []
+    for m in BACKSLASHES.finditer(text, start, stop):
+        pieces.append(text[start:m.start()])
+        pieces.append("\\" * unescaped(m.end() - m.start(), text[m.end():m.end() + 1], depth))
+        start = m.end()
+    pieces.append(text[start:stop])
+    return "".join(pieces)
+
+
+class Fail(Exception):
+    """ Raised to abandon the current alternative. The caller restores its state. """
+
+
+class Lexer:
+    """ Position-tracking scanner over the source text.
+
+    The shell grammar is too context-sensitive to tokenise up front, so this
+    offers the token-level scans that the parser asks for at each point.
+    State is just the position plus the tuple of heredocs waiting for a body;
+    `mark` and `reset` save and restore both.
+
+    Inside backquotes, `end` is the closing backquote and `depth` counts how
+    many levels in the scan is. The text is never copied to strip a level of
+    escapes: the few scans that meet backslashes work out what a run of them
+    amounts to at the current depth.
+    """
+    def __init__(self, text):
+        self.text = text
+        self.end = len(text)
+        self.pos = 0
+        self.hds = ()
+        self.depth = 0
+        self.in_brace = False
+        self.furthest = 0
+        self.expected = set()
+        # Backquotes seen so far, from `ticks_from` on, and the backslashes before each
+        self.ticks = []
+        self.runs = []
+        self.ticks_from = self.ticks_to = 0
+
+    def mark(self):
+        return self.pos, self.hds
+
+    def reset(self, mark):
+        self.pos, self.hds = mark
+
+    def peek(self, offset=0):
+        pos = self.pos + offset
+        if pos >= self.end:
+            return ""
+        return self.text[pos:pos + 1]
+
+    def note(self, expected, pos=None):
+        """ Record a failure for error reporting, without abandoning anything """
+        if pos is None:
+            pos = self.pos
+        if pos > self.furthest:
+            self.furthest = pos
+            self.expected = {expected}
+        elif pos == self.furthest:
+            self.expected.add(expected)
+
+    def fail(self, expected):
+        self.note(expected)
+        raise Fail(expected)
+
+    def literal(self, s):
+        if self.text.startswith(s, self.pos):
+            self.pos += len(s)
+            return s
+        return None
+
+    def expect(self, s):
+        if self.literal(s) is None:
+            self.fail(s)
+        return s
+
+    def regex(self, pattern):
+        m = pattern.match(self.text, self.pos, self.end)
+        if m is None:
+            return None
+        self.pos = m.end()
+        return m.group()
+
+    def ws(self):
+        if self.depth > 0:
+            return self.ws_escaped()
+        # Most calls find no blank at all, so look at one character before running the regex.
+        if self.text[self.pos:self.pos + 1] not in BLANK_STARTS:
+            return False
+        m = WS.match(self.text, self.pos, self.end)
+        if m is not None:
+            self.pos = m.end()
+            return True
+        return False
+
+    def ws_escaped(self):
+        """ `ws`, where a line continuation may be written with more backslashes """
+        start = self.pos
+        while True:
+            self.regex(BLANKS)
+            if self.peek() == "\\":
+                k, after = self.backslashes()
+                if k == 1 and self.text.startswith("\n", after):
+                    self.pos = after + 1
+                    continue
+            return self.pos > start
+
+    def backslashes(self):
+        """ Measure the run of backslashes here. Returns how many there are at this depth, and where the run ends. """
+        m = BACKSLASHES.match(self.text, self.pos, self.end)
+        after = m.end()
+        return unescaped(after - self.pos, self.text[after:after + 1], self.depth), after
+
+    def closing_tick(self, start):
+        """ Find the backquote closing the one before `start`, as read at this depth; return its index in `ticks` """
+        if not self.ticks_from <= start <= self.ticks_to:
+            self.ticks.clear()
+            self.runs.clear()
+            self.ticks_from = self.ticks_to = start
+
+        text = self.text
+        i = bisect.bisect_left(self.ticks, start)
+        while True:
+            if i == len(self.ticks):
+                tick = text.find("`", self.ticks_to)
+                if tick < 0:
+                    self.ticks_to = len(text)
+                    return None
+                run = tick
+                while run > start and text[run - 1] == "\\":
+                    run -= 1
+                self.ticks.append(tick)
+                self.runs.append(tick - run)
+                self.ticks_to = tick + 1
+
+            if self.ticks[i] >= self.end:
+                return None
+            if (self.runs[i] >> self.depth) % 2 == 0:
+                return i
+            i += 1
+
+    def error(self):
+        return ParseError(frozenset(self.expected), self.text, self.furthest)
+
+
+class Parser(Lexer):
+    """ The recursive-descent grammar. Method names follow psh.parser.
+
+    Function bodies are left to be parsed when they're first called, unless
+    the parser is `eager`, as a syntax check must be.
+    """
+    def __init__(self, text, eager=False):
+        super().__init__(text)
+        self.eager = eager
+
+    def parse(self):
+        try:
+            result = self.command_sequence()
+        except Fail:
+            raise self.error()
+        if self.pos != self.end:
+            self.note("EOF")
+            raise self.error()
+        return result
+
+    def attempt(self, method, *args):
+        """ Run an alternative; on failure, restore the state and return None """
+        mark = self.mark()
+        try:
+            return method(*args)
+        except Fail:
+            self.reset(mark)
+            return None
+
+    # Whitespace and statement ends
+
+    def eol(self):
+        """ Consume a single newline, then the bodies of any pending heredocs. """
+        if self.literal("\n") is None:
+            self.fail("eol")
+
+        hds = self.hds
+        while len(hds) > 0:
+            hd, hds = hds[0], hds[1:]
+            if self.depth > 0:
+                body = self.heredoc_lines(hd)
+                content = heredoc_content(body, 0, len(body), hd.quote is not None)
+            else:
+                found = heredoc_end(self.text, self.pos, self.end, hd.end)
+                if found is None:
+                    self.pos = self.end
+                    self.fail("looking for heredoc ending with " + hd.end)
+                content = heredoc_content(self.text, self.pos, found[0], hd.quote is not None)
+                self.pos = found[1]
+
+            # As with the parsy grammar, this is not undone by backtracking.
+            hd.file = content
+            self.hds = hds
+        return "\n"
+
+    def heredoc_lines(self, hd):
+        """ Collect a heredoc body inside backquotes, where each line must be unescaped to compare it with the tag """
+        text = self.text
+        lines = []
+        while True:
+            if self.pos >= self.end:
+                self.fail("looking for heredoc ending with " + hd.end)
+            nl = text.find("\n", self.pos, self.end)
+            stop = self.end if nl < 0 else nl + 1
+            line = unescape(text, self.pos, stop, self.depth)
+            self.pos = stop
+            if line.rstrip("\n") == hd.end:
+                return "".join(lines)
+            lines.append(line)
+
+    def heredoc_text(self):
+        """ The body of an unquoted heredoc, up to `end`: text with `$` expansions and backslash escapes """
+        text = self.text
+        parts = []
+        while self.pos < self.end:
+            m = HEREDOC_TEXT.match(text, self.pos, self.end)
+            if m is not None:
+                parts.append(SourceString(text, self.pos, m.end() - self.pos))
+                self.pos = m.end()
+                continue
+            if text[self.pos] == "\\" and self.pos + 1 < self.end:
+                e = text[self.pos + 1]
+                self.pos += 2
+                parts.append(ConstantString(DOUBLE_ESCAPES.get(e, e)))
+                continue
+            part = self.dollar(double_quoted=True) if text[self.pos] == "$" else None
+            if part is None:
+                # A `$` that starts no expansion, or a backslash at the very end, stands for itself.
+                parts.append(ConstantString(text[self.pos]))
+                self.pos += 1
+            else:
+                parts.append(part)
+        return Word(parts, double_quoted=True)
+
+    def opt_eol(self):
+        if self.text.startswith("\n", self.pos, self.end):
+            self.attempt(self.eol)
+
+    def opt_whitespace(self):
+        """ `whitespace.optional()`: either a run of blanks or a single eol """
+        if not self.ws():
+            self.opt_eol()
+
+    def eos(self):
+        self.ws()
+        c = self.peek()
+        if c == ";":
+            if self.peek(1) != ";":
+                self.pos += 1
+                return ";"
+            self.fail(";")
+        elif c == "\n":
+            return self.eol()
+        elif c == "":
+            return EOF
+        self.fail("eos")
+
+    # Compound commands
+
+    def command_sequence(self):
+        seq = []
+        while True:
+            seq.append(self.pipeline())
+            mark = self.mark()
+            try:
+                semi = self.eos()
+            except Fail:
+                self.reset(mark)
+                break
+            if semi is EOF:
+                break
+
+        if len(self.hds) > 0:
+            self.fail("Want additional heredocs")
+
+        return CommandSequence(seq)
+
+    def statements(self):
+        """ The pipelines up to the end of the current line, for streaming.
+
+        Returns them with the separator that ended them: "\n", once the bodies of
+        any heredocs begun on the line have been read too, or EOF.
+        """
+        seq = []
+        while True:
+            seq.append(self.pipeline())
+            semi = self.eos()
+            if semi != ";":
+                return seq, semi
+
+    def pipeline(self):
+        seq = []
+        while True:
+            self.ws()
+            self.opt_eol()
+            cmd = self.attempt(self.compound_command)
+            if cmd is None:
+                break
+            if not cmd.is_null():
+                seq.append(cmd)
+
+            mark = self.pos
+            self.ws()
+            if self.literal("|") is None:
+                self.pos = mark
+                break
+
+        if len(seq) == 1:
+            return seq[0]
+        return CommandPipe(seq)
+
+    def compound_command(self):
+        text = self.text
+        start = self.mark()
+
+        m = WORD_ID.match(text, self.pos, self.end)
+        if m is not None and text[m.end():m.end() + 1] in FUNCTION_FOLLOWS:
+            self.pos = m.end()
+            self.ws()
+            is_function = text.startswith("()", self.pos)
+            self.reset(start)
+            if is_function:
+                cmd = self.attempt(self.function_def)
+                if cmd is not None:
+                    return cmd
+
+        self.ws()
+        if self.peek() == "{":
+            self.reset(start)
+            cmd = self.attempt(self.command_brackets)
+            if cmd is not None:
+                return cmd
+            self.ws()
+
+        # The block commands share a prefix of optional redirects.
+        redirs = self.redirects()
+        self.ws()
+        c = text[self.pos:self.pos + 1]
+        if c == "(" and text.startswith("((", self.pos):
+            cmd = self.attempt(self.command_arith, redirs)
+            if cmd is not None:
+                return cmd
+        elif c in KEYWORD_STARTS:
+            for keyword in BLOCK_KEYWORDS:
+                if text.startswith(keyword, self.pos):
+                    cmd = self.attempt(getattr(self, "command_" + keyword), redirs)
+                    if cmd is not None:
+                        return cmd
+                    break
+
+        self.reset(start)
+        return self.command()
+
+    def command_brackets(self):
+        self.ws()
+        self.expect("{")
+        cmd = self.command_sequence()
+        self.expect("}")
+        return cmd
+
+    def function_def(self):
+        name = ConstantString(self.regex(WORD_ID))
+        self.ws()
+        self.expect("()")
+        self.ws()
+        if not self.eager and self.depth == 0 and len(self.hds) == 0 and self.peek() == "{":
+            # Leave the body to be parsed when the function is first called.
+            close = group_end(self.text, self.pos + 1, self.end, "}")
+            if close is not None:
+                source = SourceString(self.text, self.pos + 1, close - self.pos - 1)
+                self.pos = close + 1
+                return Function(name, source=source, parse=parse)
+        body = self.command_brackets()
+        return Function(name, body)
+
+    def keyword_line(self, keyword):
+        """ `whitespace.optional() >> string(keyword) << ws.optional() << eol.optional()` """
+        self.opt_whitespace()
+        self.expect(keyword)
+        self.ws()
+        self.opt_eol()
+
+    def optional_keyword_line(self, keyword):
+        """ `(whitespace.optional() >> string(keyword)).optional() << ws.optional() << eol.optional()` """
+        mark = self.mark()
+        self.opt_whitespace()
+        tok = self.literal(keyword)
+        if tok is None:
+            self.reset(mark)
+        self.ws()
+        self.opt_eol()
+        return tok
+
+    def closing_keyword(self, keyword):
+        self.opt_whitespace()
+        self.expect(keyword)
+        self.ws()
+        return self.redirects()
+
+    def command_while(self, redirs1):
+        self.expect("while")
+        cond = self.command_sequence()
+        self.keyword_line("do")
+        body = self.command_sequence()
+        redirs2 = self.closing_keyword("done")
+        return While(condition=cond, body=body).with_redirect(*redirs1, *redirs2)
+
+    def command_if(self, redirs1):
+        self.expect("if")
+        cond = self.command_sequence()
+        self.keyword_line("then")
+        body = self.command_sequence()
+        pairs = [(cond, body)]
+
+        while self.optional_keyword_line("elif") is not None:
+            cond = self.command_sequence()
+            self.keyword_line("then")
+            body = self.command_sequence()
+            pairs.append((cond, body))
+
+        if self.optional_keyword_line("else") is not None:
+            body = self.command_sequence()
+            pairs.append((If.OTHERWISE, body))
+
+        redirs2 = self.closing_keyword("fi")
+        return If(pairs).with_redirect(*redirs1, *redirs2)
+
+    def command_case(self, redirs1):
+        self.expect("case")
+        self.ws()
+        test = self.word()
+        self.ws()
+        self.expect("in")
+        case = Case(test)
+        while True:
+            pattern = self.attempt(self.case_pattern)
+            if pattern is None:
+                break
+            body = self.command_sequence()
+            self.opt_whitespace()
+            self.expect(";;")
+            case.with_case(pattern, body)
+        redirs2 = self.closing_keyword("esac")
+        return case.with_redirect(*redirs1, *redirs2)
+
+    def case_pattern(self):
+        self.opt_whitespace()
+        self.literal("(")
+        pattern = self.word()
+        self.expect(")")
+        return pattern
+
+    def command_arith(self, redirs1):
+        self.expect("((")
+        ex = self.expr()
+        self.opt_whitespace()
+        self.expect("))")
+        self.ws()
+        redirs2 = self.redirects()
+        return ArithCommand(ex).with_redirect(*redirs1, *redirs2)
+
+    def command_for(self, redirs1):
+        self.expect("for")
+        self.ws()
+        if self.text.startswith("((", self.pos):
+            loop = self.attempt(self.for_arith, redirs1)
+            if loop is not None:
+                return loop
+        var = self.regex(VARIABLE_ID)
+        if var is None:
+            self.fail("variable name")
+        var = Id(var)
+
+        self.ws()
+        if self.literal("in") is None:
+            words = [VarRef(Token("@"))]
+        else:
+            words = []
+            while True:
+                mark = self.mark()
+                try:
+                    self.eos()
+                    self.reset(mark)
+                    break
+                except Fail:
+                    self.reset(mark)
+                self.ws()
+                before = self.pos
+                word = self.word()
+                if self.pos == before:
+                    self.reset(mark)
+                    break
+                words.append(word)
+
+        self.eos()
+        self.opt_whitespace()
+        self.expect("do")
+        body = self.command_sequence()
+        redirs2 = self.closing_keyword("done")
+        return For(var=var, words=words, body=body).with_redirect(*redirs1, *redirs2)
+
+    def for_arith(self, redirs1):
+        self.expect("((")
+        init = self.opt_expr()
+        self.opt_whitespace()
+        self.expect(";")
+        cond = self.opt_expr()
+        self.opt_whitespace()
+        self.expect(";")
+        step = self.opt_expr()
+        self.opt_whitespace()
+        self.expect("))")
+
+        self.attempt(self.eos)
+        self.opt_whitespace()
+        self.expect("do")
+        body = self.command_sequence()
+        redirs2 = self.closing_keyword("done")
+        return ForArith(init=init, condition=cond, step=step, body=body).with_redirect(*redirs1, *redirs2)
+
+    # Simple commands
+
+    def command(self):
+        text = self.text
+        words = []
+        assignments = []
+        redirs = []
+        assignments_possible = True
+        while True:
+            self.ws()
+            if assignments_possible:
+                a = self.assignment()
+                if a is not None:
+                    assignments.append(a)
+                    continue
+            if text[self.pos:self.pos + 1] in REDIRECT_STARTS:
+                r = self.redirect()
+                if r is not None:
+                    redirs.append(r)
+                    continue
+            w = self.word()
+            assignments_possible = False
+
+            if not w:
+                break
+            if len(words) == 0 and w.matches_reserved(*RESERVED):
+                self.fail("can't have a reserved word here")
+
+            words.append(w)
+
+        return Command(words).with_assignment(*assignments).with_redirect(*redirs)
+
+    def assignment(self):
+        m = VARIABLE_ID.match(self.text, self.pos, self.end)
+        if m is None:
+            return None
+        append = self.text.startswith("+=", m.end())
+        if not append and not self.text.startswith("=", m.end()):
+            return None
+        self.pos = m.end() + 1 + append
+        return Assignment(m.group(), self.word(), append=append)
+
+    def redirects(self):
+        """ `redirect.sep_by(ws.optional())` """
+        redirs = []
+        while True:
+            mark = self.pos
+            if len(redirs) > 0:
+                self.ws()
+            r = self.redirect() if self.text[self.pos:self.pos + 1] in REDIRECT_STARTS else None
+            if r is None:
+                self.pos = mark
+                return redirs
+            redirs.append(r)
+
+    def redirect(self):
+        c = self.peek()
+        if c == "<" and self.peek(1) == "<":
+            hd = self.attempt(self.redirect_heredoc)
+            if hd is not None:
+                return hd
+        elif c == "" or c not in "<>" and not c.isdigit():
+            return None
+
+        mark = self.pos
+        fd = self.regex(DIGITS)
+        if self.literal("<&") is not None:
+            return RedirectDup(0 if fd is None else fd, self.word())
+        if self.literal("<") is not None:
+            return RedirectFrom(0 if fd is None else fd, self.word())
+        if self.literal(">>") is not None:
+            return RedirectTo(1 if fd is None else fd, self.word(), append=True)
+        if self.literal(">&") is not None:
+            return RedirectDup(1 if fd is None else fd, self.word())
+        if self.literal(">") is not None:
+            return RedirectTo(1 if fd is None else fd, self.word())
+        self.pos = mark
+        return None
+
+    def redirect_heredoc(self):
+        self.expect("<<")
+        quote = self.peek()
+        if quote in ('"', "'"):
+            self.pos += 1
+        else:
+            quote = None
+        tag = self.regex(WORD_ID)
+        if tag is None:
+            self.fail("heredoc tag")
+        if quote is not None:
+            self.expect(quote)
+
+        hd = RedirectHere(0, quote=quote, end=tag)
+        self.hds = self.hds + (hd,)
+        return hd
+
+    # Words
+
+    def word(self):
+        parts = self.word_parts()
+        if len(parts) == 1 and isinstance(parts[0], Word):
+            return parts[0]
+        return Word(parts)
+
+    def word_parts(self):
+        parts = []
+        while True:
+            part = self.word_part()
+            if part is None:
+                break
+            if type(part) is list:
+                parts.extend(part)
+            else:
+                parts.append(part)
+        return [p for p in parts if not (isinstance(p, ConstantString) and p.s == "")]
+
+    def word_part(self):
+        text = self.text
+        pos = self.pos
+        if pos >= self.end:
+            return None
+        c = text[pos]
+        if c in WORD_ENDS:
+            return None
+
+        if c == "$":
+            return self.dollar(double_quoted=False)
+        if c == "`":
+            return self.attempt(self.backtick)
+        if c == "_" or c.isascii() and c.isalpha():
+            m = VARIABLE_ID.match(text, pos, self.end)
+            self.pos = m.end()
+            return Id(m.group())
+        m = (BRACE_ID if self.in_brace else WORD_ID).match(text, pos, self.end)
+        if m is not None:
+            self.pos = m.end()
+            return ConstantString(m.group())
+        if c == "=":
+            self.pos += 1
+            return Token("=")
+        if c == "<" or c == ">":
+            for op in ("<&", "<<", "<", ">&", ">>", ">"):
+                if self.literal(op) is not None:
+                    return Token(op)
+        if c == "'":
+            close = text.find("'", pos + 1, self.end)
+            if close < 0:
+                self.note("'", self.end)
+                return None
+            self.pos = close + 1
+            if self.depth > 0:
+                return ConstantString(unescape(text, pos + 1, close, self.depth))
+            return ConstantString(text[pos + 1:close])
+        if c == '"':
+            return self.attempt(self.word_double)
+        if c == "{":
+            if self.literal("{}") is not None:
+                return Token("{}")
+            return self.attempt(self.brace)
+        if c == "\\":
+            if self.depth > 0:
+                return self.word_backslashes()
+            if pos + 1 >= self.end:
+                return None
+            self.pos += 2
+            if text[pos + 1] == "\n":
+                return Token("")
+            return ConstantString(text[pos + 1])
+        if c == "*":
+            if self.literal("**") is not None:
+                return STARSTAR
+            self.pos += 1
+            return STAR
+        return None
+
+    def brace(self):
+        """ A brace expansion: a range, as `{1..10}`, or two or more alternatives, as `{a,b}`.
+
+        Any other brace is text. A brace closed around a single alternative, as in
+        `{a}` or `{1..a}`, is returned as a list of its parts between the braces.
+        """
+        text = self.regex(BRACE_RANGE)
+        if text is not None:
+            return BraceRange.parse(text)
+        self.expect("{")
+        mark = self.mark()
+        in_brace, self.in_brace = self.in_brace, True
+        try:
+            first = self.word_parts()
+            items = [Word(first)]
+            while self.literal(",") is not None:
+                items.append(Word(self.word_parts()))
+        finally:
+            self.in_brace = in_brace
+        if self.literal("}") is None:
+            self.reset(mark)
+            return ConstantString("{")
+        if len(items) < 2:
+            return [ConstantString("{")] + first + [ConstantString("}")]
+        return BraceList(items)
+
+    def word_backslashes(self):
+        """ A run of backslashes inside backquotes. Returns the list of the parts it makes. """
+        k, after = self.backslashes()
+        if k == 0:
+            # They only escaped a `$` or a backquote, which is now bare.
+            if after >= self.end:
+                return None
+            self.pos = after
+            return self.word_part()
+
+        parts = [ConstantString("\\")] * (k // 2)
+        self.pos = after
+        if k % 2 == 1:
+            if after >= self.end:
+                self.fail("escaped character")
+            c = self.text[after]
+            parts.append(Token("") if c == "\n" else ConstantString(c))
+            self.pos += 1
+        return parts
+
+    def dollar(self, double_quoted):
+        """ All the word parts that begin with '$' """
+        text = self.text
+        pos = self.pos
+        nxt = text[pos + 1:pos + 2]
+        part = None
+        if nxt == "(":
+            if text.startswith("((", pos + 1):
+                part = self.attempt(self.word_arith)
+            if part is None:
+                part = self.attempt(self.word_expr)
+        elif nxt == "{":
+            part = self.attempt(self.word_variable_complex)
+        else:
+            m = VARIABLE_NAME.match(text, pos + 1, self.end)
+            if m is not None:
+                self.pos = m.end()
+                part = VarRef(ConstantString(m.group()))
+        if part is not None and double_quoted:
+            part.double_quoted = True
+        return part
+
+    def word_expr(self):
+        self.expect("$(")
+        cmd = self.command_sequence()
+        self.expect(")")
+        return cmd
+
+    def word_variable_complex(self):
+        self.expect("${")
+        name = self.regex(VARIABLE_NAME)
+        if name is None:
+            self.fail("variable name")
+        ref = VarRef(ConstantString(name))
+        for op in ("##", "#", "%%", "%"):
+            if self.literal(op) is not None:
+                ref = VarOp(ref, op, self.word())
+                break
+        self.expect("}")
+        return ref
+
+    def word_double(self):
+        if self.literal('""') is not None:
+            return Word([ConstantString("")], double_quoted=True)
+        self.expect('"')
+        word = self.double_content()
+        self.expect('"')
+        return word
+
+    def double_content(self):
+        text = self.text
+        parts = []
+        chars = []
+        while self.pos < self.end:
+            c = text[self.pos]
+            if c != '"' and c != "\\" and c != "$":
+                m = DOUBLE_TEXT.match(text, self.pos, self.end)
+                self.pos = m.end()
+                chars.append(m.group())
+                continue
+            if c == "\\" and self.depth > 0:
+                k, after = self.backslashes()
+                if k == 0 and after < self.end and text[after] == "`":
+                    # An escaped backquote is plain text here, and runs on into what follows.
+                    chars.append("`")
+                    self.pos = after + 1
+                    continue
+
+            if chars:
+                parts.append(ConstantString("".join(chars)))
+                chars = []
+            if c == '"':
+                break
+            elif c == "\\":
+                if self.depth > 0:
+                    if k == 0:
+                        if after >= self.end:
+                            break
+                        self.pos = after
+                        continue
+                    parts.extend([ConstantString("\\")] * (k // 2))
+                    self.pos = after
+                    if k % 2 == 0:
+                        continue
+                    if after >= self.end:
+                        self.fail("escaped character")
+                    self.pos -= 1
+                if self.pos + 1 >= self.end:
+                    break
+                e = text[self.pos + 1]
+                self.pos += 2
+                parts.append(ConstantString(DOUBLE_ESCAPES.get(e, e)))
+            else:
+                part = self.dollar(double_quoted=True)
+                if part is None:
+                    break
+                parts.append(part)
+        if chars:
+            parts.append(ConstantString("".join(chars)))
+        return Word(parts, double_quoted=True)
+
+    def backtick(self):
+        """ Parse the command in backquotes where it stands, reading it one level of escapes deeper. """
+        self.expect("`")
+        i = self.closing_tick(self.pos)
+        if i is None:
+            self.pos = self.end
+            self.fail("`")
+        close, run = self.ticks[i], self.runs[i]
+
+        outer = self.end, self.depth, self.hds
+        self.depth += 1
+        # Backslashes before the closing backquote that vanish at this depth aren't part of the command.
+        self.end = close - run if unescaped(run, "`", self.depth) == 0 else close
+        self.hds = ()
+        try:
+            cmd = self.command_sequence()
+        except Fail:
+            raise self.error()
+        if self.pos != self.end:
+            self.note("EOF")
+            raise self.error()
+
+        self.end, self.depth, self.hds = outer
+        self.pos = close + 1
+        return cmd
+
+    # Arithmetic
+
+    def word_arith(self):
+        self.expect("$((")
+        ex = self.expr()
+        self.opt_whitespace()
+        self.expect("))")
+        return Arith(ex)
+
+    def expr(self):
+        return self.expr_assign()
+
+    def expr_assign(self):
+        mark = self.mark()
+        self.opt_whitespace()
+        name = self.regex(VARIABLE_ID)
+        if name is not None:
+            self.opt_whitespace()
+            for op in ASSIGN_OPS:
+                if self.text.startswith(op, self.pos, self.end):
+                    self.pos += len(op)
+                    if op == "=" and self.peek() == "=":
+                        break
+                    return ArithAssign(name, op, self.expr_assign())
+        self.reset(mark)
+        return self.expr_or()
+
+    def expr_binary(self, operand, ops):
+        value = operand()
+        while True:
+            mark = self.mark()
+            self.opt_whitespace()
+            for op in ops:
+                if self.text.startswith(op, self.pos, self.end):
+                    break
+            else:
+                self.reset(mark)
+                return value
+            self.pos += len(op)
+            try:
+                rest = operand()
+            except Fail:
+                self.reset(mark)
+                return value
+            value = ArithBinary(op, value, rest)
+
+    def expr_or(self):
+        return self.expr_binary(self.expr_and, ("||",))
+
+    def expr_and(self):
+        return self.expr_binary(self.expr_equal, ("&&",))
+
+    def expr_equal(self):
+        return self.expr_binary(self.expr_compare, ("==", "!="))
+
+    def expr_compare(self):
+        return self.expr_binary(self.expr_add, ("<=", ">=", "<", ">"))
+
+    def expr_add(self):
+        return self.expr_binary(self.expr_mul, ("+", "-"))
+
+    def expr_mul(self):
+        return self.expr_binary(self.expr_unary, ("*", "/", "%"))
+
+    def expr_unary(self):
+        mark = self.mark()
+        self.opt_whitespace()
+        for op in ("!", "++", "--"):
+            if self.text.startswith(op, self.pos, self.end):
+                self.pos += len(op)
+                if op == "!":
+                    return ArithUnary(op, self.expr_unary())
+                name = self.regex(VARIABLE_ID)
+                if name is None:
+                    self.fail("variable name")
+                return ArithIncrement(name, op, prefix=True)
+
+        self.reset(mark)
+        v = self.attempt(self.expr_postfix)
+        if v is not None:
+            return v
+
+        self.opt_whitespace()
+        self.expect("-")
+        return ArithUnary("-", self.expr_unary())
+
+    def expr_postfix(self):
+        mark = self.mark()
+        self.opt_whitespace()
+        name = self.regex(VARIABLE_ID)
+        if name is not None:
+            for op in ("++", "--"):
+                if self.text.startswith(op, self.pos, self.end):
+                    self.pos += len(op)
+                    return ArithIncrement(name, op)
+        self.reset(mark)
+        return self.expr_atom()
+
+    def expr_atom(self):
+        mark = self.mark()
+        self.opt_whitespace()
+        v = self.regex(VARIABLE_ID)
+        if v is not None:
+            return ArithVariable(v)
+
+        v = self.regex(NUMBER)
+        if v is not None:
+            return ArithNumber(parse_number(v))
+
+        self.reset(mark)
+        self.opt_whitespace()
+        self.expect("(")
+        ex = self.expr()
+        self.opt_whitespace()
+        self.expect(")")
+        return ex
+
+    def opt_expr(self):
+        return self.attempt(self.expr)
+
+
+def parse(text, eager=False):
+    """ Parse a complete command sequence, as `psh.parser.command_sequence.parse` would """
+    return Parser(text, eager).parse()
+
+
+def heredoc_end(text, pos, end, tag):
+    """ Find the line holding just `tag`, from the start of the line at `pos`.
+
+    Returns where that line starts and where the one after it does, or None.
+    """
+    n = len(tag)
+    while pos < end:
+        if text.startswith(tag, pos, end) and (pos + n == end or text[pos + n] == "\n"):
+            return pos, min(pos + n + 1, end)
+        pos = text.find("\n" + tag, pos, end)
+        if pos < 0:
+            return None
+        pos += 1
+    return None
+
+
+def group_end(text, pos, end, closer, hds=None):
+    """ Skip-scan for the `closer` that ends the group begun just before `pos`, without parsing anything.
+
+    This knows just enough of the grammar to step over nested groups, quoted
+    strings, escapes, backquotes and heredoc bodies. It returns the closer's
+    position, or None if it can't be sure of finding it.
+    """
+    top = hds is None
+    if top:
+        hds = []
+    while True:
+        m = GROUP_SPECIAL.search(text, pos, end)
+        if m is None:
+            return None
+        pos = m.start()
+        c = text[pos]
+        if c == closer:
+            if top and len(hds) > 0:
+                return None
+            return pos
+        elif c == "{" or c == "$" and text.startswith("{", pos + 1):
+            pos = group_end(text, text.index("{", pos) + 1, end, "}", hds)
+        elif c == "$" and text.startswith("(", pos + 1):
+            pos = group_end(text, pos + 2, end, ")", hds)
+        elif c == "'":
+            pos = text.find("'", pos + 1, end)
+        elif c == '"':
+            pos = double_end(text, pos + 1, end, hds)
+        elif c == "`":
+            pos = backquote_end(text, pos + 1, end)
+        elif c == "\\":
+            pos += 1
+        elif c == "<":
+            m = HEREDOC_TAG.match(text, pos, end)
+            if m is not None and (pos == 0 or text[pos - 1] in " \t\n;|&{}()`"):
+                hds.append(m.group(2))
+                pos = m.end() - 1
+        elif c == "\n":
+            for tag in hds:
+                found = heredoc_end(text, pos + 1, end, tag)
+                if found is None:
+                    return None
+                pos = found[1] - 1
+            hds.clear()
+        if pos is None or pos < 0:
+            return None
+        pos += 1
+
+
+def double_end(text, pos, end, hds):
+    """ Skip-scan to the end of a double-quoted string """
+    while True:
+        m = DOUBLE_SPECIAL.search(text, pos, end)
+        if m is None:
+            return None
+        pos = m.start()
+        c = text[pos]
+        if c == '"':
+            return pos
+        elif c == "\\":
+            pos += 1
+        elif text.startswith("(", pos + 1):
+            pos = group_end(text, pos + 2, end, ")", hds)
+        elif text.startswith("{", pos + 1):
+            pos = group_end(text, pos + 2, end, "}", hds)
+        if pos is None:
+            return None
+        pos += 1
+
+
+def backquote_end(text, pos, end):
+    """ Skip-scan to the backquote that closes one opened just before `pos` """
+    start = pos
+    while True:
+        pos = text.find("`", pos, end)
+        if pos < 0:
+            return None
+        run = pos
+        while run > start and text[run - 1] == "\\":
+            run -= 1
+        if (pos - run) % 2 == 0:
+            return pos
+        pos += 1
+
+
+def heredoc_content(text, start, stop, quoted):
+    """ The content of a heredoc whose body is `text[start:stop]`. This shares the text rather than copying it. """
+    if start == stop:
+        return ConstantString("")
+    if quoted:
+        return SourceString(text, start, stop - start)
+    p = Parser(text)
+    p.pos, p.end = start, stop
+    return p.heredoc_text()
@@ -1,16 +1,21 @@
 import functools
 import inspect
+import itertools
 import pathlib
 import re
 
 from .base import Comparable, Evaluable
 from .sentinel import Sentinel
+from .text import Captured, join
 
 
 class _Star(Comparable, Evaluable, Sentinel):
     def evaluate(self, env, input=None, output=None, error=None):
         return self
 
+    def __reduce__(self):
+        return "STAR"
+
     def execute(self,  env, input=None, output=None, error=None):
         raise RuntimeError("attempt to execute _Star")
 
@@ -22,6 +27,9 @@ class _StarStar(Comparable, Evaluable, Sentinel):
     def evaluate(self, env, input=None, output=None, error=None):
         return self
 
+    def __reduce__(self):
+        return "STARSTAR"
+
     def execute(self,  env, input=None, output=None, error=None):
         raise RuntimeError("attempt to execute _Star")
 
@@ -29,6 +37,82 @@ class _StarStar(Comparable, Evaluable, Sentinel):
 STARSTAR = _StarStar("{**}")
 
 
+def unglobbed(value):
+    """ `value`, or the text that a glob marker was written as. Where a word makes a single string, as in an
+    assignment, its globs aren't expanded. """
+    if value is STAR:
+        return "*"
+    if value is STARSTAR:
+        return "**"
+    return value
+
+
+class BraceList(Comparable):
+    """ `{a,b,c}`: a word for each of the alternatives, which are Words """
+    __slots__ = ("items",)
+
+    def __init__(self, items, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.items = items
+
+    def alternatives(self):
+        for item in self.items:
+            yield list(item)
+
+    def evaluate(self, env):
+        # Where braces aren't expanded, as in an assignment, they stand for themselves.
+        return "{" + ",".join(item.evaluate(env) for item in self.items) + "}"
+
+    def __repr__(self):
+        return "{{{}}}".format(",".join(repr(item) for item in self.items))
+
+
+# `{1..10}`, `{a..e}`, with an optional increment: `{1..10..2}`
+BRACE_RANGE = re.compile(r"\{(?:(-?[0-9]+)\.\.(-?[0-9]+)|([a-zA-Z])\.\.([a-zA-Z]))(?:\.\.(-?[0-9]+))?\}")
+
+
+class BraceRange(Comparable):
+    """ `{1..10}`, `{a..e}` or `{1..10..2}`. The values are counted out as they're wanted, never stored. """
+    __slots__ = ("start", "end", "step")
+
+    def __init__(self, start, end, step=None, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.start = start
+        self.end = end
+        self.step = step
+
+    @classmethod
+    def parse(cls, text):
+        """ The range written as `text`, which BRACE_RANGE matches """
+        m = BRACE_RANGE.fullmatch(text)
+        return cls(m.group(1) or m.group(3), m.group(2) or m.group(4), m.group(5))
+
+    def values(self):
+        step = abs(int(self.step or 1)) or 1
+        if self.start.isalpha():
+            first, last, show = ord(self.start), ord(self.end), chr
+        else:
+            first, last = int(self.start), int(self.end)
+            # A leading zero on either end pads every value to the same width.
+            if any(n.lstrip("-").startswith("0") and len(n.lstrip("-")) > 1 for n in (self.start, self.end)):
+                show = "{{:0{}d}}".format(max(len(self.start), len(self.end))).format
+            else:
+                show = str
+        if first > last:
+            step = -step
+        return map(show, range(first, last + (1 if step > 0 else -1), step))
+
+    def alternatives(self):
+        for value in self.values():
+            yield (value,)
+
+    def evaluate(self, env):
+        return "{{{}..{}{}}}".format(self.start, self.end, "" if self.step is None else ".." + self.step)
+
+    def __repr__(self):
+        return self.evaluate(None)
+
+
 # Generators.
 # These may be passed a source generator to draw from.
 # That source should yield the objects we're filtering on:
@@ -97,10 +181,10 @@ def name_matches(pattern):
 
 
 def flatten(ls):
-    return sum(ls, [])
+    return list(itertools.chain.from_iterable(ls))
 
 
-SLASH = Sentinel("SLASH")
+SLASH = Sentinel("SLASH", __name__)
 
 
 def explode(part):
@@ -139,7 +223,7 @@ def compile_case_match(bits):
         if b is STAR:
             r += ".*"
         else:
-            r += re.escape(b)
+            r += re.escape(str(b))
     return re.compile(r)
 
 
@@ -159,11 +243,135 @@ def _bits(result, bits, rec=False):
 
 def expand(env, word, dir):
     """Given a word, turn it into a list of strings"""
-    ans = [item.evaluate(env) for item in word]
-    if STAR not in ans and STARSTAR not in ans:
-        return [''.join(ans)]
-
-    output = flatten(explode(item.evaluate(env)) for item in word)
+    return list(fields(env, word, dir))
+
+
+def fields(env, word, dir, stream=False):
+    """ Expand a word into the fields it stands for, one at a time.
+
+    This follows the order POSIX gives, after braces have made one word into
+    several, as other shells do first of all. Each part of the word is evaluated
+    once, left to right: parameters, command substitutions and arithmetic
+    give their values here. Unquoted values are then split into fields on
+    the characters of $IFS. Last, each field with a glob in it is matched
+    against the filesystem. With `stream`, an unquoted command substitution
+    is split as its output arrives, rather than once it has all been read.
+    """
+    for word in braces(word):
+        for pieces in split(env, word, stream):
+            if any(piece is STAR or piece is STARSTAR for piece in pieces):
+                yield from pathnames([str(piece) if isinstance(piece, Captured) else piece for piece in pieces], dir)
+            elif len(pieces) == 1:
+                # Which may be a Captured value, kept as it is
+                yield pieces[0]
+            else:
+                yield join(pieces)
+
+
+def braces(parts):
+    """ The words that brace expansion makes of `parts`, one at a time and left to right.
+
+    Nothing is built up front: ranges are counted out as they go, and the
+    product of several braces in a word is walked rather than made. The text
+    that braces give is left as plain strings among the parts.
+    """
+    for i, part in enumerate(parts):
+        if isinstance(part, (BraceList, BraceRange)):
+            head, tail = list(parts[:i]), list(parts[i + 1:])
+            for alternative in part.alternatives():
+                for rest in braces(list(alternative) + tail):
+                    yield head + rest
+            return
+    yield parts
+
+
+DEFAULT_IFS = " \t\n"
+
+
+@functools.lru_cache(maxsize=16)
+def delimiter(ifs):
+    """ The pattern for the field separators that `ifs` describes """
+    space = "".join(c for c in ifs if c in DEFAULT_IFS)
+    other = "".join(c for c in ifs if c not in DEFAULT_IFS)
+    alternatives = []
+    if other:
+        alternatives.append("[{0}]*[{1}][{0}]*".format(re.escape(space), re.escape(other)) if space else
+                            "[{}]".format(re.escape(other)))
+    if space:
+        alternatives.append("[{}]+".format(re.escape(space)))
+    return re.compile("({})".format("|".join(alternatives)))
+
+
+def split(env, word, stream=False):
+    """ Evaluate the parts of `word`, and split the result into fields.
+
+    Each field is yielded as a list of strings and glob markers. A field that
+    only holds unquoted expansions that came to nothing is dropped.
+    """
+    pattern = None
+    field = []
+    keep = False
+    for part in word:
+        if part is STAR or part is STARSTAR:
+            field.append(part)
+            keep = True
+            continue
+        if isinstance(part, str):
+            field.append(part)
+            keep = True
+            continue
+        if not getattr(part, "SPLIT", False) or getattr(part, "double_quoted", False):
+            field.append(part.evaluate(env))
+            keep = True
+            continue
+        if pattern is None:
+            ifs = env.get("IFS")
+            ifs = DEFAULT_IFS if ifs is None else ifs
+            pattern = delimiter(ifs) if ifs != "" else False
+        if not pattern:
+            field.append(part.evaluate(env))
+            continue
+        if stream and getattr(part, "STREAMS", False):
+            values = segments(part.stream(env), ifs)
+        else:
+            values = (str(part.evaluate(env)),)
+        for value in values:
+            pieces = pattern.split(value)
+            for i in range(0, len(pieces) - 1, 2):
+                if pieces[i]:
+                    field.append(pieces[i])
+                if any(field) or keep or pieces[i + 1].strip(DEFAULT_IFS):
+                    yield field
+                field = []
+                keep = False
+            if pieces[-1]:
+                field.append(pieces[-1])
+    if any(field) or keep:
+        yield field
+
+
+def segments(chunks, ifs):
+    """ Rejoin the pieces of a command's output so that each run of separators from `ifs` falls within one of them.
+
+    They can then be split one by one as they arrive. Trailing newlines are
+    dropped, as they are from the whole of a command substitution.
+    """
+    hold = ifs + "\n"
+    carry = ""
+    for chunk in chunks:
+        text = carry + chunk
+        cut = len(text.rstrip(hold))
+        carry = text[cut:]
+        if cut:
+            yield text[:cut]
+    carry = carry.rstrip("\n")
+    if carry:
+        yield carry
+
+
+def pathnames(pieces, dir):
+    """ The paths that match a field with globs in it """
+    output = flatten(explode(piece) for piece in pieces)
     if output[:2] == ["", SLASH]:
         dir = "/"
 
@@ -186,4 +394,5 @@ def expand(env, word, dir):
         if len(bits) > 0:
             result = _bits(result, bits, rec)
 
-    return [str(item) for item in result]
+    for item in result:
+        yield str(item)
@@ -1,9 +1,19 @@
-from .model import While, Function, Break, Continue
-from .builtin import Env
+from .model import While, Function, Break, Continue, BREAK, CONTINUE, RETURN
+from .text import encode, join, write
+from .builtin import Env, integer
+from .parser import parse_cached
 
 
 def echo(*args, env=None, stdin=None, stdout=None, stderr=None):
-    stdout.write(bytes(" ".join(args) + "\n", "utf-8"))
+    try:
+        stdout.write(encode(" ".join(args) + "\n"))
+    except TypeError:
+        # Some of them are Captured: copy those across as they are.
+        for i, arg in enumerate(args):
+            if i > 0:
+                stdout.write(b" ")
+            write(stdout, arg)
+        stdout.write(b"\n")
     stdout.flush()
     return 0
 
@@ -12,9 +22,35 @@ def local(*args, env=None, stdin=None, stdout=None, stderr=None):
     for a in args:
         kv = a.split("=", 2)
         if len(kv) == 1:
-            env.variables[kv[0]] = env.get(kv[0])
+            # The local takes the outer value, but not its integer attribute: that needs `declare -i`.
+            value = env.get(kv[0])
+            env.declare(kv[0], str(value) if isinstance(value, int) else value)
         else:
-            env.variables[kv[0]] = kv[1]
+            env.declare(kv[0], kv[1])
+
+
+def declare(*args, env=None, stdin=None, stdout=None, stderr=None):
+    """ `declare [-i] name[=value]...`, also called `typeset`. In a function, the names are local to it.
+
+    With -i, each variable holds an integer: see `Variables`.
+    """
+    integers = False
+    while args and args[0].startswith("-"):
+        if args[0] != "-i":
+            raise Exception("declare: only -i is supported, not {}".format(args[0]))
+        integers = True
+        args = args[1:]
+    for a in args:
+        name, equals, value = a.partition("=")
+        if not equals:
+            value = env.get(name)
+            if value is None and not integers:
+                # Unset variables aren't bound to anything.
+                continue
+        if integers:
+            value = integer(env, value)
+        env.declare(name, value)
+    return 0
 
 
 def break_(*args, env=None, stdin=None, stdout=None, stderr=None):
@@ -24,7 +60,10 @@ def break_(*args, env=None, stdin=None, stdout=None, stderr=None):
         n = int(args[0])
     else:
         raise Exception("duff break - we need some exception handling strategy here")
-    raise Break(n)
+    if env.vars.loops == 0:
+        raise Break(n)
+    env.vars.unwind, env.vars.levels = BREAK, min(n, env.vars.loops)
+    return 0
 
 
 def continue_(*args, env=None, stdin=None, stdout=None, stderr=None):
@@ -34,7 +73,10 @@ def continue_(*args, env=None, stdin=None, stdout=None, stderr=None):
         n = int(args[0])
     else:
         raise Exception("duff continue - we need some exception handling strategy here")
-    raise Continue(n)
+    if env.vars.loops == 0:
+        raise Continue(n)
+    env.vars.unwind, env.vars.levels = CONTINUE, min(n, env.vars.loops)
+    return 0
 
 
 def return_(*args, env=None, stdin=None, stdout=None, stderr=None):
@@ -44,22 +86,33 @@ def return_(*args, env=None, stdin=None, stdout=None, stderr=None):
         n = int(args[0])
     else:
         raise Exception("duff return - we need some exception handling strategy here")
-    raise Function.Return(n)
+    if env.vars.calls == 0:
+        raise Function.Return(n)
+    env.vars.unwind, env.vars.levels = RETURN, n
+    return n
 
 
 def colon(*args, env=None, stdin=None, stdout=None, stderr=None):
     return 0
 
 
+def eval_(*args, env=None, stdin=None, stdout=None, stderr=None):
+    cmd = parse_cached(join(args, " "))
+    return cmd.execute(env, input=stdin, output=stdout, error=stderr)
+
+
 def make_env():
     env = Env()
     env.permit_execution = True
     env.builtins = {
         "echo": echo,
         "local": local,
+        "declare": declare,
+        "typeset": declare,
         "break": break_,
         "continue": continue_,
         "return": return_,
         ":": colon,
+        "eval": eval_,
     }
     return env
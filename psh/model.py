@@ -4,26 +4,84 @@ import fcntl
 import io
 import logging
 import os
+import re
+import selectors
 import subprocess
+import sys
+import weakref
 
+from .arith import compile_arith
 from .base import Comparable, Evaluable
-from .builtin import Env
-from .glob import flatten, expand, compile_case_match
+from .cache import PARSE_CACHE
+from .glob import fields, compile_case_match, unglobbed
+from .sentinel import Sentinel
+from .text import join, write
 
 LOG = logging.getLogger(__name__)
 
+ASSIGNMENT_PREFIX = re.compile(r"[A-Za-z_][A-Za-z0-9_]*=")
+
+
+def compiled(node):
+    """ The closure that runs `node`, as `run(env, input, output, error)`; it's compiled on first use.
+
+    Nodes that know how to specialise themselves have a `compile` method. The
+    rest are run by their `execute` method. The closure is kept on the node, so
+    nothing may change a tree once it has been run.
+    """
+    try:
+        return node._compiled
+    except AttributeError:
+        pass
+    try:
+        compile = node.compile
+    except AttributeError:
+        def run(env, input, output, error):
+            return node.execute(env, input=input, output=output, error=error)
+    else:
+        run = compile()
+    node._compiled = run
+    return run
+
+
+def tail(node):
+    """ The closure that runs `node` as the last thing a function does.
+
+    A call to another function at the end of `node` isn't made here: it's left
+    in `Variables.call` for `Function.call` to make in the same frame, so that
+    chains of such calls run in constant stack space. These closures aren't
+    kept on the node, since it may be run elsewhere in the ordinary way.
+    """
+    try:
+        compile = node.compile_tail
+    except AttributeError:
+        return compiled(node)
+    return compile()
+
+
+def _redirected(node, run):
+    """ Wrap `run` so that it runs with `node`'s redirects in place, if it has any """
+    if not node.redirects:
+        return run
+
+    def redirected(env, input, output, error):
+        with Redirect.activate(env, node):
+            return run(env, input, output, error)
+    return redirected
+
 
 class List(Comparable, Evaluable):
+    __slots__ = ("items",)
+
     def __init__(self, items, *args, **kwargs):
         super().__init__(*args, **kwargs)
         self.items = items
 
     def __repr__(self):
         return "{}({!r}{})".format(self.__class__.__name__, self.items,
-                                   "".join(", {}={!r}".format(k, v)
-                                           for (k, v) in self.__dict__.items()
-                                           if not k.startswith("_")
-                                           and k != "items"))
+                                   "".join(", {}={!r}".format(k, getattr(self, k))
+                                           for k in self.fields()
+                                           if k != "items" and hasattr(self, k)))
 
     def execute(self,  env, input=None, output=None, error=None):
         raise NotImplementedError()
@@ -32,6 +90,7 @@ class List(Comparable, Evaluable):
         return self.items[key]
 
     def __setitem__(self, key, value):
+        self.changed()
         if isinstance(key, slice):
             self.items[key] = list(value)
         else:
@@ -44,16 +103,31 @@ class List(Comparable, Evaluable):
         return iter(self.items)
 
     def append(self, item):
+        self.changed()
         return self.items.append(item)
 
     def extend(self, items):
+        self.changed()
         return self.items.extend(items)
 
+    def changed(self):
+        """ Forget what's been worked out from the items. Nodes that contain this one are not affected. """
+        for name in self.CACHES:
+            try:
+                delattr(self, name)
+            except AttributeError:
+                pass
+
     def __eq__(self, other):
         return (isinstance(other, list) and self.items == other) or super().__eq__(other)
 
+    __hash__ = Comparable.__hash__
+
 
 class MaybeDoubleQuoted:
+    """ A part of a word that may be in double quotes. Classes that use this need a `double_quoted` slot. """
+    __slots__ = ()
+
     def __init__(self, *args, double_quoted=False, **kwargs):
         super().__init__(*args, **kwargs)
         self.double_quoted = double_quoted
@@ -65,12 +139,59 @@ class MaybeDoubleQuoted:
 
 class Word(MaybeDoubleQuoted, List):
     """ A Word is comprised of several parts"""
+    __slots__ = ("double_quoted", "_folded")
+
+    CACHES = List.CACHES + ("_folded",)
+
     def evaluate(self, env, input=None, output=None, error=None):
-        return ''.join(item.evaluate(env) for item in self)
+        parts = self.folded()
+        if len(parts) == 1:
+            return unglobbed(parts[0].evaluate(env))
+        return join([unglobbed(item.evaluate(env)) for item in parts])
+
+    def folded(self):
+        """ The parts of this word, with each run of constant parts merged into a single ConstantString """
+        try:
+            return self._folded
+        except AttributeError:
+            pass
+        parts = []
+        run = []
+        for part in self:
+            if isinstance(part, ConstantString):
+                run.append(part.s)
+                continue
+            if isinstance(part, Word) and part.constant is not None:
+                # A quoted piece with nothing in it to expand
+                run.append(part.constant)
+                continue
+            if run:
+                parts.append(ConstantString("".join(run)))
+                run = []
+            parts.append(part)
+        if run or not parts:
+            parts.append(ConstantString("".join(run)))
+        folded = self._folded = tuple(parts)
+        return folded
+
+    @property
+    def assigns(self):
+        """ Whether the word starts `name=` """
+        first = self.folded()[0]
+        return isinstance(first, ConstantString) and ASSIGNMENT_PREFIX.match(first.s) is not None
+
+    @property
+    def constant(self):
+        """ The word's value, if none of its parts need evaluating; otherwise None """
+        parts = self.folded()
+        if len(parts) == 1 and isinstance(parts[0], ConstantString):
+            return parts[0].s
+        return None
 
     def matches_reserved(self, *reserved):
-        if len(self) == 1 and isinstance(self[0], ConstantString) and str(self[0]) in reserved:
-            return str(self[0])
+        items = self.items
+        if len(items) == 1 and isinstance(items[0], ConstantString) and items[0].s in reserved:
+            return items[0].s
         return None
 
     def __getitem__(self, key):
@@ -80,23 +201,45 @@ class Word(MaybeDoubleQuoted, List):
             return super().__getitem__(key)
 
 
-@attr.s
+@attr.s(slots=True, frozen=True)
 class Assignment:
+    """ `var=expr`, or `var+=expr` if `append` is set """
     var = attr.ib()
     expr = attr.ib()
+    append = attr.ib(default=False)
 
     @staticmethod
     def run(env, assignments):
         for a in assignments:
             assert isinstance(a.var, str)
-            env[str(a.var)] = a.expr.evaluate(env)
+            if a.append:
+                env.append(a.var, a.expr.evaluate(env))
+            else:
+                env[str(a.var)] = a.expr.evaluate(env)
 
 
 class ConstantString(Comparable):
-    """ An uninterpreted piece of string """
+    """ An uninterpreted piece of string.
+
+    The same strings turn up over and over in a script, so each class keeps
+    one node for each string that's in use, and hands that out again.
+    """
+    __slots__ = ("s", "__weakref__")
+
+    _interned = weakref.WeakValueDictionary()
+
+    def __new__(cls, s, *args, **kwargs):
+        s = str(s)
+        try:
+            return cls._interned[cls, s]
+        except KeyError:
+            pass
+        node = super().__new__(cls)
+        node.s = sys.intern(s)
+        return cls._interned.setdefault((cls, s), node)
+
     def __init__(self, s, *args, **kwargs):
         super().__init__(*args, **kwargs)
-        self.s = str(s)
 
     def __repr__(self):
         return "{}({!r})".format(self.__class__.__name__, self.s)
@@ -116,30 +259,71 @@ class ConstantString(Comparable):
     def __eq__(self, other):
         return (isinstance(other, self.__class__) and self.s == other.s) or super().__eq__(other)
 
+    def __hash__(self):
+        # Equal to any ConstantString with the same text, whatever its class.
+        return hash(self.s)
+
+    def __reduce__(self):
+        return self.__class__, (self.s,)
+
+
+class SourceString(ConstantString):
+    """ An uninterpreted piece of the source, kept as an offset and length into it rather than copied out """
+    __slots__ = ("_source", "_offset", "_length")
+
+    def __new__(cls, *args, **kwargs):
+        # These aren't shared: that would keep a copy of the string.
+        return Comparable.__new__(cls)
+
+    def __init__(self, source, offset, length, *args, **kwargs):
+        super(ConstantString, self).__init__(*args, **kwargs)
+        self._source = source
+        self._offset = offset
+        self._length = length
+
+    @property
+    def s(self):
+        return self._source[self._offset:self._offset + self._length]
+
+    def __eq__(self, other):
+        return isinstance(other, ConstantString) and self.s == other.s
+
+    __hash__ = ConstantString.__hash__
+
+    def __reduce__(self):
+        # Don't drag the whole source along.
+        return ConstantString, (self.s,)
+
 
 class Token(ConstantString):
-    pass
+    __slots__ = ()
 
 
 class Id(ConstantString):
-    pass
+    __slots__ = ()
 
 
 class VarRef(Comparable, MaybeDoubleQuoted):
+    __slots__ = ("expr", "double_quoted")
+
+    # Unquoted, the value is split into fields
+    SPLIT = True
+
     def __init__(self, expr=None, *args, **kwargs):
         super().__init__(*args, **kwargs)
         self.expr = expr
 
     def evaluate(self, env):
-        return env[str(self.expr)]
+        value = env[str(self.expr)]
+        # An integer variable is only made text here.
+        return str(value) if type(value) is int else value
 
     def __repr__(self):
         quote = '"' if self.double_quoted else ''
         return '{0}${{{1}}}{0}'.format(quote, self.expr)
 
 
-def _drop_prefix(env, ref, param):
-    value = ref.evaluate(env)
+def _drop_prefix(env, value, param):
     regexp = compile_case_match([item.evaluate(env) for item in param])
     for i in range(0, len(value) + 1):
         if regexp.fullmatch(value, endpos=i):
@@ -147,8 +331,7 @@ def _drop_prefix(env, ref, param):
     return value
 
 
-def _drop_prefix_longest(env, ref, param):
-    value = ref.evaluate(env)
+def _drop_prefix_longest(env, value, param):
     regexp = compile_case_match([item.evaluate(env) for item in param])
     for i in range(len(value), -1, -1):
         if regexp.fullmatch(value, endpos=i):
@@ -156,8 +339,7 @@ def _drop_prefix_longest(env, ref, param):
     return value
 
 
-def _drop_suffix(env, ref, param):
-    value = ref.evaluate(env)
+def _drop_suffix(env, value, param):
     regexp = compile_case_match([item.evaluate(env) for item in param])
     for i in range(len(value), -1, -1):
         match = regexp.fullmatch(value, pos=i)
@@ -166,8 +348,7 @@ def _drop_suffix(env, ref, param):
     return value
 
 
-def _drop_suffix_longest(env, ref, param):
-    value = ref.evaluate(env)
+def _drop_suffix_longest(env, value, param):
     regexp = compile_case_match([item.evaluate(env) for item in param])
     for i in range(0, len(value) + 1):
         if regexp.fullmatch(value, pos=i):
@@ -176,6 +357,11 @@ def _drop_suffix_longest(env, ref, param):
 
 
 class VarOp(Comparable, MaybeDoubleQuoted):
+    __slots__ = ("ref", "op", "param", "double_quoted")
+
+    # Unquoted, the value is split into fields
+    SPLIT = True
+
     OPS = {
         "#": _drop_prefix,
         "##": _drop_prefix_longest,
@@ -194,13 +380,15 @@ class VarOp(Comparable, MaybeDoubleQuoted):
         return '{0}${{{1}{2}{3}}}{0}'.format(quote, self.ref, self.op, self.param)
 
     def evaluate(self, env):
-        return self.OPS[self.op](env, self.ref, self.param)
+        return self.OPS[self.op](env, str(self.ref.evaluate(env)), self.param)
 
 
 ASSIGN = Token("=")
 
 
-class Redirect:
+class Redirect(Comparable):
+    __slots__ = ("fd", "file")
+
     def __init__(self, fd, file, *args, **kwargs):
         super().__init__(*args, **kwargs)
         self.fd = int(fd)
@@ -253,14 +441,16 @@ class Redirect:
     def __eq__(self, other):
         return type(self) == type(other) and self.fd == other.fd and self.file == other.file
 
+    __hash__ = Comparable.__hash__
+
     def __repr__(self):
         return "{}({})".format(self.__class__.__name__,
-                               ", ".join("{}={}".format(k, v)
-                                         for (k, v) in self.__dict__.items()
-                                         if not k.startswith("_")))
+                               ", ".join("{}={}".format(k, getattr(self, k)) for k in self.fields()))
 
 
 class RedirectFrom(Redirect):
+    __slots__ = ()
+
     def do(self, env, saver=Redirect.NULL_SAVER):
         saver.move(self.fd)
         os.close(self.fd)
@@ -272,6 +462,8 @@ class RedirectFrom(Redirect):
 
 
 class RedirectTo(Redirect):
+    __slots__ = ("append",)
+
     def __init__(self, fd, file, append=False, *args, **kwargs):
         super().__init__(int(fd), file, *args, **kwargs)
         self.append = append
@@ -288,6 +480,8 @@ class RedirectTo(Redirect):
 
 
 class RedirectDup(Redirect):
+    __slots__ = ()
+
     def do(self, env, saver=Redirect.NULL_SAVER):
         fd = self.file.evaluate(env)
         saver.move(self.fd)
@@ -303,13 +497,17 @@ class RedirectDup(Redirect):
 
 
 class RedirectHere(Redirect):
+    __slots__ = ("quote", "end")
+
     def __init__(self, fd=0, quote=None, end=None, content=None, *args, **kwargs):
         super().__init__(fd, content, *args, **kwargs)
         self.quote = quote
         self.end = end
 
     def do(self, env, saver=Redirect.NULL_SAVER):
-        value = self.file.evaluate(env)
+        # Each part is written out in turn, so that large Captured values are never joined up.
+        parts = self.file.folded() if isinstance(self.file, Word) else (self.file,)
+        values = [part.evaluate(env) for part in parts]
 
         rd, wr = os.pipe()
         child = os.fork()
@@ -317,7 +515,9 @@ class RedirectHere(Redirect):
             # Child process.
             os.close(rd)
             try:
-                os.write(wr, bytes(value, "utf-8"))
+                with io.open(wr, "wb") as f:
+                    for value in values:
+                        write(f, value)
                 res = 0
             except OSError as e:
                 res = e.errno
@@ -334,6 +534,15 @@ class RedirectHere(Redirect):
 
 
 class Redirects:
+    """ A command that may have redirects. Classes that use this need a `redirects` slot.
+
+    `Redirects()` on its own makes a bare set of redirects to activate.
+    """
+    __slots__ = ()
+
+    def __new__(cls, *args, **kwargs):
+        return super().__new__(_Redirects if cls is Redirects else cls)
+
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
         self.redirects = []
@@ -347,7 +556,126 @@ class Redirects:
             redirect.do(env, saver=saver)
 
 
-class Arith(MaybeDoubleQuoted, Evaluable):
+class _Redirects(Redirects):
+    __slots__ = ("redirects",)
+
+
+class ArithExpression(Comparable):
+    """ A node in the tree of an arithmetic expression. Calling it evaluates it, compiling it on first use. """
+    __slots__ = ("_code",)
+
+    def __call__(self, env):
+        return self.compiled()(env)
+
+    def compiled(self):
+        """ The function this expression compiles to """
+        try:
+            return self._code
+        except AttributeError:
+            code = self._code = compile_arith(self)
+            return code
+
+    def source(self, compiler):
+        raise NotImplementedError()
+
+
+class ArithNumber(ArithExpression):
+    __slots__ = ("value",)
+
+    def __init__(self, value, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.value = value
+
+    def __repr__(self):
+        return repr(self.value)
+
+    def source(self, compiler):
+        return self.value
+
+
+class ArithVariable(ArithExpression):
+    __slots__ = ("name",)
+
+    def __init__(self, name, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.name = name
+
+    def __repr__(self):
+        return self.name
+
+    def source(self, compiler):
+        return compiler.variable(str(self.name))
+
+
+class ArithBinary(ArithExpression):
+    __slots__ = ("op", "left", "right")
+
+    def __init__(self, op, left, right, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.op = op
+        self.left = left
+        self.right = right
+
+    def __repr__(self):
+        return "({!r} {} {!r})".format(self.left, self.op, self.right)
+
+    def source(self, compiler):
+        return compiler.binary(self.op, self.left.source(compiler), self.right.source(compiler))
+
+
+class ArithUnary(ArithExpression):
+    __slots__ = ("op", "operand")
+
+    def __init__(self, op, operand, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.op = op
+        self.operand = operand
+
+    def __repr__(self):
+        return "{}{!r}".format(self.op, self.operand)
+
+    def source(self, compiler):
+        return compiler.unary(self.op, self.operand.source(compiler))
+
+
+class ArithAssign(ArithExpression):
+    __slots__ = ("name", "op", "value")
+
+    def __init__(self, name, op, value, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.name = name
+        self.op = op
+        self.value = value
+
+    def __repr__(self):
+        return "({} {} {!r})".format(self.name, self.op, self.value)
+
+    def source(self, compiler):
+        return compiler.assign(str(self.name), self.op, self.value.source(compiler))
+
+
+class ArithIncrement(ArithExpression):
+    __slots__ = ("name", "op", "prefix")
+
+    def __init__(self, name, op, prefix=False, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.name = name
+        self.op = op
+        self.prefix = prefix
+
+    def __repr__(self):
+        return "{}{}".format(self.op, self.name) if self.prefix else "{}{}".format(self.name, self.op)
+
+    def source(self, compiler):
+        return compiler.increment(str(self.name), self.op, self.prefix)
+
+
+class Arith(Comparable, MaybeDoubleQuoted, Evaluable):
+    __slots__ = ("expr", "double_quoted")
+
+    # Unquoted, the value is split into fields
+    SPLIT = True
+
     def __init__(self, expr, *args, **kwargs):
         super().__init__(*args, **kwargs)
         self.expr = expr
@@ -358,8 +686,42 @@ class Arith(MaybeDoubleQuoted, Evaluable):
     def evaluate(self, env, input=None, output=None, error=None):
         return str(self.expr(env))
 
+    def __repr__(self):
+        return "$(({!r}))".format(self.expr)
+
+
+class ArithCommand(Comparable, Redirects):
+    """ `(( expr ))`, which succeeds if the expression is non-zero """
+    __slots__ = ("expr", "redirects")
+
+    def __init__(self, expr=None, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.expr = expr
+
+    def is_null(self):
+        return False
+
+    def __repr__(self):
+        return "(({!r}))".format(self.expr)
+
+    def execute(self, env, input=None, output=None, error=None):
+        return compiled(self)(env, input, output, error)
+
+    def compile(self):
+        expr = self.expr.compiled()
+
+        def run(env, input, output, error):
+            res = 0 if expr(env) else 1
+            env['?'] = str(res)
+            return res
+        return _redirected(self, run)
+
 
 class Command(Redirects, List):
+    __slots__ = ("redirects", "assignments", "_argv")
+
+    CACHES = List.CACHES + ("_argv",)
+
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
         # Extract assignments and redirects
@@ -372,12 +734,26 @@ class Command(Redirects, List):
     def is_null(self):
         return len(self) == len(self.redirects) == len(self.assignments) == 0
 
+    @property
+    def argv(self):
+        """ The command's arguments, worked out once, if all of its words are constant; otherwise None """
+        try:
+            return self._argv
+        except AttributeError:
+            words = [word.constant if isinstance(word, Word) else None for word in self]
+            argv = self._argv = None if None in words else tuple(words)
+            return argv
+
     def execute(self, env, input=None, output=None, error=None):
         LOG.debug("executing: %s", self)
         assert env.permit_execution
         Assignment.run(env, self.assignments)
         if env.permit_execution and len(self) > 0:
-            args = evaluate(env, self)
+            args = self.argv
+            if args is None:
+                args = evaluate(env, self)
+                if not args:
+                    return 0
             if args[0] in env.builtins:
                 with Redirect.activate(env, self) as saver:
                     res = env.builtins[args[0]](*args[1:], env=env,
@@ -396,51 +772,171 @@ class Command(Redirects, List):
                     env['?'] = str(res)
                     return res
 
-            try:
-                if output is not None:
-                    output.fileno()
-                out = output
-            except io.UnsupportedOperation:
-                out = subprocess.PIPE
-            try:
-                if error is not None:
-                    error.fileno()
-                err = error
-            except io.UnsupportedOperation:
-                err = subprocess.PIPE
-            p = subprocess.Popen(args, bufsize=0, executable=None,
-                                 stdin=input, stdout=out, stderr=err,
-                                 preexec_fn=lambda: self.run_redirects(env),
-                                 close_fds=False,
-                                 cwd=None,
-                                 env=None)
-            o, e = p.communicate()
-            res = p.returncode
-            if out is subprocess.PIPE:
-                output.write(o)
-            if err is subprocess.PIPE:
-                error.write(e)
-            env['?'] = str(res)
-            return res
+            return self.run_external(env, args, input, output, error)
+
+    def run_external(self, env, args, input, output, error):
+        try:
+            if output is not None:
+                output.fileno()
+            out = output
+        except io.UnsupportedOperation:
+            out = subprocess.PIPE
+        try:
+            if error is not None:
+                error.fileno()
+            err = error
+        except io.UnsupportedOperation:
+            err = subprocess.PIPE
+        p = subprocess.Popen([arg if isinstance(arg, str) else str(arg) for arg in args], bufsize=0, executable=None,
+                             stdin=input, stdout=out, stderr=err,
+                             preexec_fn=lambda: self.run_redirects(env),
+                             close_fds=False,
+                             cwd=None,
+                             env=None)
+        if out is subprocess.PIPE or err is subprocess.PIPE:
+            _pump(p, output, error)
+        res = p.wait()
+        env['?'] = str(res)
+        return res
+
+    def compile(self):
+        """ Specialise the call: constant words are taken from `argv` or folded once, here, and the redirects are
+        only set up if there are any. """
+        assignments = self.assignments
+        if len(self) == 0:
+            def run(env, input, output, error):
+                Assignment.run(env, assignments)
+            return run
+
+        arguments, invoke = self._arguments(), self._invoke()
+
+        def run(env, input, output, error):
+            if assignments:
+                Assignment.run(env, assignments)
+            args = arguments(env)
+            if not args:
+                return 0
+            return invoke(env, args, input, output, error)
+        return run
+
+    def compile_tail(self):
+        """ As `compile`, but a call to a function is left for the function running this to make: see `tail` """
+        if len(self) == 0 or self.redirects:
+            return compiled(self)
+        assignments, arguments, invoke = self.assignments, self._arguments(), self._invoke()
+
+        def run(env, input, output, error):
+            if assignments:
+                Assignment.run(env, assignments)
+            args = arguments(env)
+            if not args:
+                return 0
+            if args[0] not in env.builtins:
+                function = env.functions.get(args[0])
+                if function is not None:
+                    state = env.vars
+                    state.unwind, state.call = CALL, (function, tuple(args[1:]))
+                    return 0
+            return invoke(env, args, input, output, error)
+        return run
+
+    def _arguments(self):
+        argv = self.argv
+        if argv is not None:
+            def arguments(env):
+                return argv
+        else:
+            words = tuple(self)
+
+            def arguments(env):
+                return evaluate(env, words)
+        return arguments
+
+    def _invoke(self):
+        redirects = self.redirects
+
+        def invoke(env, args, input, output, error):
+            builtin = env.builtins.get(args[0])
+            if builtin is not None:
+                if redirects:
+                    with Redirect.activate(env, self):
+                        res = builtin(*args[1:], env=env, stdin=input, stdout=output, stderr=error)
+                else:
+                    res = builtin(*args[1:], env=env, stdin=input, stdout=output, stderr=error)
+                env['?'] = str(res)
+                return res
+
+            function = env.functions.get(args[0])
+            if function is not None:
+                with Redirect.activate(env, self):
+                    res = function.call(*args[1:], env=env, input=input, output=output, error=error)
+                    env['?'] = str(res)
+                    return res
+
+            return self.run_external(env, args, input, output, error)
+        return invoke
+
+
+def _pump(p, output, error):
+    """ Copy what a process writes to its pipes across to `output` and `error` as it comes, rather than all at the
+    end """
+    with selectors.DefaultSelector() as selector:
+        for pipe, to in ((p.stdout, output), (p.stderr, error)):
+            if pipe is not None:
+                selector.register(pipe, selectors.EVENT_READ, to)
+        while selector.get_map():
+            for key, _ in selector.select():
+                data = os.read(key.fd, 1 << 16)
+                if data:
+                    key.data.write(data)
+                else:
+                    selector.unregister(key.fileobj)
+                    key.fileobj.close()
 
 
 class CommandSequence(Command):
+    # Only set for a `$(...)` inside double quotes
+    __slots__ = ("double_quoted",)
+
+    # Unquoted, the value is split into fields; in a `for` loop's words, as it's written (see `Evaluable.stream`)
+    SPLIT = True
+    STREAMS = True
+
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
         self[:] = [item for item in self if not (isinstance(item, List) and item.is_null())]
 
     def execute(self, env, input=None, output=None, error=None):
         assert env.permit_execution
+        return compiled(self)(env, input, output, error)
 
-        r = 0
-        for item in self:
-            r = item.execute(env, input=input, output=output, error=error)
+    def compile(self):
+        return self._sequence(tuple(compiled(item) for item in self))
 
-        return r
+    def compile_tail(self):
+        if not self or self.redirects:
+            return compiled(self)
+        return self._sequence(tuple(compiled(item) for item in self[:-1]) + (tail(self[-1]),))
+
+    @staticmethod
+    def _sequence(steps):
+        if len(steps) == 1:
+            return steps[0]
+
+        def run(env, input, output, error):
+            r = 0
+            state = env.vars
+            for step in steps:
+                r = step(env, input, output, error)
+                if state.unwind is not None:
+                    break
+            return r
+        return run
 
 
 class CommandPipe(List):
     """A sequence of Command objects. We create pipes between each."""
+    __slots__ = ()
 
     def is_null(self):
         return len(self) == 0
@@ -492,7 +988,32 @@ class Continue(Exception):
         self.n = n
 
 
-class While(Evaluable, Redirects):
+# What `break`, `continue` and `return` leave in Variables.unwind, and a function's last command when it
+# calls another function. The exceptions above are only for a `break` or `continue` outside any loop.
+BREAK = Sentinel("BREAK", __name__)
+CONTINUE = Sentinel("CONTINUE", __name__)
+RETURN = Sentinel("RETURN", __name__)
+CALL = Sentinel("CALL", __name__)
+
+
+def _unwound(state):
+    """ After a `break`, `continue` or `return` stops a loop's body, whether the loop should stop too.
+
+    A `break` or `continue` for this loop is used up here; one for a loop further out, or a `return`, is
+    left for that to deal with.
+    """
+    if state.unwind is RETURN:
+        return True
+    state.levels -= 1
+    if state.levels > 0:
+        return True
+    stop = state.unwind is BREAK
+    state.unwind = None
+    return stop
+
+
+class While(Comparable, Evaluable, Redirects):
+    __slots__ = ("condition", "body", "redirects")
 
     def __init__(self, condition=None, body=None, *args, **kwargs):
         super().__init__(*args, **kwargs)
@@ -500,23 +1021,29 @@ class While(Evaluable, Redirects):
         self.body = body
 
     def execute(self, env, input=None, output=None, error=None):
-        with Redirect.activate(env, self) as saver:
-            while True:
-                res = self.condition.execute(env, input=input, output=output, error=error)
-                if res != 0:
-                    return res
-                try:
-                    self.body.execute(env, input=input, output=output, error=error)
-                except Break as e:
-                    e.n -= 1
-                    if e.n <= 0:
-                        return 0
-                    raise e
-                except Continue as e:
-                    e.n -= 1
-                    if e.n <= 0:
+        return compiled(self)(env, input, output, error)
+
+    def compile(self):
+        condition, body = compiled(self.condition), compiled(self.body)
+
+        def run(env, input, output, error):
+            state = env.vars
+            state.loops += 1
+            try:
+                while True:
+                    res = condition(env, input, output, error)
+                    if state.unwind is not None:
+                        if _unwound(state):
+                            return 0
                         continue
-                    raise e
+                    if res != 0:
+                        return res
+                    body(env, input, output, error)
+                    if state.unwind is not None and _unwound(state):
+                        return 0
+            finally:
+                state.loops -= 1
+        return _redirected(self, run)
 
     def __repr__(self):
         return "While({}, {})".format(self.condition, self.body)
@@ -527,33 +1054,53 @@ class While(Evaluable, Redirects):
                 self.body == other.body and
                 self.redirects == other.redirects)
 
+    __hash__ = Comparable.__hash__
 
-class If(Redirects, List):
-    OTHERWISE = object()
 
-    def execute(self, env, input=None, output=None, error=None):
-        res = 0
+class If(Redirects, List):
+    __slots__ = ("redirects",)
 
-        with Redirect.activate(env, self) as saver:
-            for cond, body in self:
-                if cond is If.OTHERWISE:
-                    test = True
-                else:
-                    res = cond.execute(env, input=input, output=output, error=error)
-                    test = res == 0
-                if test:
-                    res = body.execute(env, input=input, output=output, error=error)
-                    break
+    OTHERWISE = Sentinel("If.OTHERWISE", __name__)
 
-        return res
+    def execute(self, env, input=None, output=None, error=None):
+        return compiled(self)(env, input, output, error)
+
+    def compile(self):
+        return self._branches(compiled)
+
+    def compile_tail(self):
+        if self.redirects:
+            return compiled(self)
+        return self._branches(tail)
+
+    def _branches(self, compile):
+        """ Run the bodies compiled by `compile` """
+        pairs = tuple((None if cond is If.OTHERWISE else compiled(cond), compile(body)) for cond, body in self)
+
+        def run(env, input, output, error):
+            res = 0
+            for cond, body in pairs:
+                if cond is not None:
+                    res = cond(env, input, output, error)
+                    if env.vars.unwind is not None:
+                        return res
+                    if res != 0:
+                        continue
+                return body(env, input, output, error)
+            return res
+        return _redirected(self, run)
 
     def __eq__(self, other):
         return (isinstance(other, self.__class__) and
                 list(self) == list(other) and
                 self.redirects == other.redirects)
 
+    __hash__ = Comparable.__hash__
+
 
 class Case(Comparable, Redirects):
+    __slots__ = ("expr", "cases", "redirects")
+
     def __init__(self, expr=None, *args, **kwargs):
         super().__init__(*args, **kwargs)
         self.expr = expr
@@ -568,7 +1115,7 @@ class Case(Comparable, Redirects):
 
     def execute(self, env, input=None, output=None, error=None):
         with Redirect.activate(env, self) as saver:
-            test = self.expr.evaluate(env)
+            test = str(self.expr.evaluate(env))
 
             for pattern, body in self.cases:
                 match = compile_case_match([item.evaluate(env) for item in pattern]).fullmatch(test)
@@ -582,7 +1129,7 @@ class Case(Comparable, Redirects):
 
     def execute(self, env, input=None, output=None, error=None):
         with Redirect.activate(env, self) as saver:
-            test = self.expr.evaluate(env)
+            test = str(self.expr.evaluate(env))
 
             for pattern, body in self.cases:
                 match = compile_case_match([item.evaluate(env) for item in pattern]).fullmatch(test)
@@ -593,6 +1140,8 @@ class Case(Comparable, Redirects):
 
 
 class For(Comparable, Redirects):
+    __slots__ = ("var", "words", "body", "redirects")
+
     def __init__(self, var=None, words=None, body=None, *args, **kwargs):
         super().__init__(*args, **kwargs)
         self.var = var
@@ -605,65 +1154,175 @@ class For(Comparable, Redirects):
     def __repr__(self):
         return "{}({!r}, {!r}, {!r}{})".format(self.__class__.__name__,
                                                self.var, self.words, self.body,
-                                               "".join(", {}={!r}".format(k, v)
-                                                       for (k, v) in self.__dict__.items()
-                                                       if not k.startswith("_")
-                                                       and k not in ("var", "words", "body")))
+                                               "".join(", {}={!r}".format(k, getattr(self, k))
+                                                       for k in self.fields()
+                                                       if k not in ("var", "words", "body")))
 
     def execute(self, env, input=None, output=None, error=None):
-        res = 0
-        with Redirect.activate(env, self) as saver:
-            var = self.var.evaluate(env)
-            words = [word.evaluate(env) for word in self.words]
+        return compiled(self)(env, input, output, error)
 
-            for word in words:
-                env[var] = word
-                try:
-                    res = self.body.execute(env, input=input, output=output, error=error)
-                except Break as e:
-                    e.n -= 1
-                    if e.n <= 0:
+    def compile(self):
+        var, words, body = self.var.evaluate(None), self.words, compiled(self.body)
+
+        def run(env, input, output, error):
+            res = 0
+            state = env.vars
+            values = expansions(env, words)
+            state.loops += 1
+            try:
+                for value in values:
+                    env[var] = value
+                    res = body(env, input, output, error)
+                    if state.unwind is not None and _unwound(state):
                         return 0
-                    raise e
-                except Continue as e:
-                    e.n -= 1
-                    if e.n <= 0:
-                        continue
-                    raise e
-        return res
+            finally:
+                state.loops -= 1
+                # Stop any traversal of the filesystem or command substitution that's still going.
+                values.close()
+            return res
+        return _redirected(self, run)
+
+
+class ForArith(Comparable, Redirects):
+    """ `for ((init; condition; step))`. Any of the three expressions may be missing. """
+    __slots__ = ("init", "condition", "step", "body", "redirects")
+
+    def __init__(self, init=None, condition=None, step=None, body=None, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.init = init
+        self.condition = condition
+        self.step = step
+        self.body = body
+
+    def is_null(self):
+        return False
+
+    def __repr__(self):
+        return "{}(({!r}; {!r}; {!r}), {!r})".format(self.__class__.__name__,
+                                                     self.init, self.condition, self.step, self.body)
+
+    def execute(self, env, input=None, output=None, error=None):
+        return compiled(self)(env, input, output, error)
+
+    def compile(self):
+        init = self.init.compiled() if self.init is not None else lambda env: 0
+        condition = self.condition.compiled() if self.condition is not None else lambda env: 1
+        step = self.step.compiled() if self.step is not None else lambda env: 0
+        body = compiled(self.body)
+
+        def run(env, input, output, error):
+            res = 0
+            state = env.vars
+            state.loops += 1
+            try:
+                init(env)
+                while condition(env):
+                    res = body(env, input, output, error)
+                    if state.unwind is not None and _unwound(state):
+                        return 0
+                    step(env)
+            finally:
+                state.loops -= 1
+            return res
+        return _redirected(self, run)
 
 
 class Function(Comparable, Evaluable):
+    __slots__ = ("name", "_body", "_lazy", "_tail")
+
+    CACHES = Comparable.CACHES + ("_tail",)
+
     class Return(Exception):
         def __init__(self, ret, *args, **kwargs):
             self.ret = ret
 
-    def __init__(self, name, body, *args, **kwargs):
+    def __init__(self, name, body=None, *args, source=None, parse=None, **kwargs):
+        """ A function, either with its `body` already parsed or with the `source` text to `parse` when it's first
+        called """
         super().__init__(*args, **kwargs)
         self.name = name
-        self.body = body
+        self._body = body
+        self._lazy = None if body is not None else (source, parse)
+
+    @property
+    def body(self):
+        # Another thread may be parsing the body too; `_body` is always set before `_lazy` is dropped.
+        lazy = self._lazy
+        if lazy is not None:
+            source, parse = lazy
+            self._body = PARSE_CACHE.get(str(source), parse)
+            self._lazy = None
+        return self._body
 
     def is_null(self):
         return False
 
     def execute(self, env, input=None, output=None, error=None):
-        env.functions[self.name] = self.body
+        env.functions[str(self.name)] = self
+
+    def __eq__(self, other):
+        return isinstance(other, Function) and self.name == other.name and self.body == other.body
+
+    __hash__ = Comparable.__hash__
 
     def __repr__(self):
-        return "{}({}={!r})".format(self.__class__.__name__, self.name, self.body)
+        if self._lazy is not None:
+            return "{}({}={{{}}})".format(self.__class__.__name__, self.name, self._lazy[0])
+        return "{}({}={!r})".format(self.__class__.__name__, self.name, self._body)
 
-    def call(self, *args, env=None, input=None, output=None, error=None):
-        local = {}
-        for i, v in enumerate(args):
-            local[str(i+1)] = v
-        local['#'] = str(len(args))
-        env2 = Env(variables=local, parent=env)
+    @property
+    def tail(self):
+        """ The closure that runs the body; see `tail` """
+        try:
+            return self._tail
+        except AttributeError:
+            run = self._tail = tail(self.body)
+            return run
 
+    def call(self, *args, env=None, input=None, output=None, error=None):
+        state = env.vars
+        state.calls += 1
         try:
-            return self.body.execute(env2, input=input, output=output, error=error)
-        except Function.Return as e:
-            return e.ret
+            with env.child(args) as frame:
+                function = self
+                while True:
+                    res = function.tail(frame, input, output, error)
+                    if state.unwind is not CALL:
+                        break
+                    # The last thing that function did was to call another: make that call in this frame.
+                    function, frame.positional = state.call
+                    state.unwind = state.call = None
+        finally:
+            state.calls -= 1
+        if state.unwind is RETURN:
+            state.unwind = None
+            return state.levels
+        return res
+
+
+# The commands whose `name=value` arguments are expanded as assignments are, without being split into fields
+DECLARATIONS = frozenset(("local", "declare", "typeset", "export", "readonly"))
+
+
+def expansions(env, words):
+    """ The fields of `words`, one at a time, for a `for` loop. Globs are matched as the directories are walked,
+    and the output of a `$(...)` is split as it's written. """
+    for word in words:
+        constant = word.constant
+        if constant is not None:
+            yield constant
+        else:
+            yield from fields(env, word.folded(), '.', stream=True)
 
 
 def evaluate(env, ws):
-    return flatten([expand(env, w, '.') for w in ws])
+    args = []
+    for w in ws:
+        constant = w.constant
+        if constant is not None:
+            args.append(constant)
+        elif args and args[0] in DECLARATIONS and w.assigns:
+            args.append(w.evaluate(env))
+        else:
+            args.extend(fields(env, w.folded(), '.'))
+    return args
@@ -1,22 +1,107 @@
+import re
 from functools import partial
-from parsy import eof, regex, generate, string, ParseError, fail, seq, success, string_from, eof, any_char
-from parsy_extn import monkeypatch_parsy, get_notes, put_note
+from parsy import eof, regex, generate, string, ParseError, fail, seq, string_from, any_char, Parser, Result
+from parsy_extn import keeps_notes, get_notes, put_note
 
 from .model import (ConstantString, Token, Id, VarRef, Word, Arith, Assignment,
                     Command, CommandSequence, CommandPipe, While, If, Case, Function,
                     Redirect, RedirectFrom, RedirectTo, RedirectDup, RedirectHere,
-                    MaybeDoubleQuoted, VarOp, For)
-from .glob import STAR, STARSTAR
+                    MaybeDoubleQuoted, VarOp, For, ForArith, ArithCommand, ArithNumber, ArithVariable, ArithBinary,
+                    ArithUnary, ArithAssign, ArithIncrement)
+from .glob import STAR, STARSTAR, BraceList, BraceRange, BRACE_RANGE
+from .cache import PARSE_CACHE
+from .arith import parse_number
+from . import fastparse
 
 
-# All our parser use may need to carry notes forward.
-# This cost is only paid if we actually muck around with heredocs.
-monkeypatch_parsy()
+def memo(parser):
+    """ Packrat-memoise a parser, so that backtracking over it stays linear.
 
+    Results are remembered per stream, keyed on the position and on the heredocs
+    that are pending there (the only notes the grammar keeps). If the parser
+    changed the notes, replaying the result replays that change too.
+    """
+    @Parser
+    def memoised(stream, index):
+        notes = stream.notes_for(index)
+        pending = tuple(map(id, notes.get('hds', ())))
+        try:
+            table = stream._memo
+        except AttributeError:
+            table = stream._memo = {}
+
+        key = (memoised, index, pending)
+        try:
+            result, after = table[key]
+        except KeyError:
+            result = parser(stream, index)
+            after = None
+            if result.status:
+                after = stream.notes_for(result.index)
+                if tuple(map(id, after.get('hds', ()))) == pending:
+                    after = None
+            table[key] = result, after
+
+        if after is not None:
+            stream.notes_update(result.index, dict(after))
+        return result
+
+    return keeps_notes(memoised)
+
+
+def dispatch(*alternatives):
+    """ Ordered choice that only tries the alternatives that can begin with the next character.
+
+    Each alternative is a pair of (first, parser). `first` is a regex that the
+    next character must match for the parser to be tried, or None if the parser
+    may begin with anything - including the end of the input.
+    """
+    firsts = [(None if first is None else re.compile(first), parser) for first, parser in alternatives]
+    table = {}
+
+    def candidates(c):
+        try:
+            return table[c]
+        except KeyError:
+            table[c] = parsers = tuple(parser for first, parser in firsts
+                                       if first is None or (c != "" and first.fullmatch(c)))
+            return parsers
+
+    @Parser
+    def dispatcher(stream, index):
+        result = None
+        for parser in candidates(stream[index:index + 1]):
+            result = parser(stream, index).aggregate(result)
+            if result.status:
+                return result
+        if result is None:
+            return Result.failure(index, "no alternative")
+        return result
+
+    return dispatcher
+
+
+# First characters, for dispatch.
+WS_FIRST = r"[ \t\\]"
+WORD_ID_FIRST = r'[^\s\'()$=";|<>&\\{}`*]'
+REDIRECT_FIRST = r"[0-9<>]"
 
 ws = regex('([ \t]|\\\\\n)+')
 
 
+def heredoc_body(hd):
+    """ Consume the lines of a heredoc's body, up to and including its end tag """
+    @Parser
+    def body(stream, index):
+        found = fastparse.heredoc_end(stream, index, len(stream), hd.end)
+        if found is None:
+            return Result.failure(len(stream), "looking for heredoc ending with " + hd.end)
+        # Copy the body out, rather than have the tree keep this stream and its memo table alive.
+        text = stream[index:found[0]]
+        return Result.success(found[1], fastparse.heredoc_content(text, 0, len(text), hd.quote is not None))
+    return body
+
+
 @generate("eol")
 def eol():
     """ Parse and consume a single '\n' character.
@@ -36,28 +121,10 @@ def eol():
         # The next heredoc to scan for
         hd = hds.pop(0)
 
-        lines = []
-        while True:
-            line = yield eof.result(EOF) | regex("[^\n]*\n") | regex("[^\n]*") << eof
-            if line is EOF:
-                return fail("looking for heredoc ending with " + hd.end)
-            if line.rstrip("\n") == hd.end:
-                break
-            lines.append(line)
-
-        content = '\n'.join(lines)
-
-        if content == '':
-            content = ConstantString("")
-        elif hd.quote is None:
-            content = double_content.parse(content)
-        else:
-            content = ConstantString(content)
-
         # Back-fill the HereDoc content. Note, this is *not* undone by backtracking.
         # However, a backtrack and re-parse may overwrite this value; so in the end,
         # it's likely that this will do what we want.
-        hd.file = content
+        hd.file = yield heredoc_body(hd)
 
         # `notes` itself is a shallow copy, so we don't need to worry about copying it here.
         notes['hds'] = hds
@@ -74,6 +141,7 @@ EOS = object()
 eos = ws.optional() >> (string(";") << string(";").should_fail(";;") | eol | eof.result(EOF))
 
 
+@memo
 @generate("command")
 def command():
     words = []
@@ -109,11 +177,22 @@ def command():
     return cmd
 
 
-@generate("while")
-def command_while():
+@generate("block-prefix")
+def block_prefix():
+    """ The optional redirects that may precede any of the block commands """
     yield ws.optional()
-    redirs1 = yield redirects
+    redirs = yield redirects
     yield ws.optional()
+    return redirs
+
+
+def with_leading_redirects(redirs, block):
+    block.redirects[:0] = redirs
+    return block
+
+
+@generate("while")
+def while_body():
     yield string("while")
     cond = yield command_sequence
     yield whitespace.optional() >> string("do") << ws.optional() << eol.optional()
@@ -121,14 +200,11 @@ def command_while():
     yield whitespace.optional() >> string("done")
     yield ws.optional()
     redirs2 = yield redirects
-    return While(condition=cond, body=body).with_redirect(*redirs1, *redirs2)
+    return While(condition=cond, body=body).with_redirect(*redirs2)
 
 
 @generate("cond")
-def command_cond():
-    yield ws.optional()
-    redirs1 = yield redirects
-    yield ws.optional()
+def cond_body():
     yield string("if")
     cond = yield command_sequence
     yield whitespace.optional() >> string("then") << ws.optional() << eol.optional()
@@ -153,14 +229,11 @@ def command_cond():
     yield ws.optional()
     redirs2 = yield redirects
 
-    return If(pairs).with_redirect(*redirs1, *redirs2)
+    return If(pairs).with_redirect(*redirs2)
 
 
 @generate("case")
-def command_case():
-    yield ws.optional()
-    redirs1 = yield redirects
-    yield ws.optional()
+def case_body():
     yield string("case") << ws.optional()
     test = yield word << ws.optional() << string("in")
     case = Case(test)
@@ -173,15 +246,15 @@ def command_case():
     yield whitespace.optional() >> string("esac")
     yield ws.optional()
     redirs2 = yield redirects
-    return case.with_redirect(*redirs1, *redirs2)
+    return case.with_redirect(*redirs2)
 
 
 @generate("for")
-def command_for():
-    yield ws.optional()
-    redirs1 = yield redirects
-    yield ws.optional()
+def for_body():
     yield string("for") << ws.optional()
+    loop = yield for_arith.optional()
+    if loop is not None:
+        return loop
     var = yield variable_id.map(Id)
 
     in_ = yield ws.optional() >> string("in").optional()
@@ -196,7 +269,53 @@ def command_for():
     yield ws.optional()
     redirs2 = yield redirects
 
-    return For(var=var, words=words, body=body).with_redirect(*redirs1, *redirs2)
+    return For(var=var, words=words, body=body).with_redirect(*redirs2)
+
+
+@generate("for-arith")
+def for_arith():
+    """ The rest of a `for ((init; condition; step))` loop """
+    yield string("((")
+    init = yield expr.optional()
+    yield whitespace.optional() >> string(";")
+    cond = yield expr.optional()
+    yield whitespace.optional() >> string(";")
+    step = yield expr.optional()
+    yield whitespace.optional() >> string("))")
+
+    yield eos.optional() >> whitespace.optional() >> string("do")
+    body = yield command_sequence
+    yield whitespace.optional() >> string("done")
+    yield ws.optional()
+    redirs2 = yield redirects
+
+    return ForArith(init=init, condition=cond, step=step, body=body).with_redirect(*redirs2)
+
+
+@generate("arith-command")
+def arith_body():
+    yield string("((")
+    ex = yield expr
+    yield whitespace.optional() >> string("))")
+    yield ws.optional()
+    redirs2 = yield redirects
+    return ArithCommand(ex).with_redirect(*redirs2)
+
+
+command_while = seq(block_prefix, while_body).combine(with_leading_redirects)
+command_cond = seq(block_prefix, cond_body).combine(with_leading_redirects)
+command_case = seq(block_prefix, case_body).combine(with_leading_redirects)
+command_for = seq(block_prefix, for_body).combine(with_leading_redirects)
+command_arith = seq(block_prefix, arith_body).combine(with_leading_redirects)
+
+# All the block commands, parsing their shared prefix only once.
+block_command = seq(block_prefix, dispatch(
+    ("w", while_body),
+    ("i", cond_body),
+    ("c", case_body),
+    ("f", for_body),
+    (r"\(", arith_body),
+)).combine(with_leading_redirects)
 
 
 @generate("command-brackets")
@@ -207,17 +326,45 @@ def command_brackets():
     return cmd
 
 
+@Parser
+def skipped_brackets(stream, index):
+    """ Skip over a `{ ... }` group without parsing it, returning the text between the brackets """
+    if not stream.startswith("{", index):
+        return Result.failure(index, "{")
+    close = fastparse.group_end(stream, index + 1, len(stream), "}")
+    if close is None:
+        return Result.failure(index, "skipped-brackets")
+    return Result.success(close + 1, stream[index + 1:close])
+
+
+def function_body(text):
+    """ Parse the body of a function that was skipped over by `skipped_brackets` """
+    return command_sequence.parse(text)
+
+
 @generate("function")
 def function_def():
     name = yield word_id << ws.optional()
     yield string("()") << ws.optional()
+    notes = yield get_notes
+    if len(notes.get('hds', ())) == 0:
+        # Leave the body to be parsed when the function is first called.
+        source = yield skipped_brackets.optional()
+        if source is not None:
+            return Function(name, source=ConstantString(source), parse=function_body)
     body = yield command_brackets
     return Function(name, body)
 
 
-compound_command = function_def | command_brackets | command_while | command_cond | command_case | command_for | command
+compound_command = memo(dispatch(
+    (WORD_ID_FIRST, function_def),
+    (WS_FIRST + "|{", command_brackets),
+    (WS_FIRST + "|" + REDIRECT_FIRST + "|[wicf(]", block_command),
+    (None, command),
+))
 
 
+@memo
 @generate("pipeline")
 def pipeline():
     seq = []
@@ -237,6 +384,7 @@ def pipeline():
     return CommandPipe(seq)
 
 
+@memo
 @generate("command-sequence")
 def command_sequence():
     seq = []
@@ -266,6 +414,7 @@ eaten_newline = string("\\\n").result(Token(""))
 variable_id = regex("[a-zA-Z_][a-zA-Z0-9_]*")
 variable_name = regex("[1-9][0-9]*|[0\\?!#@\\*]") | variable_id
 word_id = regex('[^\\s\'()$=";|<>&\\\\{}`*]+').map(ConstantString)
+brace_id = regex('[^\\s\'()$=";|<>&\\\\{}`*,]+').map(ConstantString)
 word_redir = string_from("<&", "<<", "<", ">&", ">>", ">").map(Token)
 word_single = (string("'") >> regex("[^']*") << string("'")).map(ConstantString)
 word_expr = string("$(") >> command_sequence << string(")")
@@ -274,6 +423,7 @@ word_variable_reference = (string("$") >> variable_name).map(ConstantString).map
 word_variable_name = variable_id.map(Id)
 word_equals = string("=").map(Token)
 word_dbrace = string("{}").map(Token)
+word_brace_range = regex(BRACE_RANGE).map(BraceRange.parse)
 word_glob = string("**").result(STARSTAR) | string("*").result(STAR)
 
 e_id = variable_id
@@ -295,47 +445,72 @@ def word_variable_complex():
 def expr_atom():
     v = yield (whitespace.optional() >> e_id).optional()
     if v is not None:
-        return lambda env: float(env.get(v))
+        return ArithVariable(v)
 
-    v = yield (whitespace.optional() >> regex(r"-?[0-9]+(\.[0-9]*)?").map(float)).optional()
+    v = yield (whitespace.optional() >> regex(r"-?[0-9]+(\.[0-9]*)?").map(parse_number)).optional()
     if v is not None:
-        return lambda env: v
+        return ArithNumber(v)
 
     ex = yield whitespace.optional() >> string("(") >> expr << whitespace.optional() << string(")")
     return ex
 
 
-@generate("expr-mul")
-def expr_mul():
-    op = (string("*").result(lambda first: lambda rest: lambda env: first(env) * rest(env)) |
-          string("/").result(lambda first: lambda rest: lambda env: first(env) / rest(env)))
-    this = lambda _: lambda rest: rest
-    ms = yield (success([this]) + expr_atom.times(1)).times(1) + \
-               (whitespace.optional() >> op.times(1) + expr_atom.times(1)).many()
+@generate("expr-postfix")
+def expr_postfix():
+    v = yield (whitespace.optional() >> seq(e_id, string_from("++", "--"))).optional()
+    if v is not None:
+        return ArithIncrement(*v)
+    return (yield expr_atom)
+
+
+@generate("expr-unary")
+def expr_unary():
+    op = yield (whitespace.optional() >> string_from("!", "++", "--")).optional()
+    if op == "!":
+        return ArithUnary(op, (yield expr_unary))
+    elif op is not None:
+        return ArithIncrement((yield e_id), op, prefix=True)
 
-    value = None
-    for op, item in ms:
-        value = op(value)(item)
+    v = yield expr_postfix.optional()
+    if v is not None:
+        return v
+
+    yield whitespace.optional() >> string("-")
+    return ArithUnary("-", (yield expr_unary))
 
-    return value
 
+def expr_binary(operand, ops):
+    """ A left-associative chain of `operand`s separated by any of `ops` """
+    @generate("expr-" + "".join(ops))
+    def chain():
+        value = yield operand
+        rest = yield (whitespace.optional() >> seq(string_from(*ops), operand)).many()
+        for op, item in rest:
+            value = ArithBinary(op, value, item)
+        return value
+    return chain
 
-@generate("expr-add")
-def expr_add():
-    op = (string("+").result(lambda first: lambda rest: lambda env: first(env) + rest(env)) |
-          string("-").result(lambda first: lambda rest: lambda env: first(env) - rest(env)))
-    this = lambda _: lambda rest: rest
-    ms = yield (success([this]) + expr_mul.times(1)).times(1) + \
-               (whitespace.optional() >> op.times(1) + expr_mul.times(1)).many()
 
-    value = None
-    for op, item in ms:
-        value = op(value)(item)
+expr_mul = expr_binary(expr_unary, ("*", "/", "%"))
+expr_add = expr_binary(expr_mul, ("+", "-"))
+expr_compare = expr_binary(expr_add, ("<", "<=", ">", ">="))
+expr_equal = expr_binary(expr_compare, ("==", "!="))
+expr_and = expr_binary(expr_equal, ("&&",))
+expr_or = expr_binary(expr_and, ("||",))
 
-    return value
 
+@generate("expr-assign")
+def expr_assign():
+    target = yield (whitespace.optional() >> seq(e_id << whitespace.optional(),
+                                                 string_from("=", "+=", "-=", "*=", "/=", "%=") <<
+                                                 string("=").should_fail("=="))).optional()
+    if target is None:
+        return (yield expr_or)
+    value = yield expr_assign
+    return ArithAssign(*target, value)
 
-expr = expr_add
+
+expr = expr_assign
 
 word_arith = (string("$((") >> expr << whitespace.optional() << string("))")).map(Arith)
 
@@ -356,17 +531,9 @@ word_double = (string('""').result(Word([ConstantString("")], double_quoted=True
               (string("\"") >> double_content << string("\""))
 
 
-@generate("backtick")
-def backtick():
-    """ Parse backticks. This is fugly.
-
-    Backticks: I gave up on single-pass parsing here. It would be doable with the 'notes' extension, but would require
-    enough context carrying forward that it'd need reimplementations of all bare string- and regex-matching things to
-    understand how many levels deep they are.
-
-    Here is the skinny: the shell has the $( ) which offer an objectively cleaner syntax.
-    We parse backticks recursively because it's about the neatest approach to implement the shell spec that describes
-    the feature in terms of a recursive implementation.
+@Parser
+def backtick(stream, index):
+    """ Parse backticks.
 
     The Posix shell spec, section 2.6.3, says this:
 
@@ -377,39 +544,86 @@ def backtick():
         undefined results occur. A single-quoted or double-quoted string that begins, but does not end, within the
         "`...`" sequence produces undefined results.
 
-    What a mess.
+    That describes stripping a level of escapes and parsing the result again, which costs a copy and a parse per level
+    of nesting. Instead the content is parsed where it stands, by the hand-written engine: its scanner can read text
+    at any depth of escaping. Doing that here would mean depth-aware versions of every string and regex in this
+    grammar.
     """
-    content = yield string("`") >> (string("`").should_fail("backtick") >> (
-                                    string(r"\`").result("`") |
-                                    string(r"\$").result("$") |
-                                    string(r"\\").result("\\") |
-                                    regex(r'[^\\`]*') |
-                                    string("\\")
-                                    )).many().concat() << string("`")
-    return command_sequence.parse(content)
-
-
-word_part = backtick \
-          | word_variable_reference \
-          | word_arith \
-          | word_expr \
-          | word_variable_name \
-          | word_variable_complex \
-          | word_id \
-          | word_equals \
-          | word_redir \
-          | word_single \
-          | word_double \
-          | word_dbrace \
-          | eaten_newline \
-          | word_backslash \
-          | word_glob
-
-word = word_part.many().map(
-    lambda x: x[0] if len(x) == 1 and isinstance(x[0], Word) else
-    Word([i for i in x if i != Token("")]))
-
-assignment = seq(variable_id, string("="), word).map(lambda vew: Assignment(vew[0], vew[2]))
+    p = fastparse.Parser(stream)
+    p.pos = index
+    try:
+        cmd = p.backtick()
+    except fastparse.Fail:
+        return Result.failure(index, "backtick")
+    return Result.success(p.pos, cmd)
+
+
+def word_parts(word_id):
+    """ The parts of words, whose plain text is matched by `word_id` """
+    return dispatch(
+        ("`", backtick),
+        (r"\$", word_variable_reference),
+        (r"\$", word_arith),
+        (r"\$", word_expr),
+        ("[a-zA-Z_]", word_variable_name),
+        (r"\$", word_variable_complex),
+        (WORD_ID_FIRST, word_id),
+        ("=", word_equals),
+        ("[<>]", word_redir),
+        ("'", word_single),
+        ('"', word_double),
+        (r"\{", word_dbrace),
+        (r"\{", word_brace_range),
+        (r"\{", word_brace),
+        (r"\{", word_brace_text),
+        (r"\{", word_open_brace),
+        (r"\\", eaten_newline),
+        (r"\\", word_backslash),
+        (r"\*", word_glob),
+    )
+
+
+def spliced(parts):
+    """ The parts of a word, with any lists of parts spliced in and empty tokens dropped """
+    result = []
+    for part in parts:
+        if type(part) is list:
+            result.extend(part)
+        elif part != Token(""):
+            result.append(part)
+    return result
+
+
+@generate("brace")
+def word_brace():
+    """ Two or more alternatives, as `{a,b}` """
+    yield string("{")
+    items = yield brace_part.many().map(lambda x: Word(spliced(x))).sep_by(string(","), min=2)
+    yield string("}")
+    return BraceList(items)
+
+
+@generate("brace text")
+def word_brace_text():
+    """ Any other brace is text: if it's closed around one alternative, as `{a}` or `{1..a}`, so is its closing
+    brace """
+    yield string("{")
+    parts = yield brace_part.many()
+    yield string("}")
+    return [ConstantString("{")] + spliced(parts) + [ConstantString("}")]
+
+
+word_open_brace = string("{").map(ConstantString)
+
+
+word_part = word_parts(word_id)
+brace_part = word_parts(brace_id)
+
+word = memo(word_part.many().map(
+    lambda x: x[0] if len(x) == 1 and isinstance(x[0], Word) else Word(spliced(x))))
+
+assignment = seq(variable_id, string("+=") | string("="), word).map(
+    lambda vew: Assignment(vew[0], vew[2], append=vew[1] == "+="))
 
 redirect_dup_from_n = seq(regex("[0-9]+"), string("<&") >> word).combine(RedirectDup)
 redirect_dup_from = (string("<&") >> word).map(partial(RedirectDup, 0))
@@ -443,16 +657,48 @@ def redirect_heredoc():
     return hd
 
 
-redirect = (redirect_heredoc |
-            redirect_dup_from_n | redirect_dup_from |
-            redirect_from_n | redirect_from |
-            redirect_append_n | redirect_append |
-            redirect_dup_to_n | redirect_dup_to |
-            redirect_to_n | redirect_to
-            )
+redirect = memo(dispatch(
+    ("<", redirect_heredoc),
+    ("[0-9]", redirect_dup_from_n), ("<", redirect_dup_from),
+    ("[0-9]", redirect_from_n), ("<", redirect_from),
+    ("[0-9]", redirect_append_n), (">", redirect_append),
+    ("[0-9]", redirect_dup_to_n), (">", redirect_dup_to),
+    ("[0-9]", redirect_to_n), (">", redirect_to),
+))
 
 redirects = redirect.sep_by(ws.optional())
 
+# A parse begun at any parser of this grammar carries notes forward. Each parse gets a stream of its own to keep
+# them on, so parses may run concurrently; parsy_extn.monkeypatch_parsy() would have done the same for every parsy
+# user, so the parsers imported from parsy are left alone.
+for _entry in list(globals().values()):
+    if isinstance(_entry, Parser) and all(_entry is not p for p in (eof, any_char, get_notes)):
+        keeps_notes(_entry)
+
+
+# The parser engines that `parse` can select between. Both build the same trees.
+ENGINES = {
+    "parsy": lambda text: command_sequence.parse(text),
+    "fast": fastparse.parse,
+}
+
+
+def _engine(name):
+    try:
+        return ENGINES[name]
+    except KeyError:
+        raise ValueError("unknown parser engine {!r}".format(name)) from None
+
+
+def parse(text, engine="parsy"):
+    """ Parse `text` as a complete command sequence using the named engine """
+    return _engine(engine)(text)
+
+
+def parse_cached(text, engine="parsy"):
+    """ As `parse`, but share the tree with any earlier parse of the same text by the same engine """
+    return PARSE_CACHE.get(text, _engine(engine))
+
 
 if __name__ == '__main__':
     c = command.parse("cat   foo bar")
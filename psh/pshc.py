@@ -0,0 +1,124 @@
+""" Caching of parsed scripts on disk, in the manner of .pyc files.
+
+A script's tree is written to `__pshcache__/<script>.pshc` beside it. The file
+records the psh version, a hash of psh's own sources and a hash of the script's
+source; if any of them differs on the next run, or the file can't be read back,
+the script is parsed afresh and the cache is rewritten. Hashing psh's sources
+means that a change to the node classes invalidates old trees even when the
+version number hasn't moved.
+
+Layout:
+
+    magic       b"PSHC"
+    format      1 byte
+    version     1 length byte, then the psh version and a hash of its sources, in ASCII
+    hash        32 bytes, the SHA-256 of the source
+    tree        the CommandSequence, pickled and then zlib-compressed
+
+The tree is a pickle, so a cache file is as trusted as the script beside it;
+anyone who can write one can write the other.
+"""
+import hashlib
+import logging
+import os
+import pickle
+import tempfile
+import zlib
+
+from . import __version__
+from .text import decode
+from .parser import parse
+
+LOG = logging.getLogger(__name__)
+
+MAGIC = b"PSHC"
+FORMAT = 2
+CACHE_DIR = "__pshcache__"
+
+
+def sources_hash():
+    """ A short hash of the modules in this package, which define the layout of a pickled tree """
+    digest = hashlib.sha256()
+    package = os.path.dirname(os.path.abspath(__file__))
+    for name in sorted(os.listdir(package)):
+        if name.endswith(".py"):
+            with open(os.path.join(package, name), "rb") as f:
+                digest.update(name.encode() + b"\0" + f.read())
+    return digest.hexdigest()[:16]
+
+
+VERSION = "{}+{}".format(__version__, sources_hash()).encode("ascii")
+
+
+class StaleCache(Exception):
+    pass
+
+
+def cache_path(path):
+    head, tail = os.path.split(path)
+    return os.path.join(head, CACHE_DIR, tail + ".pshc")
+
+
+def source_hash(source):
+    return hashlib.sha256(source).digest()
+
+
+def dumps(tree, digest):
+    return b"".join([
+        MAGIC,
+        bytes([FORMAT, len(VERSION)]),
+        VERSION,
+        digest,
+        zlib.compress(pickle.dumps(tree, protocol=pickle.HIGHEST_PROTOCOL)),
+    ])
+
+
+def loads(data, digest):
+    """ Return the tree from a cache file's content, if it matches the source's `digest` """
+    header = MAGIC + bytes([FORMAT, len(VERSION)]) + VERSION
+    if not data.startswith(header):
+        raise StaleCache("format or version differs")
+    if data[len(header):len(header) + len(digest)] != digest:
+        raise StaleCache("source has changed")
+    try:
+        return pickle.loads(zlib.decompress(data[len(header) + len(digest):]))
+    except (AttributeError, TypeError, ImportError, EOFError, pickle.UnpicklingError, zlib.error) as e:
+        raise StaleCache("tree can't be read: {}".format(e)) from None
+
+
+def load(path, engine="parsy"):
+    """ Parse the script at `path`, using and refreshing its cached tree """
+    with open(path, "rb") as f:
+        source = f.read()
+    digest = source_hash(source)
+    cache = cache_path(path)
+
+    try:
+        with open(cache, "rb") as f:
+            return loads(f.read(), digest)
+    except FileNotFoundError:
+        pass
+    except Exception as e:
+        LOG.debug("ignoring cache %s: %s", cache, e)
+
+    tree = parse(decode(source), engine=engine)
+
+    try:
+        write(cache, dumps(tree, digest))
+    except OSError as e:
+        LOG.debug("can't write cache %s: %s", cache, e)
+    return tree
+
+
+def write(cache, data):
+    """ Replace the cache file atomically, so that concurrent runs never see half of one """
+    directory = os.path.dirname(cache) or "."
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=directory, prefix=".pshc-")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        os.replace(tmp, cache)
+    except BaseException:
+        os.unlink(tmp)
+        raise
@@ -1,9 +1,15 @@
 class Sentinel:
-    def __init__(self, name):
+    def __init__(self, name, module=None):
         self.name = name
+        if module is not None:
+            self.__module__ = module
 
     def __repr__(self):
         return self.name
 
     def __str__(self):
         return self.name
+
+    def __reduce__(self):
+        # A sentinel that knows its module unpickles as itself, looked up by name there.
+        return self.name
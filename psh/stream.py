@@ -0,0 +1,139 @@
+""" Streaming execution of scripts, one top-level command at a time.
+
+A script run this way is never parsed as a whole. It is read in chunks that
+end on line boundaries - from an mmap for regular files - and each complete
+line of top-level commands is parsed, executed and then dropped. A command
+that runs past the end of the text read so far (a loop body, a quoted string,
+a heredoc...) makes the reader fetch at least as much again and reparse, so
+the work stays linear in the size of the script while the memory held stays
+in proportion to the largest single command.
+"""
+import mmap
+
+from parsy import ParseError, line_info_at
+
+from .text import decode
+from .fastparse import Parser, Fail, EOF
+
+CHUNK = 1 << 16
+
+
+class StreamParseError(ParseError):
+    """ A ParseError in a chunk of the script, which reports its line within the whole script """
+    def __init__(self, expected, stream, index, lines):
+        super().__init__(expected, stream, index)
+        self.lines = lines
+
+    def line_info(self):
+        line, col = line_info_at(self.stream, self.index)
+        return "{}:{}".format(self.lines + line, col)
+
+
+class Source:
+    """ Reads a script's text in pieces that each end on a line boundary """
+    def __init__(self, f):
+        self.f = f
+        self.offset = 0
+        self.pending = b""
+        self.done = False
+        try:
+            self.map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except (OSError, ValueError):
+            # Not a regular file (or an empty one): read it as a stream.
+            self.map = None
+
+    def read(self, size):
+        """ Return at least `size` characters, or all that are left """
+        if self.done:
+            return ""
+        if self.map is not None:
+            data = self._read_map(size)
+        else:
+            data = self._read_file(size)
+        return decode(data)
+
+    def _read_map(self, size):
+        start = self.offset
+        stop = start + size
+        if stop >= len(self.map):
+            stop = len(self.map)
+        else:
+            nl = self.map.find(b"\n", stop - 1)
+            stop = len(self.map) if nl < 0 else nl + 1
+        self.offset = stop
+        if stop == len(self.map):
+            self.done = True
+        return self.map[start:stop]
+
+    def _read_file(self, size):
+        data = [self.pending]
+        length = len(self.pending)
+        while True:
+            more = self.f.read(max(size - length, CHUNK))
+            if not more:
+                self.done = True
+                self.pending = b""
+                return b"".join(data)
+            data.append(more)
+            length += len(more)
+            if length >= size and b"\n" in more:
+                data = b"".join(data)
+                nl = data.rindex(b"\n") + 1
+                self.pending = data[nl:]
+                return data[:nl]
+
+    def close(self):
+        if self.map is not None:
+            self.map.close()
+
+
+def statements(source, chunk=CHUNK):
+    """ Yield the top-level commands of the script that `source` reads, parsing each line as it's reached """
+    buffer = source.read(chunk)
+    pos = 0
+    lines = 0
+    while True:
+        p = Parser(buffer)
+        p.pos = pos
+        try:
+            cmds, end = p.statements()
+            if end is EOF and len(p.hds) > 0:
+                p.fail("Want additional heredocs")
+            complete = end is not EOF or source.done
+        except Fail:
+            # A failure at the end of the buffer may just need more text.
+            if source.done or p.furthest < p.end:
+                raise StreamParseError(frozenset(p.expected), buffer, p.furthest, lines)
+            complete = False
+
+        if not complete:
+            lines += buffer.count("\n", 0, pos)
+            buffer = buffer[pos:] + source.read(max(chunk, len(buffer) - pos))
+            pos = 0
+            continue
+
+        for cmd in cmds:
+            if not cmd.is_null():
+                yield cmd
+        if end is EOF:
+            return
+
+        pos = p.pos
+        if len(buffer) - pos < chunk and not source.done:
+            lines += buffer.count("\n", 0, pos)
+            buffer = buffer[pos:] + source.read(chunk)
+            pos = 0
+
+
+def run(f, env, input=None, output=None, error=None):
+    """ Execute the script in the binary file `f`, a command at a time """
+    assert env.permit_execution
+
+    source = Source(f)
+    try:
+        r = 0
+        for cmd in statements(source):
+            r = cmd.execute(env, input=input, output=output, error=error)
+        return r
+    finally:
+        source.close()
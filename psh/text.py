@@ -0,0 +1,110 @@
+""" Text, and its boundary with bytes.
+
+Text is encoded and decoded here, and only here. Bytes that aren't UTF-8
+travel through as lone surrogates, as os.fsdecode carries them in filenames,
+so they come back out exactly as they went in.
+
+The output of a `$(...)` is collected in memory until there's more than
+SPILL_SIZE of it, and then in an anonymous temporary file. Text that large is
+kept as a Captured value, mapped from that file: variables hold it, and `echo`,
+heredocs and other captures copy it out, without ever decoding it. Anything
+else that needs it as a str decodes it there and then.
+"""
+import io
+import mmap
+import tempfile
+
+ENCODING = "utf-8"
+ERRORS = "surrogateescape"
+
+SPILL_SIZE = 1 << 24
+
+
+def encode(text):
+    return text.encode(ENCODING, ERRORS)
+
+
+def decode(data):
+    """ The text of `data`, which may be any bytes-like object """
+    return str(data, ENCODING, ERRORS)
+
+
+def join(values, separator=""):
+    """ Join a list of values, any of which may be Captured, into a str """
+    try:
+        return separator.join(values)
+    except TypeError:
+        return separator.join([str(value) if isinstance(value, Captured) else value for value in values])
+
+
+def write(out, value):
+    """ Write a value, which may be Captured, to the binary stream `out` """
+    if isinstance(value, str):
+        out.write(encode(value))
+    else:
+        value.write_to(out)
+
+
+def _content(data):
+    """ The length of `data` without the newlines at its end """
+    end = len(data)
+    while end and data[end - 1] == 10:
+        end -= 1
+    return end
+
+
+class Captured:
+    """ The text of a large command output, mapped from the file it was collected in, without its trailing newlines """
+    __slots__ = ("_map", "_end")
+
+    def __init__(self, file):
+        file.flush()
+        self._map = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        self._end = _content(self._map)
+
+    def __str__(self):
+        return decode(memoryview(self._map)[:self._end])
+
+    def write_to(self, out):
+        out.write(memoryview(self._map)[:self._end])
+
+    def __eq__(self, other):
+        return str(self) == other
+
+    def __hash__(self):
+        return hash(str(self))
+
+    def __repr__(self):
+        return "{}({} bytes)".format(self.__class__.__name__, self._end)
+
+
+class Capture:
+    """ A binary stream for the output of a `$(...)`, which moves from memory to a file if it gets large """
+    def __init__(self, limit=None):
+        self.limit = SPILL_SIZE if limit is None else limit
+        self.buffer = io.BytesIO()
+        self.file = None
+
+    def write(self, data):
+        if self.file is None:
+            if self.buffer.tell() + len(data) <= self.limit:
+                return self.buffer.write(data)
+            self.file = tempfile.TemporaryFile()
+            self.file.write(self.buffer.getbuffer())
+            self.buffer = None
+        return self.file.write(data)
+
+    def flush(self):
+        pass
+
+    def fileno(self):
+        raise io.UnsupportedOperation("fileno")
+
+    def value(self):
+        """ What was written, as text """
+        if self.file is not None:
+            with self.file:
+                return Captured(self.file)
+        data = self.buffer.getvalue()
+        # Drop the trailing newlines before decoding, rather than copy all of the text to drop them after.
+        return decode(memoryview(data)[:_content(data)])
@@ -0,0 +1,121 @@
+""" Syntax checking for text that's being edited, a line of commands at a time.
+
+The checker remembers where each complete line of top-level commands ended
+the last time it looked. Those lines only depend on the text before their
+end, so after an edit it picks up from the last one that ends before the
+first changed character, rather than parsing the whole text again.
+"""
+import bisect
+import os
+import threading
+
+from parsy import ParseError
+
+from .fastparse import Parser, Fail, EOF, parse
+
+
+def common_prefix(a, b):
+    """ The length of the longest common prefix of `a` and `b` """
+    lo, hi = 0, min(len(a), len(b))
+    if a[:hi] == b[:hi]:
+        return hi
+    # Invariant: a[:lo] == b[:lo] and a[:hi] != b[:hi]
+    while hi - lo > 1:
+        mid = (lo + hi) // 2
+        if a[lo:mid] == b[lo:mid]:
+            lo = mid
+        else:
+            hi = mid
+    return lo
+
+
+class Checker:
+    """ Resumable syntax checking of a changing piece of text """
+    def __init__(self):
+        self.text = None
+        self.bounds = [0]
+        self.error = None
+
+    def check(self, text):
+        """ Return the ParseError in `text`, or None if it's a complete command sequence """
+        if text == self.text:
+            return self.error
+        keep = bisect.bisect_right(self.bounds, common_prefix(self.text or "", text))
+        del self.bounds[max(keep, 1):]
+        self.text = text
+        self.error = None
+
+        p = Parser(text, eager=True)
+        p.pos = self.bounds[-1]
+        try:
+            while True:
+                _, end = p.statements()
+                if end is EOF:
+                    if len(p.hds) > 0:
+                        p.fail("Want additional heredocs")
+                    break
+                self.bounds.append(p.pos)
+        except Fail:
+            self.error = p.error()
+        except ParseError as e:
+            self.error = e
+        return self.error
+
+
+class Background:
+    """ Runs a Checker off the calling thread, once its text has stopped changing for `delay` seconds """
+    def __init__(self, delay=0.1):
+        self.delay = delay
+        self.checker = Checker()
+        self.lock = threading.Lock()
+        self.timer = None
+
+    def update(self, text):
+        """ Note a change to the text; it will be checked once the changes settle """
+        if self.timer is not None:
+            self.timer.cancel()
+        self.timer = threading.Timer(self.delay, self.check, (text,))
+        self.timer.daemon = True
+        self.timer.start()
+
+    def check(self, text):
+        """ The ParseError in `text`, or None; this only does work if the text hasn't been checked yet """
+        with self.lock:
+            return self.checker.check(text)
+
+    def cancel(self):
+        if self.timer is not None:
+            self.timer.cancel()
+
+
+def scripts(paths):
+    """ The files named in `paths`, and the shell scripts in any directories among them """
+    for path in paths:
+        if os.path.isdir(path):
+            for root, dirs, files in os.walk(path):
+                dirs.sort()
+                for name in sorted(files):
+                    if name.endswith(".sh"):
+                        yield os.path.join(root, name)
+        else:
+            yield path
+
+
+def lint(path):
+    """ Syntax-check the script at `path`. Returns its size in bytes and an error message or None
+
+    Any failure is reported against the file, so that one bad script can't stop a check of many.
+    """
+    try:
+        with open(path, "rb") as f:
+            data = f.read()
+        text = data.decode("utf-8")
+    except (OSError, UnicodeDecodeError) as e:
+        return 0, "{}: {}".format(path, e)
+    try:
+        parse(text, eager=True)
+        return len(data), None
+    except ParseError as e:
+        return len(data), "{}: {}".format(path, e)
+    except Exception as e:
+        return len(data), "{}: {}: {}".format(path, type(e).__name__, e)
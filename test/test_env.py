@@ -0,0 +1,126 @@
+import io
+
+import pytest
+
+from psh.builtin import Env, Builder, ShellError
+from psh.cmd import run_script
+from psh.local import make_env
+from psh.parser import parse
+
+
+def test_frames():
+    env = Env()
+    env["x"] = "global"
+    env["y"] = "global"
+    with Env(parent=env) as f1:
+        f1.declare("x", "f1")
+        with Env(parent=f1, variables={"y": "f2"}) as f2:
+            assert (f2["x"], f2["y"]) == ("f1", "f2")
+            f2["x"] = "set in f2"
+            f2["z"] = "new"
+        assert (f1["x"], f1["y"], f1["z"]) == ("set in f2", "global", "new")
+    assert (env["x"], env["y"], env["z"]) == ("global", "global", "new")
+    assert env.vars.bindings == {"x": ["global"], "y": ["global"], "z": ["new"]}
+
+
+def test_special():
+    env = Env()
+    assert env.get("1") is None
+    assert env["#"] == "0"
+    env["?"] = "1"
+    with Env(parent=env, positional=("a", "b")) as f:
+        assert (f["1"], f["2"], f["#"], f.get("3")) == ("a", "b", "2", None)
+        with Env(parent=f) as g:
+            assert g["2"] == "b"
+            g["?"] = "3"
+    assert env["?"] == "3"
+    with pytest.raises(KeyError):
+        env["x"]
+    with pytest.raises(KeyError):
+        env["#"] = "3"
+
+
+def test_script_positional(tmp_path, capfd):
+    """ A function in a script sees its own arguments, not the script's """
+    script = tmp_path / "s.sh"
+    script.write_text("echo $0 $# $1; f() { echo $# $1; }; f a b c\n")
+    assert run_script(str(script), ["x", "y"], cache=False) == 0
+    assert capfd.readouterr().out == "{} 2 x\n3 a\n".format(script)
+
+
+def test_deep():
+    """ Reading a global and setting $? cost the same however deep the call """
+    cmd = parse("x=found; f() { local n=$1; if ((n > 0)); then f $((n - 1)); else echo $x $#; fi; }; f 40")
+    env = make_env()
+    out = io.BytesIO()
+    cmd.execute(env, output=out)
+    assert out.getvalue() == b"found 1\n"
+    assert set(env.vars.bindings) == {"x"}
+    assert env.get("1") is None
+
+
+@pytest.mark.parametrize(("text", "expected"), (
+    ("x=a; x+=b; x+=' c'; echo \"$x\"", b"ab c\n"),
+    ("x+=b; echo $x", b"b\n"),
+    ("f() { local x; x+=a; x+=b; echo $x; }; f", b"ab\n"),
+    ("x=a; x+=$(echo b c); x+=$x; echo \"$x\"", b"ab cab c\n"),
+    ("x=a; f() { local x=1; x+=2; echo $x; }; f; x+=3; echo $x", b"12\na3\n"),
+    ("for i in 1 2 3; do s+=$i; s+=,; done; echo $s", b"1,2,3,\n"),
+    ("n=1; n+=0; echo $((n + 1))", b"11\n"),
+))
+def test_append(text, expected):
+    out = io.BytesIO()
+    parse(text).execute(make_env(), output=out)
+    assert out.getvalue() == expected
+
+
+def test_append_joins_once():
+    """ The pieces appended to a variable are only joined when it's read """
+    env = make_env()
+    parse("s=x; for i in a b c; do s+=$i; done").execute(env)
+    assert isinstance(env.vars.bindings["s"][-1], Builder)
+    assert env["s"] == "xabc"
+    assert env.vars.bindings["s"] == ["xabc"]
+
+
+@pytest.mark.parametrize(("text", "expected"), (
+    ("declare -i n=5; n=7; n+=3; echo $n", b"10\n"),
+    ("declare -i n=5; ((n *= 2)); x=$n; x+=1; echo $n $x", b"10 101\n"),
+    ("declare -i n; echo $n; n=3.7; echo $n; n=abc; echo $n", b"0\n3\n0\n"),
+    ("n=4; declare -i n; n+=1; echo $n", b"5\n"),
+    ("typeset -i n=1; for n in 1 2+2 3; do echo \"[$n]\"; done", b"[1]\n[4]\n[3]\n"),
+    ("declare -i n; n=3; n=n*2; echo $n; n=n/4; echo $n; n=n*n+1; echo $n", b"6\n1\n2\n"),
+    ("declare -i k=7/2; echo $k; k='k * 5 + 1'; echo $k; k+=k; echo $k", b"3\n16\n32\n"),
+    ("n=5; declare -i m=' n * 2 + 1 ' e=; echo $m $e", b"11 0\n"),
+    ("v='a b'; declare x=$v; typeset y=$v; echo \"$x.$y\"", b"a b.a b\n"),
+    ("declare -i n=12; echo ${n%2}x $((n / 5))", b"1x 2\n"),
+    ("f() { declare -i k=1; k+=1; echo $k; }; k=a; f; echo $k", b"2\na\n"),
+    ("declare x=1 y; echo $x; y=2; echo $y", b"1\n2\n"),
+    ("declare -i n=2; f() { local n; echo $n; n=1+1; echo $n; }; f; n=1+1; echo $n", b"2\n1+1\n2\n"),
+))
+def test_integers(text, expected):
+    out = io.BytesIO()
+    parse(text).execute(make_env(), output=out)
+    assert out.getvalue() == expected
+
+
+@pytest.mark.parametrize("text", ("declare -i k=2x", "declare -i k; k='1 +'", "declare -i k=1; k+=*"))
+def test_integers_bad_expression(text):
+    with pytest.raises(ShellError):
+        parse(text).execute(make_env())
+
+
+def test_integers_script_error(tmp_path, capfd):
+    """ A script stops at a bad expression, with a message rather than a traceback """
+    script = tmp_path / "s.sh"
+    script.write_text("declare -i n=1; echo $n; n=2x; echo after\n")
+    assert run_script(str(script), [], cache=False) == 1
+    out, err = capfd.readouterr()
+    assert (out, err) == ("1\n", "psh: {}: 2x: syntax error in expression\n".format(script))
+
+
+def test_integers_stored():
+    """ An integer variable holds an int, which arithmetic reads and writes as it is """
+    env = make_env()
+    parse("declare -i i s; for ((i = 0; i < 4; i++)); do ((s += i)); done; t=$s").execute(env)
+    assert env.vars.bindings == {"i": [4], "s": [6], "t": ["6"]}
@@ -0,0 +1,138 @@
+import glob
+import importlib
+import os
+
+import pytest
+
+from psh.parser import command_sequence, parse, ParseError
+from psh.local import make_env
+
+
+@pytest.mark.parametrize("text", (
+        "cat foo bar",
+        "'hello'",
+        "'hel\nlo'",
+        "'hello'' world'",
+        "$(cat $foo $bar)",
+        "a=2",
+        "a=1 b=2 echo $a$b",
+        "a=2 echo b=1",
+        "a+=2 b+=$a echo c+=1",
+        "a; b",
+        "a | b",
+        "a |\n b",
+        "a; b\nc;\nd",
+        "cat \\\nfoo\\\nbar",
+        "cat a>b",
+        "echo a.b c-d 1ab",
+        "while a; do b; c; done",
+        "while\n\na\n\nb\n\ndo\n\nc\n\nd\n\ndone\n\n",
+        "if a; then b; fi",
+        "if a; then b; else c; fi",
+        "if a; then b; elif c; then d; elif e; then f; else g; fi",
+        "\n\nif\n\na\n\nb\n\nthen\n\nc\n\nd\n\nelif\n\ne\n\nf\n\nthen\n\ng\n\nh\n\nelse\n\ni\n\nj\n\nfi\n\n",
+        "0</dev/null while a; do b; done >>/tmp/x",
+        "0</dev/null if a; then b; fi >>/tmp/x",
+        "0</dev/null cat", "1>/dev/null cat", "2>>/dev/null cat", "3>&- cat", "0<&- cat", "2>&1 cat",
+        "0<&6 cat", "</dev/null cat", ">/dev/null cat", ">>/dev/null cat", ">&- cat", "<&- cat", ">&2 cat",
+        "cat <<'EOF'\nhello $world\nEOF\n",
+        "cat <<\"EOF\"\nhello $world\nEOF\n",
+        "cat <<EOF\nhello $world\nEOF\n",
+        "cat <<'EOF'\nhello $world\nEOF",
+        "cat <<EOF; cat <<'END'\none\nEOF\ntwo\nEND\n",
+        "cat <<EOF\nEOF\n",
+        "for i; do done",
+        "for i\ndo\ndone",
+        "for i in a b c; do foo; done",
+        ">/dev/null for i in a b c\n\ndo\n\nfoo\n\nbar\n\ndone </dev/null",
+        "case a in esac",
+        "case a in (x) ;; esac",
+        "case a in x) foo ;; *) bar;; esac",
+        "case a in\nx)\nfoo\n;;\n*)\nbar;;\nesac",
+        "{}", "echo {}", "{ echo }", "{ ; echo ; }", "{\n echo \n }",
+        "f() { echo }",
+        "a\n  f() { b; }",
+        '"hello world"', 'hello" world"', "", '""', '"$a $b"', '"a\\nb\\t\\"c\\\nd"',
+        "cat $a", 'cat "$a"', "cat ${a}", "cat '$a'", "cat '${a}'", 'cat "${a}"',
+        "cat ${a#x}", "cat ${a##x}", 'cat ${a##"x"}', "cat ${a##'x'}", "cat ${a##\\x}", "cat ${a%%*.c}",
+        "cat $1 $# $? $@ ${10}",
+        "`foo`", r"`\`foo\``", "``", "echo `echo \\$a`",
+        '"*"', "'*'", "\\*", "*", "**/*.py", "echo a*b",
+        "whilex", "ifconfig -a", "done_it", "for_each x",
+        "echo $((a + b * cd))", "echo $(( (a + b) * cd ))", 'echo "$((5-4-3))"',
+), ids=lambda x: x.replace(" ", "_").replace("\n", "%"))
+def test_same_tree(text):
+    assert parse(text, engine="fast") == command_sequence.parse(text)
+
+
+@pytest.mark.parametrize("text", (
+        "$(cat foo",
+        "while",
+        "cat <<'EOF'\nhello $world\n",
+        "cat <<\"EOF\"",
+        "cat <<EOF",
+        "cat <<'EOF'\nEO",
+        "cat '' x",
+        "if a; then b",
+        "case a in x) foo esac",
+        "echo 'unterminated",
+        'echo "unterminated',
+        "a & b",
+        "`echo",
+), ids=lambda x: x.replace(" ", "_").replace("\n", "%"))
+def test_same_failure(text):
+    with pytest.raises(ParseError):
+        command_sequence.parse(text)
+    with pytest.raises(ParseError):
+        parse(text, engine="fast")
+
+
+@pytest.mark.parametrize(("text", "expected"), (
+        ("echo $((a + b * cd))", "7"),
+        ("echo $(( (a + b) * cd ))", "9"),
+        ("echo $((5-4-3))", "-2"),
+        ('echo "$((cd / b))"', "1"),
+))
+def test_same_arithmetic(text, expected):
+    for engine in ("parsy", "fast"):
+        env = make_env()
+        env.update({"a": "1", "b": "2", "cd": "3"})
+        assert parse(text, engine=engine).evaluate(env) == expected
+
+
+def test_unknown_engine():
+    with pytest.raises(ValueError):
+        parse("echo", engine="yacc")
+
+
+def corpus():
+    """ Every `text` the parser tests are parametrized with """
+    here = os.path.dirname(__file__)
+    paths = glob.glob(os.path.join(here, "test_parse_*.py")) + glob.glob(os.path.join(here, "test_parser*.py"))
+    texts = []
+    for path in sorted(paths):
+        module = importlib.import_module("test." + os.path.basename(path)[:-3])
+        for name, test in sorted(vars(module).items()):
+            for mark in getattr(test, "pytestmark", ()) if name.startswith("test") else ():
+                names = mark.args[0]
+                names = [n.strip() for n in names.split(",")] if isinstance(names, str) else list(names)
+                if mark.name != "parametrize" or "text" not in names:
+                    continue
+                for values in mark.args[1]:
+                    text = values if len(names) == 1 else values[names.index("text")]
+                    if text not in texts:
+                        texts.append(text)
+    return texts
+
+
+def outcome(text, engine):
+    try:
+        return parse(text, engine=engine)
+    except ParseError:
+        return ParseError
+
+
+@pytest.mark.parametrize("text", corpus(), ids=lambda x: x.replace(" ", "_").replace("\n", "%"))
+def test_corpus(text):
+    """ The engines agree, tree for tree and failure for failure, over the parser tests' inputs """
+    assert outcome(text, "fast") == outcome(text, "parsy")
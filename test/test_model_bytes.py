@@ -0,0 +1,48 @@
+import io
+import os
+
+import pytest
+
+from psh.text import decode, encode
+from psh.parser import parse
+from psh.local import make_env
+from psh.cmd import run_script
+
+from .test_glob import make_dirs, cwd, TOUCH
+
+# Not UTF-8
+NAME = b"caf\xe9"
+
+
+def run(text):
+    out = io.BytesIO()
+    parse(text).execute(make_env(), output=out)
+    return out.getvalue()
+
+
+@pytest.mark.parametrize("data", (b"", b"plain", "café".encode(), NAME, b"\xff\xfe\x00", b"\xe2\x82"))
+def test_round_trip(data):
+    assert encode(decode(data)) == data
+
+
+def test_filenames():
+    """ A name that isn't UTF-8 comes out of a glob, through a variable, as it went in """
+    with make_dirs(TOUCH, os.fsdecode(NAME)) as d:
+        with cwd(d):
+            assert run("for f in *; do x=$f; echo $x; done") == NAME + b"\n"
+            assert run("cat " + decode(NAME)) == b""
+
+
+def test_command_output():
+    """ The output of a command substitution, and a heredoc made from it, keep their bytes """
+    assert run("x=$(printf '\\351\\n'); echo \"<$x>\"") == b"<\xe9>\n"
+    assert run("x=$(printf 'a\\351b'); cat <<EOF\n$x\nEOF\n") == b"a\xe9b\n"
+    assert run("for x in $(printf 'a\\351 \\342\\202'); do echo $x; done") == b"a\xe9\n\xe2\x82\n"
+
+
+def test_script(tmp_path, capfdbinary):
+    """ A script's own text needn't be UTF-8 """
+    script = tmp_path / "s.sh"
+    script.write_bytes(b"echo " + NAME + b"\n")
+    assert run_script(str(script), [], cache=False) == 0
+    assert capfdbinary.readouterr().out == NAME + b"\n"
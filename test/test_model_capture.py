@@ -0,0 +1,63 @@
+import io
+
+import pytest
+
+from psh.parser import parse
+from psh.local import make_env
+from psh.text import Capture, Captured
+import psh.text
+
+
+@pytest.fixture
+def spill(monkeypatch):
+    """ Spill any command output over 8 bytes to a file """
+    monkeypatch.setattr(psh.text, "SPILL_SIZE", 8)
+
+
+def run(text, env=None):
+    out = io.BytesIO()
+    parse(text).execute(make_env() if env is None else env, output=out)
+    return out.getvalue()
+
+
+@pytest.mark.parametrize("data", (b"", b"short\n", b"a longer piece of output\n\n\n", b"\xff" * 20, b"\n" * 20))
+@pytest.mark.parametrize("limit", (0, 8, 1000))
+def test_capture(data, limit):
+    capture = Capture(limit)
+    for i in range(0, len(data), 3):
+        capture.write(data[i:i + 3])
+    value = capture.value()
+    assert isinstance(value, Captured) == (len(data) > limit)
+    assert value == data.rstrip(b"\n").decode("utf-8", "surrogateescape")
+
+
+@pytest.mark.parametrize(("text", "expected"), (
+    ("x=$(echo some long output); y=$x; echo \"$y\"", b"some long output\n"),
+    ("x=$(echo some long output); echo $x!", b"some long output!\n"),
+    ("x=$(echo some long output); for w in $x; do echo $w; done", b"some\nlong\noutput\n"),
+    ("x=$(echo some long output); echo ${x%output}", b"some long\n"),
+    ("x=$(echo 123456789012); echo $((x + 1))", b"123456789013\n"),
+    ("x=$(echo some long output); cat <<EOF\n<$x>\nEOF\n", b"<some long output>\n"),
+    ("x=$(cat <<EOF\nsome long output\n\nEOF\n); echo \"[$x]\"", b"[some long output]\n"),
+    ("x=$(echo some long output); case $x in some*) echo yes;; esac", b"yes\n"),
+    ("x=$(echo some long output); y=$(echo \"$x\"); echo \"$y\"", b"some long output\n"),
+    ("x=$(echo some long output); x+=!; x+=$(echo and more); echo \"$x\"", b"some long output!and more\n"),
+), ids=lambda x: x.replace(" ", "_") if isinstance(x, str) else None)
+def test_spilled(spill, text, expected):
+    assert run(text) == expected
+
+
+def test_kept_mapped(spill):
+    """ A large output is held in a variable as it was captured, not as a str """
+    env = make_env()
+    run("x=$(echo some long output); y=$x", env)
+    assert isinstance(env["x"], Captured) and env["y"] is env["x"]
+
+
+def test_external_streams():
+    """ An external command's output and errors both arrive, however much there is of them """
+    out, err = io.BytesIO(), io.BytesIO()
+    parse("sh -c 'head -c 300000 /dev/zero; head -c 200000 /dev/zero >&2; echo done'").execute(
+        make_env(), output=out, error=err)
+    assert out.getvalue() == b"\0" * 300000 + b"done\n"
+    assert err.getvalue() == b"\0" * 200000
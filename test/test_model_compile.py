@@ -0,0 +1,86 @@
+import io
+import pickle
+
+import pytest
+
+import psh.model
+from psh.glob import STAR
+from psh.parser import command, parse
+from psh.model import ConstantString, VarRef, compiled
+from psh.local import make_env
+
+
+@pytest.mark.parametrize(("text", "expected"), (
+    ("echo a b", b"a b\n"),
+    ("x=1; echo $x", b"1\n"),
+    ("x=1; if false; then echo a; elif true; then echo $x; else echo c; fi", b"1\n"),
+    ("for i in a b c; do echo $i; if [ $i = b ]; then break; fi; done", b"a\nb\n"),
+    ("for i in a b c; do if [ $i = b ]; then continue; fi; echo $i; done", b"a\nc\n"),
+    ("s=0; for ((i = 0; i < 4; i++)); do ((s += i)); done; echo $s", b"6\n"),
+    ("i=0; while [ $i != 3 ]; do i=$((i + 1)); echo $i; done", b"1\n2\n3\n"),
+    ("for i in a b; do for j in 1 2; do echo $i$j; continue 2; done; done", b"a1\nb1\n"),
+    ("f() { echo in $1; }; f x; f y", b"in x\nin y\n"),
+), ids=lambda x: x.replace(" ", "_") if isinstance(x, str) else None)
+def test_compiled(text, expected):
+    cmd = parse(text)
+    for _ in range(2):
+        env = make_env()
+        out = io.BytesIO()
+        cmd.execute(env, output=out)
+        assert out.getvalue() == expected
+
+
+def test_reused():
+    cmd = parse("for i in a b; do echo $i; done")
+    run = compiled(cmd)
+    assert compiled(cmd) is run
+    cmd.execute(make_env(), output=io.BytesIO())
+    assert compiled(cmd) is run
+
+
+def test_pickle():
+    cmd = parse("for i in a b; do echo $i; done")
+    cmd.execute(make_env(), output=io.BytesIO())
+    assert not hasattr(pickle.loads(pickle.dumps(cmd)), "_compiled")
+    assert pickle.loads(pickle.dumps(cmd)) == cmd
+
+
+def test_late_builtin():
+    """ The command to run is looked up each time, so a builtin added after the first run is found """
+    cmd = parse("greet")
+    env = make_env()
+    with pytest.raises(FileNotFoundError):
+        cmd.execute(env)
+
+    def greet(*args, env=None, stdin=None, stdout=None, stderr=None):
+        stdout.write(b"hello\n")
+        return 0
+    env.builtins["greet"] = greet
+    out = io.BytesIO()
+    assert cmd.execute(env, output=out) == 0
+    assert out.getvalue() == b"hello\n"
+
+
+@pytest.mark.parametrize(("text", "folded", "argv"), (
+    ("echo -la /etc/hosts", [(ConstantString("echo"),), (ConstantString("-la"),), (ConstantString("/etc/hosts"),)],
+     ("echo", "-la", "/etc/hosts")),
+    ("echo a=b 'c d'\"\"", [(ConstantString("echo"),), (ConstantString("a=b"),), (ConstantString("c d"),)],
+     ("echo", "a=b", "c d")),
+    ("echo x$y.z", [(ConstantString("echo"),), (ConstantString("x"), VarRef(ConstantString("y")), ConstantString(".z"))],
+     None),
+    ("ls *.py", [(ConstantString("ls"),), (STAR, ConstantString(".py"))], None),
+), ids=lambda x: x.replace(" ", "_") if isinstance(x, str) else None)
+def test_folded(text, folded, argv):
+    cmd = command.parse(text)
+    assert [word.folded() for word in cmd] == folded
+    assert cmd.argv == argv
+
+
+def test_constant_argv(monkeypatch):
+    """ A command of constant words is run without expanding them """
+    cmd = parse("echo a b; echo c d")
+    monkeypatch.setattr(psh.model, "fields", None)
+    out = io.BytesIO()
+    cmd.execute(make_env(), output=out)
+    cmd[0].execute(make_env(), output=out)
+    assert out.getvalue() == b"a b\nc d\na b\n"
@@ -0,0 +1,98 @@
+import io
+
+import pytest
+
+from psh.parser import parse
+from psh.local import make_env
+
+from .test_glob import make_dirs, cwd, TOUCH
+
+
+def make_args_env():
+    env = make_env()
+
+    def args(*args, env=None, stdin=None, stdout=None, stderr=None):
+        stdout.write(repr(list(args)).encode() + b"\n")
+        return 0
+    env.builtins["args"] = args
+    return env
+
+
+@pytest.mark.parametrize(("text", "expected"), (
+    ("x='a  b'; args $x", ['a', 'b']),
+    ("x='a  b'; args \"$x\"", ['a  b']),
+    ("x='a  b'; args a$x\"c\"", ['aa', 'bc']),
+    ("x=' a '; args [$x]", ['[', 'a', ']']),
+    ("x=''; args $x", []),
+    ("x=''; args \"$x\"", ['']),
+    ("x=''; args $x\"\"", ['']),
+    ("x=''; args a $x b", ['a', 'b']),
+    ("IFS=:; x='a::b:'; args $x", ['a', '', 'b']),
+    ("IFS=:; x=':a'; args $x", ['', 'a']),
+    ("IFS=' :'; x=' a : b '; args $x", ['a', 'b']),
+    ("IFS=''; x='a b'; args $x", ['a b']),
+    ("args $(echo 1 2) \"$(echo 3 4)\"", ['1', '2', '3 4']),
+    ("args $((1 + 2))x", ['3x']),
+    ("x='a b'; args ${x%b}", ['a']),
+    ("x='a b'; args 'a b' \"$x\"$x", ['a b', 'a ba', 'b']),
+), ids=lambda x: x.replace(" ", "_") if isinstance(x, str) else None)
+def test_fields(text, expected):
+    out = io.BytesIO()
+    parse(text).execute(make_args_env(), output=out)
+    assert out.getvalue() == repr(expected).encode() + b"\n"
+
+
+def test_local():
+    """ The value in `local name=value` isn't split """
+    out = io.BytesIO()
+    parse("f() { local y=$1; args $y \"$y\"; }; f 'a b'").execute(make_args_env(), output=out)
+    assert out.getvalue() == b"['a', 'b', 'a b']\n"
+
+
+def test_evaluated_once():
+    """ A command substitution in a glob runs once """
+    env = make_args_env()
+    calls = []
+
+    def tick(*args, env=None, stdin=None, stdout=None, stderr=None):
+        calls.append(args)
+        stdout.write(b"a")
+        return 0
+    env.builtins["tick"] = tick
+    out = io.BytesIO()
+    with make_dirs("ab", "ac", "b", TOUCH, "ad.txt") as d:
+        with cwd(d):
+            parse("args $(tick)*").execute(env, output=out)
+    assert out.getvalue() == b"['ab', 'ac', 'ad.txt']\n"
+    assert len(calls) == 1
+
+
+def test_many():
+    env = make_args_env()
+    out = io.BytesIO()
+    parse("x='{}'; args $x".format(" ".join(str(i) for i in range(10000)))).execute(env, output=out)
+    assert out.getvalue() == repr([str(i) for i in range(10000)]).encode() + b"\n"
+
+
+@pytest.mark.parametrize(("text", "expected"), (
+    ("args {1..4}", ['1', '2', '3', '4']),
+    ("args {4..1..2} {a..c}", ['4', '2', 'a', 'b', 'c']),
+    ("args {08..11}", ['08', '09', '10', '11']),
+    ("args x{a,b}{1..2}y", ['xa1y', 'xa2y', 'xb1y', 'xb2y']),
+    ("args {a,{b,c}d,}", ['a', 'bd', 'cd']),
+    ("x='p q'; args {$x,\"$x\"}", ['p', 'q', 'p q']),
+    ("args '{a,b}' \"{1..2}\"", ['{a,b}', '{1..2}']),
+    ("x={a,b}; args $x", ['{a,b}']),
+), ids=lambda x: x.replace(" ", "_") if isinstance(x, str) else None)
+def test_braces(text, expected):
+    out = io.BytesIO()
+    parse(text).execute(make_args_env(), output=out)
+    assert out.getvalue() == repr(expected).encode() + b"\n"
+
+
+def test_braces_lazy():
+    """ A huge range is counted out as the loop goes, not made up front """
+    out = io.BytesIO()
+    parse("for i in {1..1000000000000}; do for j in x{a..z}{1..1000000}; do args $i $j; break 2; done; done").execute(
+        make_args_env(), output=out)
+    assert out.getvalue() == b"['1', 'xa1']\n"
@@ -0,0 +1,68 @@
+import io
+import pathlib
+
+import pytest
+
+from psh.parser import parse
+from psh.local import make_env
+from psh.glob import delimiter, segments, DEFAULT_IFS
+
+from .test_glob import make_dirs, cwd
+
+
+def run(text):
+    out = io.BytesIO()
+    parse(text).execute(make_env(), output=out)
+    return out.getvalue()
+
+
+@pytest.mark.parametrize(("text", "expected"), (
+    ("x='a  b'; for i in $x c; do echo $i; done", b"a\nb\nc\n"),
+    ("x='a  b'; for i in \"$x\"; do echo $i; done", b"a b\n"),
+    ("for i in $(echo a; echo b c); do echo $i; done", b"a\nb\nc\n"),
+    ("for i in \"$(echo a; echo b c)\"; do echo $i; done", b"a b c\n"),
+    ("IFS=:; for i in $(echo 'a :b::c'); do echo \"<$i>\"; done", b"<a >\n<b>\n<>\n<c>\n"),
+    ("for i in $(echo a; echo; echo); do echo \"<$i>\"; done", b"<a>\n"),
+    ("for i in $(while :; do echo x y; done); do echo $i; break; done", b"x\n"),
+    ("for i in $((1 + 2)) x$((3 * 4)); do echo $i; done", b"3\nx12\n"),
+    ("x='a  b'; for i in ${x} \"${x}\"; do echo \"<$i>\"; done", b"<a>\n<b>\n<a  b>\n"),
+))
+def test_for_words(text, expected):
+    """ The words of a `for` are expanded fully, and a `$(...)` is read as it's written """
+    assert run(text) == expected
+
+
+@pytest.mark.parametrize("ifs", (DEFAULT_IFS, ":", " :", "\n"))
+@pytest.mark.parametrize("text", ("a b  c\n", "  a :b::c : \n\n", "a\n\nb\n", "abc", "x:y \n z"))
+def test_segments(ifs, text):
+    """ However the output is cut up as it arrives, no run of separators is split between segments """
+    pattern = delimiter(ifs)
+    for size in range(1, len(text) + 1):
+        chunks = [text[i:i + size] for i in range(0, len(text), size)]
+        pieces = list(segments(iter(chunks), ifs))
+        assert "".join(pieces) == text.rstrip("\n")
+        assert all(piece and not piece.endswith(tuple(ifs + "\n")) for piece in pieces[:-1])
+        assert sum(len(pattern.split(piece)) // 2 for piece in pieces) == len(pattern.split(text.rstrip("\n"))) // 2
+
+
+def test_failed_substitution(capfd):
+    """ A `$(...)` that can't run to the end fails the loop, rather than looking like one with no output """
+    with pytest.raises(RuntimeError):
+        run("for i in $(echo a; break 1 2); do echo $i; done")
+    assert "duff break" in capfd.readouterr().err
+
+
+def test_glob_stops_early(monkeypatch):
+    """ `break` stops the walk of the tree that a glob makes """
+    listed = []
+    iterdir = pathlib.Path.iterdir
+
+    def spy(self):
+        listed.append(self.name)
+        return iterdir(self)
+    monkeypatch.setattr(pathlib.Path, "iterdir", spy)
+
+    with make_dirs(*("d{}/e{}".format(i, j) for i in range(10) for j in range(10))) as d:
+        with cwd(d):
+            assert run("for f in **; do echo $f; break; done") == b"d0\n"
+    assert len(listed) < 5
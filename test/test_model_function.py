@@ -1,8 +1,12 @@
 import logging
 
+import pytest
+
 from psh.model import (Word, ConstantString, Token, Id, VarRef,
                        Command, CommandSequence, CommandPipe, While, If, Function)
 from psh.local import make_env
+from psh.parser import parse
+from psh.cache import PARSE_CACHE
 
 LOG = logging.getLogger(__name__)
 
@@ -49,3 +53,41 @@ def test_return():
 
     assert cmd.evaluate(env) == ""
     assert env['?'] == "30"
+
+
+def test_lazy_body_parsed_once():
+    env = make_env()
+    seen = []
+
+    def parse_body(text):
+        seen.append(text)
+        return parse(text)
+
+    PARSE_CACHE.clear()
+    f = Function(Id("f"), source=ConstantString(" echo $1; "), parse=parse_body)
+    f.execute(env)
+    cmd = parse("f one; f two")
+    assert seen == []
+    assert cmd.evaluate(env) == "one\ntwo"
+    assert seen == [" echo $1; "]
+
+
+def test_define_and_call():
+    env = make_env()
+    cmd = parse("greet() { echo hello $1; }\ngreet world")
+    assert cmd.evaluate(env) == "hello world"
+
+
+@pytest.mark.parametrize(("text", "expected"), (
+    ("n=5000; f() { if ((n > 0)); then ((n--)); f $n; fi; }; f; echo $n", "0"),
+    ("n=5000; f() { ((n--)); if ((n > 0)); then g; else return 7; fi; }; g() { f; }; f; echo $? $n", "7 0"),
+    ("f() { local x=$1; g b c; }; g() { echo $x $# $1; }; f a; echo $x", "a 2 b\n1"),
+    ("f() { g; echo after; }; g() { echo in; }; f", "in\nafter"),
+    ("f() { if false; then :; else g $1 2>/dev/null; fi; }; g() { echo $1; return 2; }; f a; echo $?", "a\n2"),
+))
+def test_tail_calls(text, expected):
+    """ A function whose last command calls another function makes that call in its own frame """
+    env = make_env()
+    env['x'] = "1"
+    assert parse(text).evaluate(env) == expected
+    assert env.vars.unwind is None and env.vars.calls == 0
@@ -5,6 +5,7 @@ from .test_glob import make_dirs, cwd, TOUCH
 from psh.model import Command, Word, Id, ConstantString
 from psh.local import make_env
 from psh.glob import STAR
+from psh.parser import parse
 
 
 def test_run_a_command():
@@ -29,3 +30,18 @@ def test_fixed_pieces():
     with make_dirs("a", "b", "c", "d", TOUCH, "e", "f", "g") as d:
         with cwd(d):
             assert cmd.evaluate(env) == "a/.. b/.. c/.. d/.."
+
+
+@pytest.mark.parametrize(("text", "expected"), (
+    ("x=*; echo \"$x\"", "*"),
+    ("x=a*; echo \"$x\"", "a*"),
+    ("x=**/b; echo \"$x\"", "**/b"),
+    ("x=a*; case $x in a\\*) echo star;; *) echo glob;; esac", "star"),
+))
+def test_assigned_globs(text, expected):
+    """ A glob in an assignment is kept as text, not matched """
+    with make_dirs("a", "ab") as d:
+        with cwd(d):
+            env = make_env()
+            assert parse(text).evaluate(env) == expected
+            assert type(env["x"]) is str
@@ -0,0 +1,44 @@
+import io
+
+import pytest
+
+from psh.parser import parse
+from psh.model import Break, Continue, Function
+from psh.local import make_env
+
+
+@pytest.mark.parametrize(("text", "expected"), (
+    ("for i in a b c; do if [ $i = b ]; then continue; fi; echo $i; done", b"a\nc\n"),
+    ("i=0; while ((i < 4)); do ((i++)); if ((i == 2)); then continue; fi; echo $i; done", b"1\n3\n4\n"),
+    ("for ((i = 0; i < 4; i++)); do if ((i == 1)); then continue; fi; echo $i; done", b"0\n2\n3\n"),
+    ("for i in a b; do for ((j = 0; j < 3; j++)); do echo $i$j; continue 2; done; echo no; done", b"a0\nb0\n"),
+    ("for i in a b; do while :; do break 2; done; echo no; done; echo out", b"out\n"),
+    ("for i in a b; do for j in c d; do break 5; done; done; echo $i$j", b"ac\n"),
+    ("i=0; while ((i++ < 3)); do echo $i; if ((i >= 2)); then break; fi; done", b"1\n2\n"),
+    ("f() { for j in a b; do return 3; done; echo no; }; f; echo $?", b"3\n"),
+    ("f() { break; }; for i in a b; do f; echo no; done; echo $i", b"a\n"),
+    ("for i in a b; do x=$(break; echo in); echo $i$x; done", b"a\nb\n"),
+    ("g() { return 4; }; f() { for i in a b; do g; echo $i$?; done; }; f", b"a4\nb4\n"),
+), ids=lambda x: x.replace(" ", "_") if isinstance(x, str) else None)
+def test_unwind(text, expected, monkeypatch):
+    """ Loops and functions are left without raising any exceptions """
+    def fail(*args, **kwargs):
+        raise AssertionError("raised")
+    for cls in (Break, Continue, Function.Return):
+        monkeypatch.setattr(cls, "__init__", fail)
+    env = make_env()
+    out = io.BytesIO()
+    parse(text).execute(env, output=out)
+    assert out.getvalue() == expected
+    assert env.vars.unwind is None and env.vars.loops == env.vars.calls == 0
+
+
+@pytest.mark.parametrize(("text", "exception"), (
+    ("break", Break),
+    ("continue 2", Continue),
+    ("return 1", Function.Return),
+))
+def test_outside(text, exception):
+    """ Outside any loop or function, these still raise """
+    with pytest.raises(exception):
+        parse(text).execute(make_env(), output=io.BytesIO())
@@ -0,0 +1,69 @@
+import pickle
+
+import pytest
+
+from psh.fastparse import parse as fast_parse
+from psh.parser import parse
+from psh.model import ConstantString, SourceString, Token, Id, Word, Command, CommandSequence, VarRef
+
+from .test_stream import SCRIPT
+
+
+@pytest.mark.parametrize("text", (
+    "echo a b",
+    "x=1 y=$x cat <in >out 2>&1",
+    'echo "a $(echo hi) $((1 + 2)) ${x%y}"',
+    SCRIPT,
+), ids=lambda x: x.split("\n")[0].replace(" ", "_"))
+def test_no_dict(text):
+    """ No node carries a __dict__ """
+    def walk(node):
+        if isinstance(node, (list, tuple)):
+            for item in node:
+                yield from walk(item)
+        elif hasattr(node, "_fields"):
+            yield node
+            for k in node.fields():
+                yield from walk(getattr(node, k, None))
+
+    for node in walk(parse(text)):
+        assert not hasattr(node, "__dict__"), node
+    assert fast_parse(text) == parse(text)
+
+
+def test_interned():
+    assert ConstantString("x") is ConstantString("x")
+    assert Token("") is Token("")
+    assert Id("x") is not ConstantString("x")
+    assert pickle.loads(pickle.dumps(Id("x"))) is Id("x")
+    assert SourceString("a x b", 2, 1) is not ConstantString("x")
+
+
+@pytest.mark.parametrize(("a", "b"), (
+    (ConstantString("x"), Id("x")),
+    (SourceString("a x b", 2, 1), ConstantString("x")),
+    (Word([Id("echo")]), Word([ConstantString("echo")])),
+    (Command([Word([Id("a")])]), CommandSequence([Command([Word([Id("a")])])])[0]),
+    (VarRef(ConstantString("x"), double_quoted=True), VarRef(ConstantString("x"), double_quoted=True)),
+))
+def test_hash(a, b):
+    """ Nodes that are equal hash equally """
+    assert a == b
+    assert hash(a) == hash(b)
+
+
+def test_keys():
+    """ Trees are usable as keys, whichever engine parsed them """
+    trees = [parse(text) for text in SCRIPT.split("\n\n")]
+    table = {tree: i for i, tree in enumerate(trees)}
+    for i, text in enumerate(SCRIPT.split("\n\n")):
+        assert table[fast_parse(text)] == i
+    assert fast_parse("echo a") not in table
+
+
+def test_pickle():
+    tree = parse(SCRIPT)
+    hash(tree)
+    again = pickle.loads(pickle.dumps(tree))
+    assert not hasattr(again, "_hash")
+    assert again == tree and hash(again) == hash(tree)
@@ -0,0 +1,61 @@
+import io
+import os
+
+import pytest
+
+from psh.parser import command_sequence, expr, parse
+from psh.model import (Word, Id, ConstantString, CommandSequence, Command, ForArith, ArithCommand, ArithNumber,
+                       ArithVariable, ArithBinary, ArithUnary, ArithAssign, ArithIncrement, RedirectTo)
+from psh.local import make_env
+
+
+i = ArithVariable("i")
+devnull = Word([ConstantString("/dev/null")])
+
+
+@pytest.mark.parametrize(("text", "expected"), (
+    ("i < 3 && !j", ArithBinary("&&", ArithBinary("<", i, ArithNumber(3)), ArithUnary("!", ArithVariable("j")))),
+    ("a || b && c == d", ArithBinary("||", ArithVariable("a"), ArithBinary(
+        "&&", ArithVariable("b"), ArithBinary("==", ArithVariable("c"), ArithVariable("d"))))),
+    ("i = j += 2", ArithAssign("i", "=", ArithAssign("j", "+=", ArithNumber(2)))),
+    ("i == 2", ArithBinary("==", i, ArithNumber(2))),
+    ("i++ + ++i", ArithBinary("+", ArithIncrement("i", "++"), ArithIncrement("i", "++", prefix=True))),
+    ("-i % -2", ArithBinary("%", ArithUnary("-", i), ArithNumber(-2))),
+), ids=lambda x: x.replace(" ", "_") if isinstance(x, str) else None)
+def test_expr(text, expected):
+    assert expr.parse(text) == expected
+
+
+@pytest.mark.parametrize(("text", "expected"), (
+    ("((i++))", CommandSequence([ArithCommand(ArithIncrement("i", "++"))])),
+    ("(( i >= 2 )) >/dev/null", CommandSequence([
+        ArithCommand(ArithBinary(">=", i, ArithNumber(2))).with_redirect(RedirectTo(1, devnull))])),
+    ("for ((i = 0; i < 3; i++)); do foo; done", CommandSequence([
+        ForArith(ArithAssign("i", "=", ArithNumber(0)), ArithBinary("<", i, ArithNumber(3)), ArithIncrement("i", "++"),
+                 CommandSequence([Command([Word([Id("foo")])])]))])),
+    ("for ((;;))\ndo\nfoo\ndone", CommandSequence([
+        ForArith(None, None, None, CommandSequence([Command([Word([Id("foo")])])]))])),
+), ids=lambda x: x.replace(" ", "_") if isinstance(x, str) else None)
+def test_commands(text, expected):
+    assert command_sequence.parse(text) == expected
+    assert parse(text, engine="fast") == expected
+
+
+@pytest.mark.parametrize(("text", "expected"), (
+    ("s=0; for ((i = 0; i < 5; i++)); do ((s += i)); done; echo $s $i", "10 5"),
+    ("for ((i = 0; ; i++)); do if ((i == 3)); then break; fi; echo $i; done", "0\n1\n2"),
+    ("for ((i = 0; i < 5; i++)); do if ((i % 2)); then continue; fi; echo $i; done", "0\n2\n4"),
+    ("((0)); echo $?; ((2 > 1)); echo $?", "1\n0"),
+    ("echo $((-7 % 3)) $((7 % -3)) $((1 < 2)) $((!5)) $((i++)) $i $((--i))", "-1 1 1 0 0 1 0"),
+    ("x=9; ((x /= 3)); ((x *= 2)); echo $x", "6"),
+    ("echo $((0 && (y = 1))) $((1 || (y = 1))) $((1 && (y = 2))) $y", "0 1 1 2"),
+), ids=lambda x: x.replace(" ", "_") if isinstance(x, str) else None)
+def test_execute(text, expected, monkeypatch):
+    def no_fork():
+        raise AssertionError("forked")
+    monkeypatch.setattr(os, "fork", no_fork)
+
+    env = make_env()
+    out = io.BytesIO()
+    parse(text).execute(env, output=out)
+    assert out.getvalue().decode().rstrip("\n") == expected
@@ -0,0 +1,44 @@
+import io
+
+import pytest
+
+from psh.parser import parse
+from psh.local import make_env
+from psh.model import Word, ConstantString, Id, VarRef, Command, CommandSequence
+from psh.glob import BraceList, BraceRange
+
+
+def cmd(*words):
+    return CommandSequence([Command([Word([Id("echo")])] + list(words))])
+
+
+@pytest.mark.parametrize(("text", "expected"), (
+    ("echo {1..10}", cmd(Word([BraceRange("1", "10")]))),
+    ("echo {-3..03..2}", cmd(Word([BraceRange("-3", "03", "2")]))),
+    ("echo x{a..e}", cmd(Word([Id("x"), BraceRange("a", "e")]))),
+    ("echo {a,b}", cmd(Word([BraceList([Word([Id("a")]), Word([Id("b")])])]))),
+    ("echo {,$x.c}", cmd(Word([BraceList([Word([]), Word([VarRef(ConstantString("x")), ConstantString(".c")])])]))),
+    ("echo {a,{1..2}}", cmd(Word([BraceList([Word([Id("a")]), Word([BraceRange("1", "2")])])]))),
+    ("echo {}", cmd(Word([ConstantString("{}")]))),
+), ids=lambda x: x.replace(" ", "_") if isinstance(x, str) else None)
+@pytest.mark.parametrize("engine", ("fast", "parsy"))
+def test_braces(text, expected, engine):
+    assert parse(text, engine=engine) == expected
+
+
+@pytest.mark.parametrize(("text", "expected"), (
+    ("echo {a}", b"{a}\n"),
+    ("echo {1..a}", b"{1..a}\n"),
+    ("echo {}", b"{}\n"),
+    ("echo {1..}", b"{1..}\n"),
+    ("echo {a,b", b"{a,b\n"),
+    ("echo {", b"{\n"),
+    ("x='p  q'; echo a{$x}b", b"a{p q}b\n"),
+    ("echo {{a,b}} {a,{b}}", b"{a} {b} a {b}\n"),
+), ids=lambda x: x.replace(" ", "_") if isinstance(x, str) else None)
+@pytest.mark.parametrize("engine", ("fast", "parsy"))
+def test_not_braces(text, expected, engine):
+    """ Without a comma or a range, a brace isn't an expansion but text, as is one that isn't closed """
+    out = io.BytesIO()
+    parse(text, engine=engine).execute(make_env(), output=out)
+    assert out.getvalue() == expected
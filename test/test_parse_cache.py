@@ -0,0 +1,68 @@
+import pytest
+
+from psh.cache import ParseCache, PARSE_CACHE
+from psh.parser import parse, parse_cached
+from psh.local import make_env
+
+
+def test_hits_and_misses():
+    cache = ParseCache()
+    a = cache.get("echo a", parse)
+    assert cache.get("echo a", parse) is a
+    assert cache.get("echo b", parse) is not a
+    assert cache.stats() == {"hits": 1, "misses": 2, "entries": 2, "size": 12}
+
+
+def test_evicts_least_recently_used():
+    cache = ParseCache(max_size=12)
+    cache.get("echo a", parse)
+    cache.get("echo b", parse)
+    cache.get("echo a", parse)
+    cache.get("echo c", parse)
+    assert [text for _, text in cache.entries] == ["echo a", "echo c"]
+    assert cache.size == 12
+
+
+def test_large_texts_are_not_kept():
+    cache = ParseCache(max_entry=4)
+    cache.get("echo a", parse)
+    assert cache.stats()["entries"] == 0
+
+
+def test_errors_are_not_cached():
+    cache = ParseCache()
+    for _ in range(2):
+        with pytest.raises(Exception):
+            cache.get("echo $(", parse)
+    assert cache.stats()["entries"] == 0
+
+
+@pytest.mark.parametrize("engine", ("parsy", "fast"))
+def test_eval(engine):
+    env = make_env()
+    cmd = parse_cached("x=1; eval echo '$x' ; eval 'y=$x$x'", engine=engine)
+    assert cmd.evaluate(env) == "1"
+    assert env["y"] == "11"
+
+
+def test_engines_kept_apart():
+    """ Each engine gets its own tree back, not the one the other made of the same text """
+    PARSE_CACHE.clear()
+    text = "f() { echo $1; }"
+    fast = parse_cached(text, engine="fast")
+    parsy = parse_cached(text, engine="parsy")
+    assert fast is not parsy
+    assert parse_cached(text, engine="fast") is fast
+    assert parse_cached(text, engine="parsy") is parsy
+    assert PARSE_CACHE.stats() == {"hits": 2, "misses": 2, "entries": 2, "size": 2 * len(text)}
+
+
+def test_eval_in_a_loop_parses_once():
+    env = make_env()
+    env["x"] = ""
+    cmd = parse("for i in a b c d; do eval 'x=$x$i'; done")
+    PARSE_CACHE.clear()
+    cmd.execute(env)
+    assert env["x"] == "abcd"
+    assert PARSE_CACHE.hits == 3
+    assert PARSE_CACHE.misses == 1
@@ -1,8 +1,11 @@
+import pickle
+
 import parsy
 import pytest
 
 from psh.parser import expr
 from psh.local import make_env
+from psh.arith import Compiler
 
 
 @pytest.mark.parametrize(
@@ -12,7 +15,7 @@ from psh.local import make_env
         ("((b))", 2),
         ("(( ( ( cd ) ) ))", 3),
         ("a * b * cd", 6),
-        ("cd * cd / b", 4.5),
+        ("cd * cd / b", 4),
         ("(8 * 8) / 8 / 8", 1),
         ("5-4-3", -2),
     ), ids=lambda x: x.replace(" ", "_") if isinstance(x, str) else None)
@@ -23,3 +26,56 @@ def test_expr(text, expected):
                 "cd": 3})
 
     assert expr.parse(text)(env) == expected
+
+
+@pytest.mark.parametrize(
+    ("text", "expected"),
+    (
+        ("big * big", 10 ** 40),
+        ("big + 1 - big", 1),
+        ("8 / 2", 4),
+        ("7 / 2", 3),
+        ("-7 / 2", -3),
+        ("7 / -2", -3),
+        ("-7 / -2", 3),
+        ("-7 / 2 * 2 + -7 % 2", -7),
+        ("7.0 / 2", 3.5),
+        ("f / 2", 1.25),
+        ("1.5 * 2", 3.0),
+        ("unset + 1", 1),
+        ("empty * 3", 0),
+        ("f * 2", 5.0),
+    ), ids=lambda x: x.replace(" ", "_") if isinstance(x, str) else None)
+def test_integers(text, expected):
+    env = make_env()
+    env.update({"big": str(10 ** 20), "empty": "", "f": "2.5"})
+
+    value = expr.parse(text)(env)
+    assert value == expected
+    assert type(value) is type(expected)
+
+
+@pytest.mark.parametrize(
+    ("text", "expected"),
+    (
+        ("2 * 3 + x", "(6 + v0)"),
+        ("x + 2 * 3", "(v0 + 6)"),
+        ("(1 + 1) * (x - y) / 4", "divide((2 * (v0 - v1)), 4)"),
+        ("x * x", "(v0 * v0)"),
+        ("1 / 0", "divide(1, 0)"),
+        ("6 / 4", "1"),
+        ("6 / 4.0", "1.5"),
+    ), ids=lambda x: x.replace(" ", "_") if isinstance(x, str) else None)
+def test_compiled(text, expected):
+    source = Compiler().function(expr.parse(text))
+    assert source.splitlines()[-1] == "    return " + expected
+
+
+def test_compiled_once():
+    env = make_env()
+    e = expr.parse("x + 1")
+    for i in range(3):
+        env["x"] = e(env)
+    assert env["x"] == 3
+    assert pickle.loads(pickle.dumps(e)) == e
+    assert not hasattr(pickle.loads(pickle.dumps(e)), "_code")
@@ -1,7 +1,9 @@
 import pytest
 
-from psh.parser import command, command_sequence, ParseError
-from psh.model import (Word, ConstantString, Command, VarRef, Id, Token,
+import pickle
+
+from psh.parser import command, command_sequence, parse, ParseError
+from psh.model import (Word, ConstantString, SourceString, Command, VarRef, Id, Token,
                        CommandSequence, CommandPipe, While, If,
                        RedirectFrom, RedirectTo, RedirectDup, RedirectHere)
 
@@ -41,6 +43,23 @@ devnull = w("/dev/null")
                          ], double_quoted=True)))),
         ("cat <<'EOF'\nhello $world\nEOF", cat().with_redirect(
             RedirectHere(end="EOF", quote="'", content=ConstantString("hello $world\n")))),
+        ("cat <<'EOF'\none\n\nEOFx\nEOF\n", cat().with_redirect(
+            RedirectHere(end="EOF", quote="'", content=ConstantString("one\n\nEOFx\n")))),
+        ("cat <<EOF\n\"$a\" costs $5 \\$\nEOF\n", cat().with_redirect(
+            RedirectHere(end="EOF",
+                         content=Word([
+                             ConstantString('"'),
+                             VarRef(ConstantString("a"), double_quoted=True),
+                             ConstantString('" costs '),
+                             VarRef(ConstantString("5"), double_quoted=True),
+                             ConstantString(" "),
+                             ConstantString("$"),
+                             ConstantString("\n"),
+                         ], double_quoted=True)))),
+        ("cat <<EOF\ncosts $\nEOF\n", cat().with_redirect(
+            RedirectHere(end="EOF",
+                         content=Word([ConstantString("costs "), ConstantString("$"), ConstantString("\n")],
+                                      double_quoted=True)))),
     ), ids=lambda x: x.replace(" ", "_").replace("'", "*") if isinstance(x, str) else None)
 def test_basic(text, expected):
     cmd = command_sequence.parse(text)
@@ -83,3 +102,19 @@ def test_if():
         cmd = command_sequence.parse(i)
         assert cmd == o
         assert cmd.redirects == o.redirects
+
+
+def test_heredoc_same_across_engines():
+    text = "cat <<'A'; cat <<B\n" + "line $x\n" * 1000 + "A\n" + "$y\\z\n" * 1000 + "B\n"
+    tree = parse(text, engine="fast")
+    assert tree == parse(text, engine="parsy")
+    assert str(tree[0].redirects[0].file) == "line $x\n" * 1000
+    assert len(tree[1].redirects[0].file) == 3000
+
+
+def test_heredoc_shares_source():
+    text = "cat <<'EOF'\n" + "certificate\n" * 1000 + "EOF\n"
+    hd = parse(text, engine="fast")[0].redirects[0]
+    assert isinstance(hd.file, SourceString)
+    assert hd.file._source is text
+    assert pickle.loads(pickle.dumps(hd.file)) == ConstantString("certificate\n" * 1000)
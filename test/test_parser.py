@@ -1,6 +1,7 @@
 import parsy
 import pytest
 
+import psh.parser
 from psh.parser import command, command_sequence
 from psh.model import Word, ConstantString, Assignment, Command, VarRef, Id, Token, CommandSequence, CommandPipe, While, If
 from psh.local import make_env
@@ -26,6 +27,7 @@ from psh.local import make_env
         ("a=2 echo b=1", Command([Word([Id("echo")]),
                                   Word([Id("b"), Token("="), ConstantString("1")])]).
          with_assignment(Assignment("a", Word([ConstantString("2")])))),
+        ("a+=2", Command([]).with_assignment(Assignment("a", Word([ConstantString("2")]), append=True))),
 
 ))
 def test_basic(text, expected):
@@ -173,3 +175,27 @@ def test_not_yet():
 def test_while():
     with pytest.raises(parsy.ParseError):
         assert command.parse("while") is None
+
+
+@pytest.mark.parametrize(("grammar", "text", "expected"), (
+        ("assignment", "a=b", Assignment("a", Word([Id("b")]))),
+        ("word_expr", "$(a)", CommandSequence([Command([Word([Id("a")])])])),
+        ("word", "a$x", Word([Id("a"), VarRef(ConstantString("x"))])),
+))
+def test_any_grammar(grammar, text, expected):
+    """ Any part of the grammar can start a parse of its own """
+    assert getattr(psh.parser, grammar).parse(text) == expected
+
+
+def test_engine_errors(monkeypatch):
+    """ Only an unknown engine is reported as one """
+    with pytest.raises(ValueError):
+        psh.parser.parse("a", engine="none")
+
+    def fail(text):
+        raise KeyError(text)
+    monkeypatch.setitem(psh.parser.ENGINES, "parsy", fail)
+    with pytest.raises(KeyError):
+        psh.parser.parse("a")
+    with pytest.raises(KeyError):
+        psh.parser.parse_cached("a b c d")
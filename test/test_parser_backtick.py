@@ -1,9 +1,10 @@
 import parsy
 import pytest
 
-from psh.parser import command, command_sequence, backtick
+from psh.parser import command, command_sequence, backtick, parse, ParseError
 from psh.model import Word, ConstantString, Assignment, Command, VarRef, Id, Token, CommandSequence, CommandPipe, While, If
 from psh.local import make_env
+from psh.fastparse import Lexer, backquote_end
 
 
 foo = Word([ConstantString("foo")])
@@ -24,3 +25,53 @@ def test_backtick(text, expected):
 
 def test_basic():
     backtick.parse("``")
+
+
+def escape(text):
+    return text.replace("\\", "\\\\").replace("`", "\\`").replace("$", "\\$")
+
+
+@pytest.mark.parametrize("engine", ("parsy", "fast"))
+@pytest.mark.parametrize("inner", (
+        "foo",
+        "echo $a ${b#x} \"$c d\" 'e $f' g\\ h",
+        'echo "a \\" \\\\ `echo b` c"',
+        "echo `echo \\`echo deep\\``",
+        "cat <<EOF\nhello $x\nEOF\n",
+        "a \\\n b; c | d",
+        "for i in a b; do echo $i; done",
+))
+def test_same_as_dollar_paren(inner, engine):
+    assert parse("echo `" + escape(inner) + "`", engine=engine) == parse("echo $(" + inner + ")", engine=engine)
+
+
+@pytest.mark.parametrize("depth", (1, 2, 3, 5))
+def test_nested(depth):
+    text = inner = "echo \"$x\" '\\y' \\$z"
+    for _ in range(depth):
+        text = "echo `" + escape(text) + "`"
+        inner = "echo $(" + inner + ")"
+    assert command_sequence.parse(text) == command_sequence.parse(inner)
+
+
+@pytest.mark.parametrize("text", (
+        "echo `foo",
+        "echo `echo \\`foo`",
+        "echo `foo \\\\`",
+))
+def test_unterminated(text):
+    with pytest.raises(ParseError):
+        command_sequence.parse(text)
+
+
+@pytest.mark.parametrize(("text", "expected"), (
+        ("\\`\\", None),
+        ("\\\\`\\", 2),
+        ("a\\`b`", 4),
+))
+def test_scan_stops_at_start(text, expected):
+    """ Backslashes are counted back only as far as where the scan began, not round to the end of the text """
+    assert backquote_end(text, 0, len(text)) == expected
+    lexer = Lexer(text)
+    i = lexer.closing_tick(0)
+    assert (None if i is None else lexer.ticks[i]) == expected
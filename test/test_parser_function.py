@@ -1,7 +1,10 @@
+import pickle
+
 import pytest
 
-from psh.parser import command_sequence
+from psh.parser import command_sequence, parse
 from psh.model import Word, ConstantString, Command, VarRef, Id, Token, CommandSequence, Function
+from psh import fastparse
 
 
 @pytest.mark.parametrize(("text", "expected"), (
@@ -13,3 +16,53 @@ from psh.model import Word, ConstantString, Command, VarRef, Id, Token, CommandS
 def test_basic(text, expected):
     cmd = command_sequence.parse(text)
     assert cmd == expected
+
+
+def eager_body(text):
+    p = fastparse.Parser(text)
+    p.regex(fastparse.WORD_ID)
+    p.ws()
+    p.expect("()")
+    return p.command_brackets()
+
+
+@pytest.mark.parametrize("engine", ("parsy", "fast"))
+@pytest.mark.parametrize("text", (
+        "f() { echo }",
+        "f() { echo a; echo b; }\nf",
+        "f() { echo \"}\" '}' \\} ${x%%\\}} $(echo '}') `echo \"}\"`; }",
+        "f() { g() { echo \\{; }; }",
+        "f() { cat <<EOF\n}\nEOF\n}",
+        "f() { cat <<'EOF'\n$x }\nEOF\n}",
+        "f() { }",
+))
+def test_lazy_body(text, engine):
+    """ A skipped body is parsed when first asked for, to what an eager parse gives """
+    f = parse(text, engine=engine)[0]
+    assert f._body is None
+    assert f.body == eager_body(text)
+    assert f._body is not None
+
+
+@pytest.mark.parametrize("engine", ("parsy", "fast"))
+@pytest.mark.parametrize("text", (
+        "cat <<EOF; f() { echo; }\nhere\nEOF\n",
+        "f() { echo; ",
+        "f() { cat <<EOF\n}\n",
+))
+def test_not_skipped(text, engine):
+    """ Bodies the skip-scan can't be sure of are parsed (or rejected) eagerly """
+    try:
+        cmd = parse(text, engine=engine)
+    except fastparse.ParseError:
+        return
+    f = [c for c in cmd if isinstance(c, Function)][0]
+    assert f._body is not None
+
+
+@pytest.mark.parametrize("engine", ("parsy", "fast"))
+def test_pickle(engine):
+    f = parse("f() { echo $1; }", engine=engine)[0]
+    g = pickle.loads(pickle.dumps(f))
+    assert g._body is None
+    assert g == f
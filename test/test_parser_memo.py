@@ -0,0 +1,39 @@
+from parsy import string, regex, generate
+from parsy_extn import keeps_notes
+
+from psh.parser import memo, dispatch, command_sequence, command_while
+from psh.model import Word, Id, Command, CommandSequence, RedirectHere, RedirectFrom, RedirectTo, ConstantString
+
+
+def test_memo_parses_once_per_position():
+    calls = []
+
+    @generate
+    def counted():
+        calls.append(1)
+        return (yield regex("[a-z]+"))
+
+    p = memo(counted)
+    # The memo table is kept alongside the notes, so the parse must start somewhere that keeps them.
+    assert keeps_notes(p << string("!") | p << string("?")).parse("abc?") == "abc"
+    assert len(calls) == 1
+
+
+def test_dispatch_keeps_order():
+    p = dispatch(("[a-z]", string("ab").result("first")), ("[a-z]", regex("[a-z]+")), (None, string("")))
+    assert p.parse("ab") == "first"
+    assert p.parse("xyz") == "xyz"
+    assert p.parse("") == ""
+
+
+def test_memo_replays_heredocs():
+    # The leading redirect is parsed as part of a while-loop first, and then as
+    # part of a simple command; the heredoc must still get its body.
+    cmd = command_sequence.parse("<<EOF cat\nhello\nEOF\n")
+    hd = RedirectHere(end="EOF", content=Word([ConstantString("hello\n")], double_quoted=True))
+    assert cmd == CommandSequence([Command([Word([Id("cat")])]).with_redirect(hd)])
+
+
+def test_block_commands_keep_leading_redirects():
+    cmd = command_while.parse("<x while a; do b; done >y")
+    assert cmd.redirects == [RedirectFrom(0, Word([Id("x")])), RedirectTo(1, Word([Id("y")]))]
@@ -0,0 +1,17 @@
+import concurrent.futures
+
+import pytest
+
+from psh.parser import parse
+
+from .test_stream import SCRIPT
+
+
+@pytest.mark.parametrize("engine", ("parsy", "fast"))
+def test_concurrent_parses(engine):
+    """ Parses running at the same time, with heredocs pending in each, don't see each other's notes """
+    texts = [SCRIPT.replace("hello", "hello{}".format(i)).replace("EOF", "E{}".format(i)) for i in range(32)]
+    expected = [parse(text, engine=engine) for text in texts]
+    with concurrent.futures.ThreadPoolExecutor(8) as pool:
+        for _ in range(4):
+            assert list(pool.map(lambda text: parse(text, engine=engine), texts)) == expected
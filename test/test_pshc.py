@@ -0,0 +1,85 @@
+import os
+import pickle
+import zlib
+
+import pytest
+
+from psh import pshc
+from psh.parser import command_sequence
+from psh.model import If
+
+
+SCRIPT = """\
+if [ $# = 1 ]; then
+    echo "hello $1" $((1 + 2 * 3))
+else
+    echo **/*.py
+fi
+"""
+
+
+@pytest.fixture
+def script(tmp_path):
+    path = tmp_path / "script.sh"
+    path.write_text(SCRIPT)
+    return str(path)
+
+
+def test_round_trip():
+    tree = command_sequence.parse(SCRIPT)
+    digest = pshc.source_hash(SCRIPT.encode())
+    copy = pshc.loads(pshc.dumps(tree, digest), digest)
+    assert copy == tree
+    assert list(copy[0])[-1][0] is If.OTHERWISE
+
+
+def test_load_writes_cache(script):
+    tree = pshc.load(script)
+    assert tree == command_sequence.parse(SCRIPT)
+    with open(pshc.cache_path(script), "rb") as f:
+        data = f.read()
+    assert data.startswith(pshc.MAGIC)
+    assert pshc.load(script) == tree
+
+
+def test_stale_source(script):
+    pshc.load(script)
+    with open(script, "w") as f:
+        f.write("echo changed\n")
+    assert pshc.load(script) == command_sequence.parse("echo changed\n")
+
+
+@pytest.mark.parametrize("data", (b"", b"PSHC", b"PSHC\x01\x05junk!" + b"\0" * 40, b"not a cache file"))
+def test_bad_cache(script, data):
+    os.makedirs(os.path.dirname(pshc.cache_path(script)))
+    with open(pshc.cache_path(script), "wb") as f:
+        f.write(data)
+    assert pshc.load(script) == command_sequence.parse(SCRIPT)
+
+
+def test_version_mismatch(script, monkeypatch):
+    pshc.load(script)
+    monkeypatch.setattr(pshc, "VERSION", b"0.0.0-other")
+    with open(pshc.cache_path(script), "rb") as f:
+        with pytest.raises(pshc.StaleCache):
+            pshc.loads(f.read(), pshc.source_hash(SCRIPT.encode()))
+
+
+def test_version_includes_sources():
+    assert pshc.VERSION.startswith(pshc.__version__.encode() + b"+")
+    assert pshc.VERSION.endswith(pshc.sources_hash().encode())
+
+
+@pytest.mark.parametrize("tree", (
+    b"junk",                                                        # not a pickle at all
+    pickle.dumps(If.OTHERWISE).replace(b"OTHERWISE", b"OTHERWIZE"),  # a name the model no longer has
+))
+def test_unreadable_tree(script, tree):
+    digest = pshc.source_hash(SCRIPT.encode())
+    header = pshc.MAGIC + bytes([pshc.FORMAT, len(pshc.VERSION)]) + pshc.VERSION + digest
+    with pytest.raises(pshc.StaleCache):
+        pshc.loads(header + zlib.compress(tree), digest)
+    os.makedirs(os.path.dirname(pshc.cache_path(script)))
+    with open(pshc.cache_path(script), "wb") as f:
+        f.write(header + zlib.compress(tree))
+    assert pshc.load(script) == command_sequence.parse(SCRIPT)
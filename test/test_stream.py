@@ -0,0 +1,80 @@
+import io
+
+import pytest
+
+from psh.parser import command_sequence, ParseError
+from psh.stream import Source, statements, run
+from psh.local import make_env
+
+
+SCRIPT = """\
+echo one; echo two
+cat <<EOF; cat <<'END'
+hello $x
+EOF
+$literal
+END
+while a
+do
+    b | c
+done
+
+if a; then
+    x='multi
+line'
+fi
+echo done \\
+  continued
+"""
+
+
+def stream(text, chunk):
+    return list(statements(Source(io.BytesIO(text.encode())), chunk=chunk))
+
+
+@pytest.mark.parametrize("chunk", (1, 2, 7, 64, 1 << 16))
+@pytest.mark.parametrize("text", (
+        SCRIPT,
+        SCRIPT.rstrip("\n"),
+        "",
+        "\n\n",
+        "echo x",
+        "cat <<EOF\n" + "line\n" * 100 + "EOF",
+))
+def test_same_commands(text, chunk):
+    assert stream(text, chunk) == list(command_sequence.parse(text))
+
+
+def test_mmap(tmp_path):
+    path = tmp_path / "script.sh"
+    path.write_text(SCRIPT)
+    with open(str(path), "rb") as f:
+        source = Source(f)
+        assert source.map is not None
+        assert list(statements(source, chunk=16)) == list(command_sequence.parse(SCRIPT))
+        source.close()
+
+
+@pytest.mark.parametrize(("text", "line"), (
+        ("echo a\necho b\na & b\n", "2:2"),
+        ("echo a\ncat <<EOF\nnever ends\n", "3:0"),
+        ("echo a\nif x; then\n", "2:0"),
+))
+def test_errors(text, line):
+    with pytest.raises(ParseError) as e:
+        stream(text, 4)
+    assert e.value.line_info() == line
+
+
+def test_lazy():
+    """ Commands before a parse error are produced before it is found """
+    cmds = statements(Source(io.BytesIO(b"echo a\necho b\n" + b"echo c\n" * 1000 + b"a & b\n")), chunk=4)
+    assert next(cmds) == command_sequence.parse("echo a")[0]
+    assert next(cmds) == command_sequence.parse("echo b")[0]
+
+
+def test_run():
+    env = make_env()
+    out = io.BytesIO()
+    assert run(io.BytesIO(b"x=1\necho $x\ncat <<EOF\nhere $x\nEOF\n"), env, output=out) == 0
+    assert out.getvalue() == b"1\nhere 1\n"
@@ -0,0 +1,112 @@
+import pytest
+
+from psh.fastparse import parse
+from psh.parser import ParseError
+from psh.validate import Checker, Background, common_prefix
+from psh.cmd import main
+
+from .test_stream import SCRIPT
+
+
+def valid(text):
+    try:
+        parse(text, eager=True)
+        return True
+    except ParseError:
+        return False
+
+
+@pytest.mark.parametrize(("a", "b", "n"), (
+        ("", "", 0),
+        ("abc", "abc", 3),
+        ("abc", "abd", 2),
+        ("abc", "ab", 2),
+        ("x" * 1000 + "a", "x" * 1000 + "b", 1000),
+        ("a", "b", 0),
+))
+def test_common_prefix(a, b, n):
+    assert common_prefix(a, b) == n
+
+
+EDITS = (
+    SCRIPT,
+    SCRIPT + "if x; then\n",
+    SCRIPT + "if x; then\n  y\n",
+    SCRIPT + "if x; then\n  y\nfi\n",
+    SCRIPT.replace("done\n", "dome\n"),
+    SCRIPT,
+    SCRIPT.replace("EOF\n$literal", "EOX\n$literal"),
+    SCRIPT,
+    SCRIPT + "cat <<EOF\n",
+    SCRIPT + "cat <<EOF\nbody\nEOF\n",
+    "",
+    "echo 'unterminated\n",
+    "echo 'unterminated\n'\n",
+    "f() { if true; then echo; }\n",
+    "f() { if true; then echo; fi; }\n",
+)
+
+
+def test_edits():
+    """ A sequence of edits is judged as a full parse of each would judge it """
+    checker = Checker()
+    for text in EDITS:
+        assert (checker.check(text) is None) == valid(text), text
+
+
+def test_resumes():
+    """ An edit at the end only parses the lines after the last statement boundary """
+    checker = Checker()
+    assert checker.check(SCRIPT) is None
+    bounds = list(checker.bounds)
+    assert len(bounds) > 5
+
+    e = checker.check(SCRIPT + "a & b\n")
+    assert e is not None and e.index == len(SCRIPT) + 2
+    assert checker.bounds == bounds
+
+    assert checker.check(SCRIPT) is None
+    assert checker.bounds == bounds
+
+
+def test_background():
+    b = Background(delay=0)
+    b.update("echo 'x")
+    b.timer.join()
+    assert b.checker.text == "echo 'x"
+    assert b.check("echo 'x") is not None
+    assert b.check("echo 'x'") is None
+    b.cancel()
+
+
+def test_check(tmp_path, capsys):
+    (tmp_path / "sub").mkdir()
+    for i in range(20):
+        (tmp_path / "sub" / "ok{}.sh".format(i)).write_text(SCRIPT)
+    (tmp_path / "bad.sh").write_text("echo a\nif x; then\n")
+    (tmp_path / "function.sh").write_text("f() { if true; then echo; }\n")
+    (tmp_path / "notes.txt").write_text("if")
+    assert main(["--check", "-j", "2", str(tmp_path)]) == 1
+    out, err = capsys.readouterr()
+    assert sorted(out.splitlines()) == ["{}: expected 'fi' at 2:0".format(tmp_path / "bad.sh"),
+                                        "{}: expected one of 'eos', 'fi' at 0:26".format(tmp_path / "function.sh")]
+    assert err.startswith("22 files, 2 with errors")
+
+    assert main(["--check", "-j", "1", str(tmp_path / "sub" / "ok0.sh")]) == 0
+
+
+def test_check_failures(tmp_path, capsys):
+    """ A script the parser fails on, other than by a syntax error, is reported with the rest """
+    (tmp_path / "deep.sh").write_text("echo " + "$(" * 5000 + "x" + ")" * 5000 + "\n")
+    (tmp_path / "ok.sh").write_text(SCRIPT)
+    assert main(["--check", "-j", "1", str(tmp_path)]) == 1
+    out, err = capsys.readouterr()
+    assert out.startswith("{}: RecursionError: ".format(tmp_path / "deep.sh"))
+    assert err.startswith("2 files, 1 with errors")
+
+
+def test_check_needs_paths(capsys):
+    with pytest.raises(SystemExit) as e:
+        main(["--check"])
+    assert e.value.code == 2
+    assert "--check needs at least one script or directory" in capsys.readouterr().err